@@ -1,2 +1,3 @@
 # import the necessary packages
 from .client import FirebaseClient
+from .async_client import AsyncFirebaseClient
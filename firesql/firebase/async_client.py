@@ -0,0 +1,163 @@
+# pip install firebase-admin (>= 6.0 for firestore_async)
+#
+# AsyncFirebaseClient connects with the asyncio Firestore client: the methods reading
+# and writing documents are coroutines, so many queries can share one event loop
+# without blocking it.
+#
+import asyncio
+
+from .client import FirebaseClient
+
+
+class AsyncFirebaseClient(FirebaseClient):
+
+  def firestore_client(self, app):
+    from firebase_admin import firestore_async
+    return firestore_async.client(app=app)
+
+
+  async def get_collection_documents(self, collection_ref, exclude=[], fields=None):
+    results = {}
+    async for doc in self.select_fields(collection_ref, fields).stream():
+      if doc.id not in exclude: results[doc.id] = doc.to_dict() or {}
+    return results
+
+
+  async def stream_collection_partitions(self, collection_ref, partition_count, max_workers, fields=None):
+    # stream the (doc id, document) of the whole collection, read as `partition_count` document id
+    # key ranges by `max_workers` tasks. The documents of the partitions are interleaved
+    documents = asyncio.Queue(maxsize=self.SCAN_QUEUE_SIZE)
+    semaphore = asyncio.Semaphore(max_workers)
+
+    async def _read_partition(query_ref):
+      # a partition ends with (None, None), or (None, error)
+      try:
+        async with semaphore:
+          async for doc in query_ref.stream():
+            await documents.put((doc.id, doc.to_dict() or {}))
+        await documents.put((None, None))
+      except Exception as e:
+        await documents.put((None, e))
+
+    queries = self.partition_queries(collection_ref, partition_count, fields=fields)
+    tasks = [asyncio.ensure_future(_read_partition(query_ref)) for query_ref in queries]
+    try:
+      remaining = len(tasks)
+      while remaining:
+        (doc_id, doc) = await documents.get()
+        if doc_id is None:
+          remaining -= 1
+          if doc is not None:
+            raise doc
+        else:
+          yield doc_id, doc
+    finally:
+      # consumer stopped early, wait for the cancelled readers
+      for task in tasks:
+        task.cancel()
+      await asyncio.gather(*tasks, return_exceptions=True)
+
+
+  async def get_document(self, collection_ref, document_id, fields=None):
+    doc_ref = self.get_document_ref(collection_ref, document_id)
+    if (doc_ref):
+      return (await doc_ref.get(field_paths=fields)).to_dict()
+    else:
+      return {}
+
+
+  async def get_documents(self, collection_ref, document_ids, fields=None):
+    # batched get of the documents by id: the ids are chunked into batched get RPCs,
+    # awaited concurrently. The ids of missing documents are left out of the results
+    document_ids = list(dict.fromkeys(document_ids))
+    refs = [self.get_document_ref(collection_ref, document_id) for document_id in document_ids]
+    batches = [refs[i:i + self.GET_ALL_BATCH_SIZE] for i in range(0, len(refs), self.GET_ALL_BATCH_SIZE)]
+
+    async def _get_batch(batch):
+      return [(doc.id, doc.to_dict() or {}) async for doc in self.db.get_all(batch, field_paths=fields) if doc.exists]
+
+    results = {}
+    for documents in await asyncio.gather(*[_get_batch(batch) for batch in batches]):
+      results.update(documents)
+    # in the requested order
+    return {document_id: results[document_id] for document_id in document_ids if document_id in results}
+
+
+  async def set_document(self, collection_ref, document_id, document):
+    doc_ref = self.get_document_ref(collection_ref, document_id)
+    await doc_ref.set(document)
+    return doc_ref
+
+
+  async def update_document(self, collection_ref, document_id, document):
+    doc_ref = self.get_document_ref(collection_ref, document_id)
+    await doc_ref.set(document, merge=True)
+    return doc_ref
+
+
+  async def delete_document(self, collection_ref, document_id):
+    doc_ref = self.get_document_ref(collection_ref, document_id)
+    if (doc_ref):
+      await doc_ref.delete()
+
+
+  async def query_document_by_where_tuples(self, collection_ref, whereTuples, fields=None):
+    # whereTuples is [(key, operator, value), ...]
+    # if key is 'docid', do special document id processing
+    # fields is the field mask of the returned documents, [] returns only the document ids
+    results = {}
+    for whereTuple in whereTuples:
+      (key, operator, value) = whereTuple
+      if key == 'docid':
+        if operator == '==':
+          doc = await self.get_document(collection_ref, value, fields=fields)
+          if doc is not None:
+            results[value] = doc
+        elif operator == 'in':
+          if isinstance(value, list):
+            results.update(await self.get_documents(collection_ref, value, fields=fields))
+        elif operator == '!=':
+          results.update(await self.get_collection_documents(collection_ref, exclude=[value], fields=fields))
+        return results
+
+    # otherwise, preform the where queries
+    async for (doc_id, doc) in self.stream_document_by_where_tuples(collection_ref, whereTuples, fields=fields):
+      results[doc_id] = doc
+    return results
+
+
+  async def stream_document_by_where_tuples(self, collection_ref, whereTuples, fields=None, order_by=None, limit=None):
+    # stream the (doc id, document) of the where queries, without the 'docid' processing
+    # order_by is [(key, 'asc'|'desc'), ...], limit is the maximum number of documents
+    query_ref = self.where_query(collection_ref, whereTuples)
+    for (key, direction) in (order_by or []):
+      query_ref = query_ref.order_by(key, direction='DESCENDING' if direction == 'desc' else 'ASCENDING')
+    if limit is not None:
+      query_ref = query_ref.limit(limit)
+    async for doc in self.select_fields(query_ref, fields).stream():
+      yield doc.id, doc.to_dict() or {}
+
+
+  async def aggregate_by_where_tuples(self, collection_ref, whereTuples, aggregations):
+    # aggregations is [(function, key), ...] of 'count' (key '*'), 'sum' or 'avg'
+    # computed by Firestore aggregation queries, at most 5 aggregations per query
+    query_ref = self.where_query(collection_ref, whereTuples)
+    results = []
+    for start in range(0, len(aggregations), 5):
+      chunk = aggregations[start:start + 5]
+      aggregation_ref = query_ref
+      for (i, (function, key)) in enumerate(chunk):
+        alias = 'a{}'.format(i)
+        if function == 'count':
+          aggregation_ref = aggregation_ref.count(alias=alias)
+        elif function == 'sum':
+          aggregation_ref = aggregation_ref.sum(key, alias=alias)
+        elif function == 'avg':
+          aggregation_ref = aggregation_ref.avg(key, alias=alias)
+        else:
+          raise Exception(f"unsupported Firestore aggregation '{function}'")
+      values = {}
+      for result in (await aggregation_ref.get())[0]:
+        values[result.alias] = result.value
+      results += [values.get('a{}'.format(i)) for i in range(len(chunk))]
+    return results
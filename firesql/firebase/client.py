@@ -2,39 +2,51 @@
 # pip install google-cloud-firestore
 # generate a project private key JSON file
 #
-import firebase_admin
-from firebase_admin import credentials
-from firebase_admin import firestore
-from firebase_admin import auth
-from firebase_admin import storage
+# The Firebase Admin SDK and the google.cloud.firestore_v1 types are imported
+# lazily, only when a connection is made or a query is executed, so that
+# importing firesql does not pull in the Google stack.
+#
 import datetime
 import re
 import json
 import os
 import importlib
-
-from google.cloud.firestore_v1.collection import CollectionReference
-from google.cloud.firestore_v1.document import DocumentReference
-from google.cloud.firestore_v1.base_document import DocumentSnapshot
-from google.cloud.firestore_v1.types.document import Value
-from google.cloud.firestore_v1.types import (
-    Cursor, 
-    RunQueryResponse
-)
-from google.cloud.firestore_v1.types.query import (
-    StructuredAggregationQuery,
-    StructuredQuery
-)
-from google.cloud.firestore_v1.base_query import FieldFilter
-from google.cloud.firestore_v1 import field_path as field_path_module
-
-Aggregation = StructuredAggregationQuery.Aggregation
-CollectionSelector = StructuredQuery.CollectionSelector
-Count = Aggregation.Count
-FieldPath = field_path_module.FieldPath  # see https://github.com/search?q=FieldPath.documentId%28%29&type=code for examples on using FieldPath
-FieldReference = StructuredQuery.FieldReference
-Filter = StructuredQuery.Filter
-Operator = StructuredQuery.FieldFilter.Operator
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# lazily resolved Firestore types, name -> (module, attribute path)
+_FIRESTORE_TYPES = {
+  'CollectionReference': ('google.cloud.firestore_v1.collection', 'CollectionReference'),
+  'DocumentReference': ('google.cloud.firestore_v1.document', 'DocumentReference'),
+  'DocumentSnapshot': ('google.cloud.firestore_v1.base_document', 'DocumentSnapshot'),
+  'Value': ('google.cloud.firestore_v1.types.document', 'Value'),
+  'Cursor': ('google.cloud.firestore_v1.types', 'Cursor'),
+  'RunQueryResponse': ('google.cloud.firestore_v1.types', 'RunQueryResponse'),
+  'StructuredAggregationQuery': ('google.cloud.firestore_v1.types.query', 'StructuredAggregationQuery'),
+  'StructuredQuery': ('google.cloud.firestore_v1.types.query', 'StructuredQuery'),
+  'FieldFilter': ('google.cloud.firestore_v1.base_query', 'FieldFilter'),
+  'field_path_module': ('google.cloud.firestore_v1', 'field_path'),
+  'Aggregation': ('google.cloud.firestore_v1.types.query', 'StructuredAggregationQuery.Aggregation'),
+  'CollectionSelector': ('google.cloud.firestore_v1.types.query', 'StructuredQuery.CollectionSelector'),
+  'Count': ('google.cloud.firestore_v1.types.query', 'StructuredAggregationQuery.Aggregation.Count'),
+  'FieldPath': ('google.cloud.firestore_v1.field_path', 'FieldPath'),  # see https://github.com/search?q=FieldPath.documentId%28%29&type=code for examples on using FieldPath
+  'FieldReference': ('google.cloud.firestore_v1.types.query', 'StructuredQuery.FieldReference'),
+  'Filter': ('google.cloud.firestore_v1.types.query', 'StructuredQuery.Filter'),
+  'Operator': ('google.cloud.firestore_v1.types.query', 'StructuredQuery.FieldFilter.Operator'),
+}
+
+
+def __getattr__(name):
+  # module level attributes for the Firestore types, resolved on first access
+  if name in _FIRESTORE_TYPES:
+    moduleName, attributePath = _FIRESTORE_TYPES[name]
+    value = importlib.import_module(moduleName)
+    for attribute in attributePath.split('.'):
+      value = getattr(value, attribute)
+    globals()[name] = value
+    return value
+  raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 class FirebaseClient:
@@ -89,22 +101,32 @@ class FirebaseClient:
 
 
   def connect(self, credentials_json, name='', config=None):
+    import firebase_admin
+    from firebase_admin import credentials
+    from firebase_admin import auth
+    from firebase_admin import storage
+
     cred = credentials.Certificate(credentials_json)
 
     if name == '':
       firebase_admin.initialize_app(cred, config)
-      self.db = firestore.client(app=firebase_admin.get_app())
+      self.db = self.firestore_client(firebase_admin.get_app())
       self.auth = auth.Client(app=firebase_admin.get_app())
     else:
       # for multiple initialization with a different app name
       firebase_admin.initialize_app(cred, config, name=name)
-      self.db = firestore.client(app=firebase_admin.get_app(name=name))
+      self.db = self.firestore_client(firebase_admin.get_app(name=name))
       self.auth = auth.Client(app=firebase_admin.get_app(name=name))
 
     if config:
       self.bucket = storage.bucket(config['storageBucket'])
 
 
+  def firestore_client(self, app):
+    from firebase_admin import firestore
+    return firestore.client(app=app)
+
+
   def get_user_by_email(self, email):
     user = self.auth.get_user_by_email(email.lower())
     return user
@@ -130,13 +152,99 @@ class FirebaseClient:
     return collection_ref.document(document_id)
 
 
-  def get_collection_documents(self, collection_ref, exclude=[]):
+  def select_fields(self, query_ref, fields=None):
+    # field mask of the returned documents, an empty mask returns only the document ids
+    if fields is None:
+      return query_ref
+    from google.cloud.firestore_v1.field_path import FieldPath
+    return query_ref.select(list(fields) if fields else [FieldPath.document_id()])
+
+
+  def get_collection_documents(self, collection_ref, exclude=[], fields=None):
     results = {}
-    for doc in collection_ref.stream():
-      if doc.id not in exclude: results[doc.id] = doc.to_dict()
+    for doc in self.select_fields(collection_ref, fields).stream():
+      if doc.id not in exclude: results[doc.id] = doc.to_dict() or {}
     return results
 
 
+  # Firestore auto-generated document ids are 20 random characters of this alphabet, in id order
+  AUTO_ID_ALPHABET = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+  # number of documents read ahead of the consumer by a parallel collection scan
+  SCAN_QUEUE_SIZE = 1000
+
+  def partition_bounds(self, partition_count):
+    # the document ids splitting the auto-generated id space into `partition_count` key ranges
+    alphabet = self.AUTO_ID_ALPHABET
+    space = len(alphabet) * len(alphabet)
+    bounds = []
+    for i in range(1, partition_count):
+      value = i * space // partition_count
+      bound = alphabet[value // len(alphabet)] + alphabet[value % len(alphabet)]
+      if not bounds or bound > bounds[-1]:
+        bounds.append(bound)
+    return bounds
+
+
+  def partition_queries(self, collection_ref, partition_count, fields=None):
+    # the queries of the document id key ranges of the collection, together they cover
+    # the whole collection whatever its document ids
+    from google.cloud.firestore_v1.base_query import FieldFilter
+    from google.cloud.firestore_v1.field_path import FieldPath
+    bounds = [None] + self.partition_bounds(partition_count) + [None]
+    queries = []
+    for (start, end) in zip(bounds[:-1], bounds[1:]):
+      query_ref = collection_ref
+      if start is not None:
+        query_ref = query_ref.where(filter=FieldFilter(FieldPath.document_id(), '>=', collection_ref.document(start)))
+      if end is not None:
+        query_ref = query_ref.where(filter=FieldFilter(FieldPath.document_id(), '<', collection_ref.document(end)))
+      queries.append(self.select_fields(query_ref, fields))
+    return queries
+
+
+  def stream_collection_partitions(self, collection_ref, partition_count, max_workers, fields=None):
+    # stream the (doc id, document) of the whole collection, read as `partition_count` document id
+    # key ranges by `max_workers` threads. The documents of the partitions are interleaved
+    documents = queue.Queue(maxsize=self.SCAN_QUEUE_SIZE)
+    stopped = threading.Event()
+
+    def _read_partition(query_ref):
+      # a partition ends with (None, None), or (None, error)
+      try:
+        for doc in query_ref.stream():
+          if stopped.is_set():
+            break
+          documents.put((doc.id, doc.to_dict() or {}))
+        documents.put((None, None))
+      except Exception as e:
+        documents.put((None, e))
+
+    queries = self.partition_queries(collection_ref, partition_count, fields=fields)
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(queries))))
+    futures = [executor.submit(_read_partition, query_ref) for query_ref in queries]
+    try:
+      remaining = len(futures)
+      while remaining:
+        (doc_id, doc) = documents.get()
+        if doc_id is None:
+          remaining -= 1
+          if doc is not None:
+            raise doc
+        else:
+          yield doc_id, doc
+    finally:
+      # consumer stopped early, let the readers finish
+      stopped.set()
+      for future in futures:
+        future.cancel()
+      executor.shutdown(wait=False)
+      while not all(future.done() for future in futures):
+        try:
+          documents.get(timeout=0.01)
+        except queue.Empty:
+          pass
+
+
   def get_recursive_document(self, collection_ref, document_id):
       doc = collection_ref.document(document_id).get()
       if doc != None:
@@ -154,14 +262,40 @@ class FirebaseClient:
         return {}
 
 
-  def get_document(self, collection_ref, document_id):
+  def get_document(self, collection_ref, document_id, fields=None):
     doc_ref = self.get_document_ref(collection_ref, document_id)
     if (doc_ref):
-      return doc_ref.get().to_dict()
+      return doc_ref.get(field_paths=fields).to_dict()
     else:
       return {}
 
 
+  # number of document ids of a batched get, and of batched gets sent at once
+  GET_ALL_BATCH_SIZE = 100
+  GET_ALL_MAX_WORKERS = 8
+
+  def get_documents(self, collection_ref, document_ids, fields=None):
+    # batched get of the documents by id: the ids are chunked into batched get RPCs,
+    # sent concurrently. The ids of missing documents are left out of the results
+    document_ids = list(dict.fromkeys(document_ids))
+    refs = [self.get_document_ref(collection_ref, document_id) for document_id in document_ids]
+    batches = [refs[i:i + self.GET_ALL_BATCH_SIZE] for i in range(0, len(refs), self.GET_ALL_BATCH_SIZE)]
+
+    def _get_batch(batch):
+      return [(doc.id, doc.to_dict() or {}) for doc in self.db.get_all(batch, field_paths=fields) if doc.exists]
+
+    results = {}
+    if len(batches) <= 1:
+      for batch in batches:
+        results.update(_get_batch(batch))
+    else:
+      with ThreadPoolExecutor(max_workers=min(len(batches), self.GET_ALL_MAX_WORKERS)) as executor:
+        for documents in executor.map(_get_batch, batches):
+          results.update(documents)
+    # in the requested order
+    return {document_id: results[document_id] for document_id in document_ids if document_id in results}
+
+
   def set_collection_documents(self, collection_ref, documents):
     # save document collections 
     for (doc_id, doc) in documents.items():
@@ -216,35 +350,76 @@ class FirebaseClient:
     return results
 
 
-  def query_document_by_where_tuples(self, collection_ref, whereTuples):
+  def query_document_by_where_tuples(self, collection_ref, whereTuples, fields=None):
     # whereTuples is [(key, operator, value), ...]
     # if key is 'docid', do special document id processing
+    # fields is the field mask of the returned documents, [] returns only the document ids
     results = {}
     for whereTuple in whereTuples:
       (key, operator, value) = whereTuple
       if key == 'docid':
         if operator == '==':
-          doc = self.get_document(collection_ref, value)
-          if doc:
+          doc = self.get_document(collection_ref, value, fields=fields)
+          if doc is not None:
             results[value] = doc
         elif operator == 'in':
           if isinstance(value, list):
-            for v in value:
-              doc = self.get_document(collection_ref, v)
-              if doc:
-                results[v] = doc
+            results.update(self.get_documents(collection_ref, value, fields=fields))
         elif operator == '!=':  # new
-          results.update(self.get_collection_documents(collection_ref, exclude=[value]))
+          results.update(self.get_collection_documents(collection_ref, exclude=[value], fields=fields))
         return results
 
     # otherwise, preform the where queries
+    for (doc_id, doc) in self.stream_document_by_where_tuples(collection_ref, whereTuples, fields=fields):
+      results[doc_id] = doc
+    return results
+
+
+  def where_query(self, collection_ref, whereTuples):
+    # the query of the where tuples, without the 'docid' processing
+    from google.cloud.firestore_v1.base_query import FieldFilter
     query_ref = collection_ref
     for whereTuple in whereTuples:
       (key, operator, value) = whereTuple
       # query_ref = query_ref.where(key, operator, value)
       query_ref = query_ref.where(filter=FieldFilter(key, operator, value)) # new
-    for doc in query_ref.stream():
-      results[doc.id] = doc.to_dict()
+    return query_ref
+
+
+  def stream_document_by_where_tuples(self, collection_ref, whereTuples, fields=None, order_by=None, limit=None):
+    # stream the (doc id, document) of the where queries, without the 'docid' processing
+    # order_by is [(key, 'asc'|'desc'), ...], limit is the maximum number of documents
+    query_ref = self.where_query(collection_ref, whereTuples)
+    for (key, direction) in (order_by or []):
+      query_ref = query_ref.order_by(key, direction='DESCENDING' if direction == 'desc' else 'ASCENDING')
+    if limit is not None:
+      query_ref = query_ref.limit(limit)
+    for doc in self.select_fields(query_ref, fields).stream():
+      yield doc.id, doc.to_dict() or {}
+
+
+  def aggregate_by_where_tuples(self, collection_ref, whereTuples, aggregations):
+    # aggregations is [(function, key), ...] of 'count' (key '*'), 'sum' or 'avg'
+    # computed by Firestore aggregation queries, at most 5 aggregations per query
+    query_ref = self.where_query(collection_ref, whereTuples)
+    results = []
+    for start in range(0, len(aggregations), 5):
+      chunk = aggregations[start:start + 5]
+      aggregation_ref = query_ref
+      for (i, (function, key)) in enumerate(chunk):
+        alias = 'a{}'.format(i)
+        if function == 'count':
+          aggregation_ref = aggregation_ref.count(alias=alias)
+        elif function == 'sum':
+          aggregation_ref = aggregation_ref.sum(key, alias=alias)
+        elif function == 'avg':
+          aggregation_ref = aggregation_ref.avg(key, alias=alias)
+        else:
+          raise Exception(f"unsupported Firestore aggregation '{function}'")
+      values = {}
+      for result in aggregation_ref.get()[0]:
+        values[result.alias] = result.value
+      results += [values.get('a{}'.format(i)) for i in range(len(chunk))]
     return results
 
 
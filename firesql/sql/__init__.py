@@ -1,7 +1,9 @@
 # import the necessary packages
 from .fire_sql import FireSQL
+from .async_fire_sql import AsyncFireSQL
 from .sql_fire_query import SQLFireQuery
 from .sql_fire_update import SQLFireUpdate
 from .sql_fire_insert import SQLFireInsert
 from .sql_fire_delete import SQLFireDelete
+from .sql_fire_explain import SQLFireExplain
 from .doc_printer import DocPrinter
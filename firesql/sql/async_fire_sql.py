@@ -0,0 +1,142 @@
+import asyncio
+from typing import Dict, List
+
+from lark.exceptions import LarkError
+
+from .fire_sql import FireSQL
+from .sql_fire_client import FireSQLAsyncAbstractClient
+from .sql_fire_async import SQLFireAsyncExecutor
+from .sql_script import statement_dependencies
+from .sql_prepared import (
+  FireSQLPlanCache,
+  FireSQLPreparedStatement,
+  SQL_Parameters,
+)
+
+
+class AsyncFireSQL():
+  """
+  AsyncFireSQL parses and executes FireSQL statements with an asyncio Firebase connection.
+
+  The statements are compiled by `FireSQL`, sharing its plan cache, and executed without
+  blocking the event loop, so many queries can run concurrently on one event loop.
+  As with `FireSQL`, the execution results are kept per instance: use one instance per
+  concurrent execution.
+  """
+
+  def __init__(self, planCache: FireSQLPlanCache = None):
+    self.fireSQL = FireSQL(planCache=planCache)
+    self.clear()
+
+  def clear(self):
+    self.results = []
+
+  def select_fields(self) -> List:
+    """
+    From the parsed FireSQL select statement, return the select fields.
+
+    Returns:
+      The list of select fields as strings
+    """
+    return self.sqlFireCommand.select_fields()
+
+  def execution_results(self) -> List:
+    return self.results
+
+  def plan_cache_info(self) -> Dict:
+    return self.fireSQL.plan_cache_info()
+
+  def prepare(self, sql: str, options: Dict = {}) -> FireSQLPreparedStatement:
+    """
+    Parse and compile the FireSQL statements, see `FireSQL.prepare`.
+    """
+    return self.fireSQL.prepare(sql, options=options)
+
+  async def execute(self, client: FireSQLAsyncAbstractClient, sql: str, options: Dict = {}, parameters: SQL_Parameters = None) -> List:
+    """
+    Given an asyncio Firebase connection, parse and execute all the FireSQL statements.
+
+    Args:
+      client (FireSQLAsyncAbstractClient): The async client has established a Firebase connection
+      sql (str): FireSQL statement to be executed
+      options (Dict): execution options, e.g. `joinLookupMaxQueries`, `asyncMaxConcurrency` or
+                      `concurrentStatements` the number of independent statements executed concurrently
+      parameters (List|Dict): values for the `?` or `:name` bind parameters, if any
+
+    Returns:
+      docs: A list of executed documents
+    """
+    try:
+      statement = self.prepare(sql, options=options)
+    except LarkError as e:
+      print('Parseing Error: {}'.format(e))
+      return []
+
+    return await self.execute_prepared(client, statement, parameters=parameters)
+
+  async def execute_prepared(self, client: FireSQLAsyncAbstractClient, statement: FireSQLPreparedStatement, parameters: SQL_Parameters = None) -> List:
+    """
+    Given an asyncio Firebase connection, bind the parameters and execute a prepared statement.
+
+    Args:
+      client (FireSQLAsyncAbstractClient): The async client has established a Firebase connection
+      statement (FireSQLPreparedStatement): the statement returned by `prepare`
+      parameters (List|Dict): values for the `?` or `:name` bind parameters, if any
+
+    Returns:
+      docs: A list of executed documents of the last statement
+    """
+    docs = []
+    self.clear()
+    sqlFireCommands = statement.bind(parameters)
+    maxWorkers = statement.options.get('concurrentStatements', 0)
+    if maxWorkers and len(sqlFireCommands) > 1:
+      return await self._execute_concurrently(client, sqlFireCommands, maxWorkers)
+
+    # iterating through all FireSQL statements, in order
+    for sqlFireCommand in sqlFireCommands:
+      docs = await self.execute_fire_command(client, sqlFireCommand)
+
+      # collect each execution result into results
+      self.results.append(sqlFireCommand.execution_result())
+    return docs
+
+  async def _execute_concurrently(self, client: FireSQLAsyncAbstractClient, sqlFireCommands: List, maxWorkers: int) -> List:
+    # the statements run as tasks, at most `maxWorkers` at once, each one once the earlier
+    # statements reading or writing the same collections are done
+    dependencies = statement_dependencies([sqlFireCommand.collection_access() for sqlFireCommand in sqlFireCommands])
+    semaphore = asyncio.Semaphore(maxWorkers)
+
+    async def _execute(sqlFireCommand, waitFor):
+      # a failed statement fails the statements depending on it
+      await asyncio.gather(*waitFor)
+      async with semaphore:
+        return await SQLFireAsyncExecutor(client, sqlFireCommand).execute()
+
+    tasks = []
+    for sqlFireCommand, depends in zip(sqlFireCommands, dependencies):
+      tasks.append(asyncio.ensure_future(_execute(sqlFireCommand, [tasks[index] for index in depends])))
+    docs = await asyncio.gather(*tasks, return_exceptions=True)
+    for result in docs:
+      if isinstance(result, BaseException):
+        # the first failed statement, in statement order
+        raise result
+
+    # collect each execution result into results, in statement order
+    self.sqlFireCommand = sqlFireCommands[-1]
+    self.results = [sqlFireCommand.execution_result() for sqlFireCommand in sqlFireCommands]
+    return docs[-1]
+
+  async def execute_fire_command(self, client: FireSQLAsyncAbstractClient, sqlFireCommand) -> List:
+    """
+    Given an asyncio Firebase connection, execute a compiled and bound Firestore command.
+
+    Args:
+      client (FireSQLAsyncAbstractClient): The async client has established a Firebase connection
+      sqlFireCommand (SQLFireQuery|SQLFireInsert|SQLFireUpdate|SQLFireDelete|SQLFireExplain): command to be executed
+
+    Returns:
+      docs: A list of executed documents
+    """
+    self.sqlFireCommand = sqlFireCommand
+    return await SQLFireAsyncExecutor(client, sqlFireCommand).execute()
@@ -1,6 +1,7 @@
 import re
 import json
 import datetime
+import itertools
 from .sql_date import SQLDate
 
 class DocPrinter:
@@ -56,17 +57,23 @@ class DocPrinter:
     printCSV is to print the given list of documents from the select fields in CSV output format
 
     Args:
-      docs (List of documents as Dict): the list of documents after FireSQL select query
+      docs (List or Iterator of documents as Dict): the documents after FireSQL select query, e.g. from `execute_iter`
       selectFields (List of fields to output): the list of select fields to be picked out from each document (as Dict)
 
     Returns:
       str: string output in CSV format
     """
+    if '*' in selectFields and isinstance(docs, list):
+      # all the fields of the docs, in order of appearance
+      selectFields = list(dict.fromkeys(itertools.chain.from_iterable(docs)))
+    docs = iter(docs)
     if '*' in selectFields:
-      # sample a doc for all the fields
-      firstKey = next(iter(docs))
-      doc = docs[firstKey]
+      # sample a doc for all the fields, the docs are streamed
+      doc = next(docs, None)
+      if doc is None:
+        return
       selectFields = doc.keys()
+      docs = itertools.chain([doc], docs)
 
     print(','.join([f'"{f}"' for f in selectFields]))
     for doc in docs:
@@ -87,30 +94,47 @@ class DocPrinter:
     printJSON is to print the given list of documents from the select fields in JSON output format
 
     Args:
-      docs (List of documents as Dict): the list of documents after FireSQL select query
+      docs (List or Iterator of documents as Dict): the documents after FireSQL select query, e.g. from `execute_iter`
       selectFields (List of fields to output): the list of select fields to be picked out from each document (as Dict)
 
     Returns:
       str: string output in JSON format
     """
     print("[")
-    count = 0
-    total = len(docs)
-    if '*' in selectFields:
-      for key, doc in docs.items():
-        count += 1
+    # a line is printed once the next one is known, to end it with a comma or not
+    line = None
+    for doc in docs:
+      if '*' in selectFields:
         fields = self.value_conversion(doc)
-        comma = ',' if count < total else ''
-        print('{}{}'.format( SQLDate.document_to_json(fields), comma ))
-    else:
-      for doc in docs:
-        count += 1
+      else:
         fields = {}
         for field in selectFields:
           if field in doc:
             fields[field] = self.value_conversion( self._get_field_value(doc, field) )
           else:
             fields[field] = ''
-        comma = ',' if count < total else ''
-        print('{}{}'.format( SQLDate.document_to_json(fields), comma ))
+      if line is not None:
+        print('{},'.format(line))
+      line = SQLDate.document_to_json(fields)
+    if line is not None:
+      print(line)
     print("]")
+
+  def printTable(self, docs, selectFields):
+    """
+    printTable is to print the given list of documents from the select fields as an aligned text table,
+    e.g. the plan rows of an EXPLAIN statement
+
+    Args:
+      docs (List of documents as Dict): the list of documents after FireSQL select query
+      selectFields (List of fields to output): the list of select fields to be picked out from each document (as Dict)
+
+    Returns:
+      str: string output as a text table
+    """
+    rows = [[str(self.value_conversion(doc.get(field, ''))) for field in selectFields] for doc in docs]
+    widths = [max([len(field)] + [len(row[i]) for row in rows]) for i, field in enumerate(selectFields)]
+    print(' | '.join(field.ljust(width) for field, width in zip(selectFields, widths)).rstrip())
+    print('-+-'.join('-' * width for width in widths))
+    for row in rows:
+      print(' | '.join(value.ljust(width) for value, width in zip(row, widths)).rstrip())
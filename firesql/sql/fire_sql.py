@@ -1,12 +1,15 @@
 import os
-import copy
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Union
+from typing import Dict, Iterable, Iterator, List, Union
 
 from lark import Lark
+from lark.exceptions import LarkError
 
 from .sql_objects import (
   SQL_DML_Command,
+  SQL_Explain,
   SQL_Select,
   SQL_Insert,
   SQL_Update,
@@ -19,6 +22,14 @@ from .sql_fire_query import SQLFireQuery
 from .sql_fire_update import SQLFireUpdate
 from .sql_fire_insert import SQLFireInsert
 from .sql_fire_delete import SQLFireDelete
+from .sql_fire_explain import SQLFireExplain
+from .sql_prepared import (
+  SQL_Parameters,
+  FireSQLPreparedStatement,
+  FireSQLPlanCache,
+  normalize_sql,
+)
+from .sql_script import split_statements, prefetch, statement_dependencies
 
 
 _ROOT = Path(__file__).parent
@@ -31,18 +42,53 @@ except:
   with open(file=GRAMMAR_PATH) as sql_grammar_file:
     _GRAMMAR_TEXT = sql_grammar_file.read()
 
+# the LALR parser is shared by all FireSQL instances in the process,
+# its analysis tables are cached on disk keyed by the grammar hash
+_PARSER = None
+_PARSER_LOCK = threading.Lock()
+
+
+def get_parser() -> Lark:
+  """
+  Return the process-wide FireSQL LALR parser, building it on first use.
+
+  The grammar analysis is cached by `lark` in the temp directory, keyed by the
+  hash of `sql/grammar/firesql.lark`, so only the first process after a grammar
+  change pays the full compilation cost.
+
+  Returns:
+    Lark: the shared FireSQL parser
+  """
+  global _PARSER
+  if _PARSER is None:
+    with _PARSER_LOCK:
+      if _PARSER is None:
+        _PARSER = Lark(_GRAMMAR_TEXT, parser="lalr", cache=True)
+  return _PARSER
+
+# prepared statements are shared by all FireSQL instances in the process
+_PLAN_CACHE = FireSQLPlanCache()
+
 
 # main interface
 class FireSQL():
   """
   FireSQL is the main programming interface to execute FireSQL statements
 
-  During FireSQL initialization, the FireSQL parser is prepared from `sql/grammar/firesql.lark`.
+  The FireSQL parser is prepared once per process from `sql/grammar/firesql.lark`
+  and shared by all FireSQL instances (see `get_parser`).
+
+  Statements are compiled by `prepare` into a `FireSQLPreparedStatement`, which is kept
+  in a LRU plan cache keyed by the normalized FireSQL, so repeated statements skip the
+  parsing and query generation and only bind their `?`/`:name` parameters.
   """
 
-  def __init__(self):
+  def __init__(self, planCache: FireSQLPlanCache = None):
     self.transformer = SQLTransformer()
-    self.parser = Lark(_GRAMMAR_TEXT, parser="lalr")
+    self.parser = get_parser()
+    self.planCache = planCache if planCache is not None else _PLAN_CACHE
+    self.scriptParser = None
+    self.scriptTransformer = None
     self.clear()
 
   def clear(self):
@@ -65,111 +111,283 @@ class FireSQL():
   def execution_results(self) -> List:
     return self.results
 
-  def execute(self, client: FireSQLAbstractClient, sql: str, options: Dict = {}) -> List:
+  def plan_cache_info(self) -> Dict:
+    """
+    Return the plan cache counters.
+
+    Returns:
+      Dict: `hits`, `misses`, `size` and `maxsize` of the plan cache
+    """
+    return self.planCache.info()
+
+  def prepare(self, sql: str, options: Dict = {}) -> FireSQLPreparedStatement:
+    """
+    Parse and compile the FireSQL statements into a reusable prepared statement.
+
+    Literal values can be replaced by `?` positional or `:name` named bind parameters,
+    e.g. `SELECT * FROM Users WHERE state = :state AND age > ?`.
+    The compiled statement is looked up from (or stored into) the plan cache.
+
+    Args:
+      sql (str): FireSQL statements to be compiled
+      options (Dict): execution options, e.g. `joinLookupMaxQueries`
+
+    Returns:
+      FireSQLPreparedStatement: the compiled statements
+    """
+    sql = normalize_sql(sql)
+    # the options are compiled into the statement
+    key = (sql, repr(sorted(options.items()))) if options else sql
+    statement = self.planCache.get(key)
+    if statement is None:
+      # select statement SQL parser to produce the AST
+      ast = self.parser.parse(sql)
+      # transform AST into parsed SQL components
+      statements = self.transformer.transform(ast)
+      fireCommands = [self.compile_command(sqlCommand, options=options) for sqlCommand in statements]
+      statement = FireSQLPreparedStatement(sql, fireCommands, options=options)
+      self.planCache.put(key, statement)
+    return statement
+
+  def execute(self, client: FireSQLAbstractClient, sql: str, options: Dict = {}, parameters: SQL_Parameters = None) -> List:
     """
     Given a Firebase connection, parse and execute all the FireSQL statements.
 
     Args:
       client (FirebaseClient): The client has established a Firebase connection
       sql (str): FireSQL statement to be executed
-      options (Dict): Unused
+      options (Dict): execution options, e.g. `joinLookupMaxQueries`, `scanWorkers`, or `concurrentStatements`
+                      the number of threads running the independent statements concurrently
+      parameters (List|Dict): values for the `?` or `:name` bind parameters, if any
 
     Returns:
       docs: A list of executed documents
     """
     try:
-      # select statement SQL parser to produce the AST
-      ast = self.parser.parse(sql)
-      # transform AST into parsed SQL components
-      statements = self.transformer.transform(ast)
-    except Exception as e:
+      statement = self.prepare(sql, options=options)
+    except LarkError as e:
       print('Parseing Error: {}'.format(e))
       return []
 
-    # iterating through all FireSQL statements
+    return self.execute_prepared(client, statement, parameters=parameters)
+
+  def execute_prepared(self, client: FireSQLAbstractClient, statement: FireSQLPreparedStatement, parameters: SQL_Parameters = None) -> List:
+    """
+    Given a Firebase connection, bind the parameters and execute a prepared statement.
+
+    Args:
+      client (FirebaseClient): The client has established a Firebase connection
+      statement (FireSQLPreparedStatement): the statement returned by `prepare`
+      parameters (List|Dict): values for the `?` or `:name` bind parameters, if any
+
+    Returns:
+      docs: A list of executed documents of the last statement
+    """
+    docs = []
     self.clear()
-    for sqlCommand in statements:
-      docs = self.execute_command(client, sqlCommand)
+    sqlFireCommands = statement.bind(parameters)
+    maxWorkers = statement.options.get('concurrentStatements', 0)
+    if maxWorkers and len(sqlFireCommands) > 1:
+      return self._execute_concurrently(client, sqlFireCommands, maxWorkers)
+
+    # iterating through all FireSQL statements
+    for sqlFireCommand in sqlFireCommands:
+      docs = self.execute_fire_command(client, sqlFireCommand)
 
       # collect each execution result into results
       self.results.append(self._get_execution_result())
     return docs
 
-
-  def execute_command(self, client: FireSQLAbstractClient, sqlCommand: SQL_DML_Command, options: Dict = {}) -> List:
+  def _execute_concurrently(self, client: FireSQLAbstractClient, sqlFireCommands: List, maxWorkers: int) -> List:
+    # the statements run on a pool of `maxWorkers` threads, each one once the earlier statements
+    # reading or writing the same collections are done. The pool starts the statements in order,
+    # so the statements waited for are always running or done
+    dependencies = statement_dependencies([sqlFireCommand.collection_access() for sqlFireCommand in sqlFireCommands])
+
+    def _execute(sqlFireCommand, waitFor):
+      for future in waitFor:
+        # a failed statement fails the statements depending on it
+        future.result()
+      return self.execute_fire_command(client, sqlFireCommand)
+
+    futures = []
+    with ThreadPoolExecutor(max_workers=maxWorkers) as executor:
+      for sqlFireCommand, depends in zip(sqlFireCommands, dependencies):
+        futures.append(executor.submit(_execute, sqlFireCommand, [futures[index] for index in depends]))
+      docs = [future.result() for future in futures]
+
+    # collect each execution result into results, in statement order
+    self.sqlFireCommand = sqlFireCommands[-1]
+    self.results = [sqlFireCommand.execution_result() for sqlFireCommand in sqlFireCommands]
+    return docs[-1]
+
+  def execute_iter(self, client: FireSQLAbstractClient, sql: str, options: Dict = {}, parameters: SQL_Parameters = None) -> Iterator[Dict]:
     """
-    Given a Firebase connection, execute a FireSQL statements.
+    Given a Firebase connection, parse and execute all the FireSQL statements, streaming the
+    documents of the last statement.
+
+    A SELECT is executed as a pull-based pipeline: its rows are yielded as soon as they are
+    read from Firestore and the memory does not grow with the result, unless the query has
+    a blocking operator (see `SQLFireQuery.execute_iter`). Stopping the iteration early stops
+    reading from Firestore.
 
     Args:
       client (FirebaseClient): The client has established a Firebase connection
-      sqlCommand (SQL_Select|SQL_Insert|SQL_Update|SQL_Delete): FireSQL statement to be executed
-      options (Dict): Unused
+      sql (str): FireSQL statement to be executed
+      options (Dict): execution options, e.g. `joinLookupMaxQueries`
+      parameters (List|Dict): values for the `?` or `:name` bind parameters, if any
 
     Returns:
-      docs: A list of executed documents
+      Iterator of the executed documents of the last statement
     """
+    try:
+      statement = self.prepare(sql, options=options)
+    except LarkError as e:
+      print('Parseing Error: {}'.format(e))
+      return
 
-    if isinstance(sqlCommand, SQL_Select):
-      self.sqlFireCommand = SQLFireQuery()
+    self.clear()
+    sqlFireCommands = statement.bind(parameters)
+    for sqlFireCommand in sqlFireCommands[:-1]:
+      self.execute_fire_command(client, sqlFireCommand)
+      self.results.append(self._get_execution_result())
 
-      # transform parsed SQL components into firebase queries
-      queries = self.sqlFireCommand.generate(sqlCommand, options=options)
-      fireQueries = self.sqlFireCommand.firebase_queries(queries)
-      filterQueries = self.sqlFireCommand.filter_queries(queries)
+    if not sqlFireCommands:
+      return
+    sqlFireCommand = sqlFireCommands[-1]
+    if isinstance(sqlFireCommand, SQLFireQuery) and not isinstance(sqlFireCommand, (SQLFireUpdate, SQLFireDelete)):
+      self.sqlFireCommand = sqlFireCommand
+      yield from sqlFireCommand.execute_iter(client)
+    else:
+      yield from self.execute_fire_command(client, sqlFireCommand)
+    self.results.append(self._get_execution_result())
+
+  def parse_script(self, script: Union[str, Iterable[str]], options: Dict = {}) -> Iterator[SQL_DML_Command]:
+    """
+    Parse a FireSQL script incrementally, yielding each statement as soon as it is parsed.
 
-      # execute firebase queries for each collection
-      documents = self.sqlFireCommand.execute_query(client, fireQueries)
+    The statements are split on `;` and parsed one by one with an inline-transformer
+    LALR parser, so no parse tree is built and the memory does not grow with the script size.
 
-      # execute filter queries for each collection
-      filterDocuments = self.sqlFireCommand.filter_documents(documents, filterQueries)
+    Args:
+      script (str|Iterable[str]): FireSQL script, a string or e.g. an open file
+      options (Dict): Unused
 
-      # post-processing join of collections if needed
-      selectDocs = self.sqlFireCommand.post_process(filterDocuments)
+    Returns:
+      Iterator of the parsed SQL_Select, SQL_Insert, SQL_Update or SQL_Delete statements
+    """
+    if self.scriptParser is None:
+      # the transformer is applied during parsing, it shares the grammar cache with get_parser()
+      self.scriptTransformer = SQLTransformer()
+      self.scriptParser = Lark(_GRAMMAR_TEXT, parser="lalr", cache=True, transformer=self.scriptTransformer)
+    for sql in split_statements(script):
+      # positional parameters are numbered in each statement
+      self.scriptTransformer.parameterIndex = 0
+      yield from self.scriptParser.parse(sql)
+
+  def execute_script(self, client: FireSQLAbstractClient, script: Union[str, Iterable[str]], options: Dict = {}) -> Iterator[List]:
+    """
+    Given a Firebase connection, execute a (large) FireSQL script statement by statement.
 
-      return selectDocs
+    The next statements are parsed in a background thread while the current one executes.
+    Unlike `execute`, the execution results are not collected, the documents of each
+    statement are yielded as soon as it has executed.
 
-    elif isinstance(sqlCommand, SQL_Insert):
-      self.sqlFireCommand = SQLFireInsert()
+    Args:
+      client (FirebaseClient): The client has established a Firebase connection
+      script (str|Iterable[str]): FireSQL script, a string or e.g. an open file
+      options (Dict): execution options, e.g. `joinLookupMaxQueries`
 
-      if self.sqlFireCommand.generate(sqlCommand, options=options):
-        document = self.sqlFireCommand.post_process()
-        insertedDoc = self.sqlFireCommand.execute(client, document)
-        return [insertedDoc]
-      else:
-        return []
+    Returns:
+      Iterator of the executed documents, one list per statement
+    """
+    for sqlCommand in prefetch(self.parse_script(script, options=options)):
+      yield self.execute_command(client, sqlCommand, options=options)
+
+  def compile_command(self, sqlCommand: SQL_DML_Command, options: Dict = {}) -> Union[SQLFireQuery, SQLFireInsert]:
+    """
+    Transform a parsed FireSQL statement into its Firestore command, ready to be bound and executed.
 
+    Args:
+      sqlCommand (SQL_Select|SQL_Insert|SQL_Update|SQL_Delete|SQL_Explain): FireSQL statement to be compiled
+      options (Dict): execution options, e.g. `joinLookupMaxQueries`
+
+    Returns:
+      The generated SQLFireQuery, SQLFireInsert, SQLFireUpdate, SQLFireDelete or SQLFireExplain
+    """
+    if isinstance(sqlCommand, SQL_Explain):
+      # the plan of the explained statement
+      return SQLFireExplain(self.compile_command(sqlCommand.command, options=options), analyze=sqlCommand.analyze)
+    elif isinstance(sqlCommand, SQL_Select):
+      sqlFireCommand = SQLFireQuery()
+    elif isinstance(sqlCommand, SQL_Insert):
+      sqlFireCommand = SQLFireInsert()
     elif isinstance(sqlCommand, SQL_Update):
-      self.sqlFireCommand = SQLFireUpdate()
+      sqlFireCommand = SQLFireUpdate()
+    elif isinstance(sqlCommand, SQL_Delete):
+      sqlFireCommand = SQLFireDelete()
 
-      # transform parsed SQL components into firebase queries
-      queries = self.sqlFireCommand.generate(sqlCommand, options=options)
-      fireQueries = self.sqlFireCommand.firebase_queries(queries)
-      filterQueries = self.sqlFireCommand.filter_queries(queries)
+    # transform parsed SQL components into firebase queries
+    sqlFireCommand.generate(sqlCommand, options=options)
+    return sqlFireCommand
 
-      # execute firebase queries for each collection
-      documents = self.sqlFireCommand.execute_query(client, fireQueries)
+  def execute_command(self, client: FireSQLAbstractClient, sqlCommand: SQL_DML_Command, options: Dict = {}) -> List:
+    """
+    Given a Firebase connection, execute a FireSQL statements.
 
-      # execute filter queries for each collection
-      filterDocuments = self.sqlFireCommand.filter_documents(documents, filterQueries)
+    Args:
+      client (FirebaseClient): The client has established a Firebase connection
+      sqlCommand (SQL_Select|SQL_Insert|SQL_Update|SQL_Delete): FireSQL statement to be executed
+      options (Dict): execution options, e.g. `joinLookupMaxQueries`
 
-      # post-processing update of collections if needed
-      updatedDocs = self.sqlFireCommand.execute(client, filterDocuments)
-      return updatedDocs 
+    Returns:
+      docs: A list of executed documents
+    """
+    sqlFireCommand = self.compile_command(sqlCommand, options=options)
+    return self.execute_fire_command(client, sqlFireCommand.bind())
 
-    elif isinstance(sqlCommand, SQL_Delete):
-      self.sqlFireCommand = SQLFireDelete()
+  def execute_fire_command(self, client: FireSQLAbstractClient, sqlFireCommand: Union[SQLFireQuery, SQLFireInsert]) -> List:
+    """
+    Given a Firebase connection, execute a compiled and bound Firestore command.
+
+    Args:
+      client (FirebaseClient): The client has established a Firebase connection
+      sqlFireCommand (SQLFireQuery|SQLFireInsert|SQLFireUpdate|SQLFireDelete|SQLFireExplain): command to be executed
+
+    Returns:
+      docs: A list of executed documents
+    """
+    self.sqlFireCommand = sqlFireCommand
+
+    if isinstance(sqlFireCommand, SQLFireExplain):
+      if sqlFireCommand.analyze:
+        # EXPLAIN ANALYZE executes the statement, measuring its operators
+        statsClient = sqlFireCommand.instrument(client)
+        self.execute_fire_command(statsClient, sqlFireCommand.fireCommand)
+        self.sqlFireCommand = sqlFireCommand
+      return sqlFireCommand.post_process()
+
+    if isinstance(sqlFireCommand, SQLFireInsert):
+      if sqlFireCommand.is_valid():
+        document = sqlFireCommand.post_process()
+        insertedDoc = sqlFireCommand.execute(client, document)
+        return [insertedDoc]
+      else:
+        return []
 
-      # transform parsed SQL components into firebase queries
-      queries = self.sqlFireCommand.generate(sqlCommand, options=options)
-      fireQueries = self.sqlFireCommand.firebase_queries(queries)
-      filterQueries = self.sqlFireCommand.filter_queries(queries)
+    queries = sqlFireCommand.fireQueries
+    fireQueries = sqlFireCommand.firebase_queries(queries)
+    filterQueries = sqlFireCommand.filter_queries(queries)
 
-      # execute firebase queries for each collection
-      documents = self.sqlFireCommand.execute_query(client, fireQueries)
+    # execute firebase queries for each collection
+    documents = sqlFireCommand.execute_query(client, fireQueries)
 
-      # execute filter queries for each collection
-      filterDocuments = self.sqlFireCommand.filter_documents(documents, filterQueries)
+    # execute filter queries for each collection
+    filterDocuments = sqlFireCommand.filter_documents(documents, filterQueries)
 
-      # post-processing delete of collections if needed
-      deletedDocs = self.sqlFireCommand.execute(client, filterDocuments)
-      return deletedDocs 
+    if isinstance(sqlFireCommand, (SQLFireUpdate, SQLFireDelete)):
+      # post-processing update or delete of collections if needed
+      return sqlFireCommand.execute(client, filterDocuments)
+    else:
+      # post-processing join of collections if needed
+      return sqlFireCommand.post_process(filterDocuments)
@@ -1,22 +1,663 @@
-import sys
-from typing import Dict, List
+import hashlib
+import itertools
+import math
+import random
+import struct
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# batches of at least this many values are aggregated by column arrays,
+# below that the conversion costs more than the value by value updates
+VECTORIZE_MIN_ROWS = 1000
+
+# rows of an aggregation batched before the accumulators are updated by column
+AGGREGATE_BATCH_ROWS = 8192
+
+# a 64 bits integer sum cannot overflow below this bound
+INT64_SUM_BOUND = 2 ** 63
+
+# the distinct strings up to this length are their own key, the longer ones and the other values are hashed
+DISTINCT_KEY_MAX_LENGTH = 32
+DISTINCT_BOOLEAN_KEYS = {False: ('boolean', False), True: ('boolean', True)}
+DISTINCT_NAN_KEY = ('number', 'NaN')
+
+# APPROX_COUNT_DISTINCT keeps 2**14 HyperLogLog registers of 1 byte,
+# its relative standard error is 1.04 / sqrt(2**14) = 0.81%
+HLL_PRECISION = 14
+HLL_HASH_BITS = 64
+HLL_HASH_MASK = (1 << HLL_HASH_BITS) - 1
+# the hashes of NaN, of the booleans and of the float bits, apart from the integers
+HLL_NAN_HASH = 0x7FF8000000000000
+HLL_BOOLEAN_HASHES = {False: 0x626F6F6C65616E30, True: 0x626F6F6C65616E31}
+HLL_FLOAT_TAG = 0x666C6F6174363462
+
+# APPROX_PERCENTILE keeps a KLL sketch of at most about 3 * 200 values,
+# the rank of its percentiles is off by less than 1.5% of the values, 99% of the time
+KLL_K = 200
+KLL_CAPACITY_RATIO = 2.0 / 3.0
+# the compactions of a sketch draw from their own seeded coins, the same values give the same percentiles
+KLL_SEED = 0
+
+APPROX_PERCENTILE = 'approx_percentile'
+
+def _is_numeric(value: Any) -> bool:
+  # only the int and float values are aggregated by SUM, AVG, MIN and MAX
+  return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def _group_key(value: Any) -> Any:
+  # a hashable key of a group field value
+  if isinstance(value, list):
+    return ('list', tuple(_group_key(v) for v in value))
+  elif isinstance(value, dict):
+    return ('dict', tuple((k, _group_key(v)) for k, v in sorted(value.items())))
+  return value
+
+def percentile_function(fraction: str) -> str:
+  """
+  The aggregation function name of APPROX_PERCENTILE(field, fraction).
+
+  Args:
+    fraction (str): the percentile, between 0 and 1
+
+  Returns:
+    str: the function name, e.g. 'approx_percentile:0.95'
+  """
+  if not 0 <= float(fraction) <= 1:
+    raise Exception(f"APPROX_PERCENTILE fraction '{fraction}' must be between 0 and 1")
+  return f"{APPROX_PERCENTILE}:{fraction}"
+
+
+class FireSQLColumn():
+  """
+  FireSQLColumn is a batch of values of an aggregated column. Its numeric values are converted
+  once into a NumPy array, on which all the aggregations of the column are vectorized.
+
+  The non-numeric values (None, booleans, strings, maps, ...) are masked out of the array.
+  Integers beyond 64 bits are aggregated as Python integers.
+  """
+
+  def __init__(self, values: List):
+    """
+    Args:
+      values (List): the column values of the rows
+    """
+    self.values = values
+    self._numericValues = None
+    self._array = None
+
+  def _convert(self):
+    types = set(map(type, self.values))
+    numericTypes = {valueType: issubclass(valueType, (int, float)) and not issubclass(valueType, bool) for valueType in types}
+    values = self.values
+    if not all(numericTypes.values()):
+      # the non-numeric mask
+      values = list(itertools.compress(values, map(numericTypes.__getitem__, map(type, values))))
+    isFloat = any(issubclass(valueType, float) for valueType, isNumeric in numericTypes.items() if isNumeric)
+    try:
+      self._array = np.fromiter(values, np.float64 if isFloat else np.int64, count=len(values))
+    except OverflowError:
+      self._array = None
+    # the numeric values, to return the min and max with their own type
+    self._numericValues = values
+
+  @property
+  def numericValues(self) -> List:
+    if self._numericValues is None:
+      self._convert()
+    return self._numericValues
+
+  @property
+  def array(self) -> Optional[np.ndarray]:
+    # the int64 or float64 array of the numeric values, None for integers beyond 64 bits
+    if self._numericValues is None:
+      self._convert()
+    return self._array
+
+  @property
+  def otherValues(self) -> List:
+    # the values that are neither null nor numeric
+    if len(self.numericValues) == len(self.values):
+      return []
+    return [value for value in self.values if value is not None and not _is_numeric(value)]
+
+  def sum(self):
+    array = self.array
+    if array is None:
+      return sum(self.numericValues)
+    if array.dtype.kind == 'f':
+      return float(array.sum())
+    if not len(array):
+      return 0
+    if len(array) * max(abs(int(array.min())), abs(int(array.max()))) >= INT64_SUM_BOUND:
+      return sum(self.numericValues)
+    return int(array.sum(dtype=np.int64))
+
+  def min(self):
+    return self._extreme(np.argmin, np.nanargmin, min)
+
+  def max(self):
+    return self._extreme(np.argmax, np.nanargmax, max)
+
+  def _extreme(self, argExtreme: Callable, nanArgExtreme: Callable, extreme: Callable):
+    # the first min or max value, NaN left out as when compared value by value, None without any
+    array = self.array
+    if not self.numericValues:
+      return None
+    if array is None:
+      return extreme(self.numericValues)
+    if array.dtype.kind == 'f':
+      if np.isnan(array).all():
+        return None
+      return self.numericValues[int(nanArgExtreme(array))]
+    return self.numericValues[int(argExtreme(array))]
+
+
+class FireSQLAccumulator():
+  """
+  FireSQLAccumulator is an aggregation function, as the updates of an accumulated state.
+
+  The state of an aggregation starts from `init()`, is updated with each value by `update()`,
+  or with a batch of values by `update_column()`, and gives the aggregated value by `finalize()`.
+  The partial states of the same aggregation, e.g. of parallel partitions, are combined by `merge()`.
+  The accumulators keep no state themselves, one accumulator serves all the aggregations of its function.
+  """
+
+  def init(self) -> Any:
+    raise NotImplementedError()
+
+  def update(self, state: Any, value: Any) -> Any:
+    raise NotImplementedError()
+
+  def update_column(self, state: Any, column: FireSQLColumn) -> Any:
+    for value in column.values:
+      state = self.update(state, value)
+    return state
+
+  def merge(self, state: Any, other: Any) -> Any:
+    raise NotImplementedError()
+
+  def finalize(self, state: Any) -> Any:
+    return state
+
+
+class FireSQLCount(FireSQLAccumulator):
+  # the number of values that are not null, COUNT(*) is given a value for each row
+
+  def init(self) -> int:
+    return 0
+
+  def update(self, state: int, value: Any) -> int:
+    return state + 1 if value is not None else state
+
+  def update_column(self, state: int, column: FireSQLColumn) -> int:
+    return state + len(column.values) - column.values.count(None)
+
+  def merge(self, state: int, other: int) -> int:
+    return state + other
+
+
+class FireSQLCountDistinct(FireSQLAccumulator):
+  """
+  The exact number of distinct values that are not null, kept in a set of compact keys: the numbers
+  and short strings are their own key, the other values their 128 bits hash. Equal numbers are the
+  same value (1 and 1.0) but not the booleans. The keys do not depend on the process, so the states
+  of partitions read elsewhere can be merged.
+  """
+
+  def init(self) -> set:
+    return set()
+
+  def update(self, state: set, value: Any) -> set:
+    if value is not None:
+      state.add(self._key(value))
+    return state
+
+  def update_column(self, state: set, column: FireSQLColumn) -> set:
+    state.update([self._key(value) for value in column.values if value is not None])
+    return state
+
+  def merge(self, state: set, other: set) -> set:
+    state |= other
+    return state
+
+  def finalize(self, state: set) -> int:
+    return len(state)
+
+  def _key(self, value: Any) -> Any:
+    valueType = type(value)
+    if valueType is int or (valueType is float and value == value):
+      return value
+    if valueType is str and len(value) <= DISTINCT_KEY_MAX_LENGTH:
+      return value
+    if isinstance(value, bool):
+      return DISTINCT_BOOLEAN_KEYS[value]
+    if isinstance(value, float):
+      # NaN is a single value
+      return DISTINCT_NAN_KEY
+    if isinstance(value, str):
+      data = b's' + value.encode('utf-8', 'surrogatepass')
+    else:
+      data = b'o' + repr(_group_key(value)).encode()
+    # bytes are not equal to any number or string key
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+class FireSQLSum(FireSQLAccumulator):
+  # the sum of the numeric values, 0 without any
+
+  def init(self) -> Any:
+    return 0
+
+  def update(self, state: Any, value: Any) -> Any:
+    return state + value if _is_numeric(value) else state
+
+  def update_column(self, state: Any, column: FireSQLColumn) -> Any:
+    if len(column.values) < VECTORIZE_MIN_ROWS:
+      return super().update_column(state, column)
+    return state + column.sum()
+
+  def merge(self, state: Any, other: Any) -> Any:
+    return state + other
+
+
+class FireSQLAvg(FireSQLAccumulator):
+  # the average of the numeric values, None without any
+
+  def init(self) -> Tuple:
+    return (0, 0)
+
+  def update(self, state: Tuple, value: Any) -> Tuple:
+    return (state[0] + value, state[1] + 1) if _is_numeric(value) else state
+
+  def update_column(self, state: Tuple, column: FireSQLColumn) -> Tuple:
+    if len(column.values) < VECTORIZE_MIN_ROWS:
+      return super().update_column(state, column)
+    return (state[0] + column.sum(), state[1] + len(column.numericValues))
+
+  def merge(self, state: Tuple, other: Tuple) -> Tuple:
+    return (state[0] + other[0], state[1] + other[1])
+
+  def finalize(self, state: Tuple) -> Any:
+    total, count = state
+    return float(total) / float(count) if count > 0 else None
+
+
+class FireSQLMin(FireSQLAccumulator):
+  # the smallest numeric value, None without any
+
+  def init(self) -> Any:
+    return None
+
+  def update(self, state: Any, value: Any) -> Any:
+    # NaN is not ordered
+    return value if _is_numeric(value) and value == value and (state is None or value < state) else state
+
+  def update_column(self, state: Any, column: FireSQLColumn) -> Any:
+    if len(column.values) < VECTORIZE_MIN_ROWS:
+      return super().update_column(state, column)
+    return self.merge(state, column.min())
+
+  def merge(self, state: Any, other: Any) -> Any:
+    return other if other is not None and (state is None or other < state) else state
+
+
+class FireSQLMax(FireSQLAccumulator):
+  # the largest numeric value, None without any
+
+  def init(self) -> Any:
+    return None
+
+  def update(self, state: Any, value: Any) -> Any:
+    # NaN is not ordered
+    return value if _is_numeric(value) and value == value and (state is None or value > state) else state
+
+  def update_column(self, state: Any, column: FireSQLColumn) -> Any:
+    if len(column.values) < VECTORIZE_MIN_ROWS:
+      return super().update_column(state, column)
+    return self.merge(state, column.max())
+
+  def merge(self, state: Any, other: Any) -> Any:
+    return other if other is not None and (state is None or other > state) else state
+
+
+def _splitmix64(value: int) -> int:
+  # the 64 bits finalizer of SplitMix64, an integer hash of well spread bits
+  value = (value + 0x9E3779B97F4A7C15) & HLL_HASH_MASK
+  value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & HLL_HASH_MASK
+  value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & HLL_HASH_MASK
+  return value ^ (value >> 31)
+
+def _splitmix64_array(values: np.ndarray) -> np.ndarray:
+  # _splitmix64() of an uint64 array, the products wrap around as the masked integers
+  values = values + np.uint64(0x9E3779B97F4A7C15)
+  values = (values ^ (values >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+  values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+  return values ^ (values >> np.uint64(31))
+
+
+class FireSQLApproxCountDistinct(FireSQLAccumulator):
+  """
+  The approximate number of distinct values that are not null, by a HyperLogLog sketch of
+  2**14 registers (16KB) whatever the number of values. The estimate has a relative standard
+  error of 0.81%, it is within 2% of the exact count 98% of the time, and small counts are
+  almost exact. Equal numbers are the same value (1 and 1.0) but not the booleans, as COUNT(DISTINCT).
+
+  The hashes do not depend on the process, the registers of partitions read elsewhere are merged
+  by their maximum, and the merged estimate is the one of all the values.
+  """
+
+  def init(self) -> np.ndarray:
+    return np.zeros(1 << HLL_PRECISION, dtype=np.uint8)
+
+  def update(self, state: np.ndarray, value: Any) -> np.ndarray:
+    if value is not None:
+      valueHash = self._hash(value)
+      index = valueHash >> (HLL_HASH_BITS - HLL_PRECISION)
+      # the position of the first 1 bit in the rest of the hash
+      rank = HLL_HASH_BITS - HLL_PRECISION + 1 - (valueHash & ((1 << (HLL_HASH_BITS - HLL_PRECISION)) - 1)).bit_length()
+      if rank > state[index]:
+        state[index] = rank
+    return state
+
+  def update_column(self, state: np.ndarray, column: FireSQLColumn) -> np.ndarray:
+    array = column.array
+    if len(column.values) < VECTORIZE_MIN_ROWS or array is None:
+      return super().update_column(state, column)
+    hashes = self._hash_array(array)
+    indices = (hashes >> np.uint64(HLL_HASH_BITS - HLL_PRECISION)).astype(np.intp)
+    rest = hashes & np.uint64((1 << (HLL_HASH_BITS - HLL_PRECISION)) - 1)
+    # the bit length of the rest, exact as float since it has less than 53 bits
+    ranks = HLL_HASH_BITS - HLL_PRECISION + 1 - np.frexp(rest.astype(np.float64))[1]
+    np.maximum.at(state, indices, ranks.astype(np.uint8))
+    for value in column.otherValues:
+      state = self.update(state, value)
+    return state
+
+  def merge(self, state: np.ndarray, other: np.ndarray) -> np.ndarray:
+    np.maximum(state, other, out=state)
+    return state
+
+  def finalize(self, state: np.ndarray) -> int:
+    # the improved estimator of Ertl (2017) "New cardinality estimation algorithms for HyperLogLog
+    # sketches", unbiased from the empty sketch to the 64 bits hashes, without the bias of the raw
+    # estimate above the linear counting of the small counts
+    registers = len(state)
+    maxRank = HLL_HASH_BITS - HLL_PRECISION
+    counts = np.bincount(state, minlength=maxRank + 2)
+    z = registers * self._tau(1.0 - counts[maxRank + 1] / registers)
+    for rank in range(maxRank, 0, -1):
+      z = 0.5 * (z + counts[rank])
+    z += registers * self._sigma(counts[0] / registers)
+    if math.isinf(z):
+      return 0
+    return int(round(registers * registers / (2 * math.log(2) * z)))
+
+  @staticmethod
+  def _sigma(x: float) -> float:
+    # the correction of the empty registers, x + sum(x^(2^k) * 2^(k-1))
+    if x == 1.0:
+      return math.inf
+    y = 1.0
+    z = x
+    while True:
+      x *= x
+      previous = z
+      z += x * y
+      y += y
+      if z == previous:
+        return z
+
+  @staticmethod
+  def _tau(x: float) -> float:
+    # the correction of the saturated registers
+    if x == 0.0 or x == 1.0:
+      return 0.0
+    y = 1.0
+    z = 1.0 - x
+    while True:
+      x = math.sqrt(x)
+      previous = z
+      y *= 0.5
+      z -= (1.0 - x) ** 2 * y
+      if z == previous:
+        return z / 3
+
+  def _hash(self, value: Any) -> int:
+    valueType = type(value)
+    if valueType is float:
+      if value != value:
+        return HLL_NAN_HASH
+      if value.is_integer() and -INT64_SUM_BOUND <= value < INT64_SUM_BOUND:
+        value = int(value)
+        valueType = int
+      else:
+        return _splitmix64(struct.unpack('<Q', struct.pack('<d', value))[0] ^ HLL_FLOAT_TAG)
+    if valueType is int and -INT64_SUM_BOUND <= value < INT64_SUM_BOUND:
+      return _splitmix64(value & HLL_HASH_MASK)
+    if isinstance(value, bool):
+      return HLL_BOOLEAN_HASHES[value]
+    if isinstance(value, str):
+      data = b's' + value.encode('utf-8', 'surrogatepass')
+    else:
+      data = b'o' + repr(_group_key(value)).encode()
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little')
+
+  def _hash_array(self, array: np.ndarray) -> np.ndarray:
+    # _hash() of the int64 or float64 array of the numeric values
+    if array.dtype.kind != 'f':
+      return _splitmix64_array(array.view(np.uint64))
+    isNaN = np.isnan(array)
+    isInteger = (array == np.trunc(array)) & (array >= -float(INT64_SUM_BOUND)) & (array < float(INT64_SUM_BOUND))
+    floats = array[~isInteger & ~isNaN].view(np.uint64) ^ np.uint64(HLL_FLOAT_TAG)
+    hashes = [_splitmix64_array(array[isInteger].astype(np.int64).view(np.uint64)), _splitmix64_array(floats)]
+    if isNaN.any():
+      hashes.append(np.array([HLL_NAN_HASH], dtype=np.uint64))
+    return np.concatenate(hashes)
+
+
+class FireSQLQuantileSketch():
+  """
+  FireSQLQuantileSketch is a KLL sketch of numeric values (Karnin, Lang and Liberty, 2016).
+
+  The values are kept in compactors, the values of level h weighing 2**h each. When the sketch is full, the
+  lowest level over its capacity is sorted and every other value, from the first or the second, is promoted
+  to the next level. The capacities decrease by 2/3 from the top level down to the lowest, so the sketch
+  keeps at most about 3 * k values, and the rank of a quantile is off by about 1.65 / k of the values.
+  The smallest and the largest values are kept apart, they are the quantiles 0 and 1.
+  """
+
+  def __init__(self, k: int = KLL_K):
+    """
+    Args:
+      k (int): the capacity of the top level
+    """
+    self.k = k
+    self.compactors = []
+    self.size = 0
+    self.maxSize = 0
+    self.minValue = None
+    self.maxValue = None
+    self.coins = random.Random(KLL_SEED)
+    self._grow()
+
+  def _grow(self):
+    self.compactors.append([])
+    self.maxSize = sum(self._capacity(level) for level in range(len(self.compactors)))
+
+  def _capacity(self, level: int) -> int:
+    depth = len(self.compactors) - level - 1
+    return int(math.ceil(self.k * KLL_CAPACITY_RATIO ** depth)) + 1
+
+  def update(self, value: Any):
+    self._bound(value, value)
+    self.compactors[0].append(value)
+    self.size += 1
+    if self.size >= self.maxSize:
+      self._compress()
+
+  def extend(self, values: List):
+    # a batch of values compacted together, a compaction errs by at most one weight whatever its size
+    if not values:
+      return
+    self._bound(min(values), max(values))
+    self.compactors[0].extend(values)
+    self.size += len(values)
+    self._compress()
+
+  def merge(self, other: 'FireSQLQuantileSketch'):
+    while len(self.compactors) < len(other.compactors):
+      self._grow()
+    for level, values in enumerate(other.compactors):
+      self.compactors[level].extend(values)
+    self.size += other.size
+    if other.size:
+      self._bound(other.minValue, other.maxValue)
+    self._compress()
+
+  def _bound(self, minValue: Any, maxValue: Any):
+    if self.minValue is None or minValue < self.minValue:
+      self.minValue = minValue
+    if self.maxValue is None or maxValue > self.maxValue:
+      self.maxValue = maxValue
+
+  def _compress(self):
+    while self.size >= self.maxSize:
+      for level, values in enumerate(self.compactors):
+        if len(values) >= self._capacity(level):
+          if level + 1 == len(self.compactors):
+            self._grow()
+          values.sort()
+          # an odd value stays at its level
+          odd = len(values) % 2
+          promoted = values[odd + self.coins.getrandbits(1)::2]
+          self.compactors[level + 1].extend(promoted)
+          del values[odd:]
+          self.size -= len(promoted)
+          break
+
+  def quantile(self, fraction: float) -> Any:
+    """
+    Args:
+      fraction (float): the quantile, between 0 and 1
+
+    Returns:
+      Any: the value of that weighted rank, None without any values
+    """
+    if fraction <= 0 or fraction >= 1:
+      return self.minValue if fraction <= 0 else self.maxValue
+    weighted = sorted((value, 1 << level) for level, values in enumerate(self.compactors) for value in values)
+    if not weighted:
+      return None
+    rank = fraction * sum(weight for (_, weight) in weighted)
+    total = 0
+    for value, weight in weighted:
+      total += weight
+      if total >= rank:
+        return value
+    return weighted[-1][0]
+
+
+class FireSQLApproxPercentile(FireSQLAccumulator):
+  """
+  The approximate percentile of the numeric values, by a KLL sketch of at most about 600 values whatever
+  the number of values. The value returned is one of the values, its rank is within 1.5% of the values of
+  the exact rank 99% of the time. NaN is left out and the percentile is None without any numeric values.
+  The sketches of partitions are merged with the same error bound as the sketch of all the values.
+  """
+
+  def __init__(self, fraction: float):
+    """
+    Args:
+      fraction (float): the percentile, between 0 and 1, 0.5 for the median
+    """
+    self.fraction = fraction
+
+  def init(self) -> FireSQLQuantileSketch:
+    return FireSQLQuantileSketch()
+
+  def update(self, state: FireSQLQuantileSketch, value: Any) -> FireSQLQuantileSketch:
+    if _is_numeric(value) and value == value:
+      state.update(value)
+    return state
+
+  def update_column(self, state: FireSQLQuantileSketch, column: FireSQLColumn) -> FireSQLQuantileSketch:
+    values = column.numericValues
+    array = column.array
+    if array is None or (array.dtype.kind == 'f' and np.isnan(array).any()):
+      # NaN is not ordered
+      values = [value for value in values if value == value]
+    state.extend(values)
+    return state
+
+  def merge(self, state: FireSQLQuantileSketch, other: FireSQLQuantileSketch) -> FireSQLQuantileSketch:
+    state.merge(other)
+    return state
+
+  def finalize(self, state: FireSQLQuantileSketch) -> Any:
+    return state.quantile(self.fraction)
+
+
+# the accumulators of the aggregation functions, by function name
+AGGREGATION_ACCUMULATORS = {
+  'count': FireSQLCount(),
+  'count_distinct': FireSQLCountDistinct(),
+  'sum': FireSQLSum(),
+  'avg': FireSQLAvg(),
+  'min': FireSQLMin(),
+  'max': FireSQLMax(),
+  'approx_count_distinct': FireSQLApproxCountDistinct(),
+  'approx_median': FireSQLApproxPercentile(0.5),
+}
+
 
 class FireSQLAggregate():
+  """
+  FireSQLAggregate is a streaming aggregation operator, of the aggregations without GROUP BY.
 
-  def __init__(self):
-    self.aggregationLookup = {
-      'count': self.count,
-      'sum': self.sum,
-      'avg': self.avg,
-      'min': self.min,
-      'max': self.max,
-    }
+  The rows are added one at a time, as they are read. Their aggregated values are batched by
+  column, and all the aggregations are updated once per batch, vectorized on the columns of the
+  large batches. Only the accumulator states are kept, not the rows.
+  """
+
+  def __init__(self, aggregations: List[Tuple[str, str]], names: List[str] = None):
+    """
+    Args:
+      aggregations (List[Tuple]): the `(func, field)` to compute
+      names (List[str]): the result name of each aggregation, `fieldName(func, field)` by default
+    """
+    self.aggregations = aggregations
+    self.names = names if names is not None else [FireSQLAggregate.fieldName(func, field) for (func, field) in aggregations]
+    self.accumulators = [FireSQLAggregate.accumulator(func) for (func, _) in aggregations]
+    self.states = [accumulator.init() for accumulator in self.accumulators]
+    # the values of the batched rows, by aggregated field
+    self.batch = {field: [] for (_, field) in aggregations if field != '*'}
+    self.batchRows = 0
 
   @classmethod
   def fieldName(cls, func, column):
+    if func == 'count_distinct':
+      return 'count(distinct {})'.format(column)
+    if func.startswith(APPROX_PERCENTILE + ':'):
+      return '{}({}, {})'.format(APPROX_PERCENTILE, column, func.split(':', 1)[1])
     fieldName = '{}({})'.format(func, column)
     return fieldName
 
+  @classmethod
+  def accumulator(cls, func: str) -> FireSQLAccumulator:
+    if func.startswith(APPROX_PERCENTILE + ':'):
+      return FireSQLApproxPercentile(float(func.split(':', 1)[1]))
+    if func not in AGGREGATION_ACCUMULATORS:
+      raise Exception(f"unsupported aggregation function '{func}'")
+    return AGGREGATION_ACCUMULATORS[func]
+
+  @classmethod
+  def isServerAggregation(cls, func, column) -> bool:
+    # Firestore aggregation queries compute COUNT(*), SUM(field) and AVG(field)
+    if func == 'count':
+      return column == '*'
+    return func in ('sum', 'avg') and column != '*'
+
   @classmethod
   def hasAggregation(cls, aggregationFields: Dict) -> bool:
     for part in aggregationFields.keys():
@@ -24,59 +665,114 @@ class FireSQLAggregate():
         return True
     return False
 
-  def aggregation(self, aggregationFields: Dict, documents: Dict) -> List:
-    if FireSQLAggregate.hasAggregation(aggregationFields):
-      adoc = {}
-      for part in aggregationFields.keys():
-        if aggregationFields[part]:
-          for func, column in aggregationFields[part]:
-            aggregationFunc = self.aggregationLookup[func]
-            fieldName = FireSQLAggregate.fieldName(func, column)
-            adoc[fieldName] = aggregationFunc(documents, column)
-
-      return [adoc]
-    else:
-      return documents
+  def add(self, getValue: Callable[[str], Any]):
+    """
+    Accumulate a row.
 
-  def count(self, documents, column):
-    return len(documents)
+    Args:
+      getValue (Callable): returns the value of a field of the row
+    """
+    for field, values in self.batch.items():
+      values.append(getValue(field))
+    self.batchRows += 1
+    if self.batchRows >= AGGREGATE_BATCH_ROWS:
+      self.flush()
 
-  def sum(self, documents, column):
-    total = 0
-    for doc in documents:
-      value = doc[column]
-      if isinstance(value, int) or isinstance(value, float):
-        total += value
-    return total
-
-  def avg(self, documents, column):
-    count = 0
-    total = 0
-    for doc in documents:
-      value = doc[column]
-      if isinstance(value, int) or isinstance(value, float):
-        count += 1
-        total += value
-    if count > 0:
-      return float(total) / float(count)
-    else:
-      return 0
+  def flush(self):
+    """
+    Update the aggregations with the batched rows, each field converted once for all its aggregations.
+    """
+    if not self.batchRows:
+      return
+    # COUNT(*) counts every row
+    columns = {'*': FireSQLColumn([True] * self.batchRows)}
+    for field, values in self.batch.items():
+      columns[field] = FireSQLColumn(values)
+    for i, (accumulator, (_, field)) in enumerate(zip(self.accumulators, self.aggregations)):
+      self.states[i] = accumulator.update_column(self.states[i], columns[field])
+    self.batch = {field: [] for field in self.batch}
+    self.batchRows = 0
+
+  def merge(self, other: 'FireSQLAggregate'):
+    """
+    Combine the partial aggregations of other rows, e.g. of a parallel partition, of the same aggregations.
+
+    Args:
+      other (FireSQLAggregate): the partial aggregations
+    """
+    self.flush()
+    other.flush()
+    for i, accumulator in enumerate(self.accumulators):
+      self.states[i] = accumulator.merge(self.states[i], other.states[i])
+
+  def results(self) -> Dict:
+    """
+    Returns:
+      Dict: the aggregated value of each aggregation, by its field name
+    """
+    self.flush()
+    return {name: accumulator.finalize(state) for (name, accumulator, state) in zip(self.names, self.accumulators, self.states)}
+
+
+class FireSQLGroupBy():
+  """
+  FireSQLGroupBy is a streaming hash aggregation operator for GROUP BY.
+
+  The rows are added one at a time, as they are read, and only one accumulator
+  per aggregation is kept for each group instead of the rows themselves.
+  """
+
+  def __init__(self, groupFields: List[str], aggregations: List[Tuple[str, str]]):
+    """
+    Args:
+      groupFields (List[str]): the fields of the group key
+      aggregations (List[Tuple]): the `(func, field)` to compute for each group
+    """
+    self.groupFields = groupFields
+    self.aggregations = aggregations
+    self.accumulators = [FireSQLAggregate.accumulator(func) for (func, _) in aggregations]
+    self.groups = {}
+
+  def add(self, getValue: Callable[[str], Any]):
+    """
+    Accumulate a row into its group.
+
+    Args:
+      getValue (Callable): returns the value of a field of the row
+    """
+    values = tuple(getValue(field) for field in self.groupFields)
+    key = tuple(_group_key(value) for value in values)
+    group = self.groups.get(key)
+    if group is None:
+      group = (values, [accumulator.init() for accumulator in self.accumulators])
+      self.groups[key] = group
+    states = group[1]
+    for i, (accumulator, (_, field)) in enumerate(zip(self.accumulators, self.aggregations)):
+      # COUNT(*) counts every row
+      value = getValue(field) if field != '*' else True
+      states[i] = accumulator.update(states[i], value)
+
+  def merge(self, other: 'FireSQLGroupBy'):
+    """
+    Combine the groups of other rows, e.g. of a parallel partition, of the same GROUP BY.
+    The new groups of the other rows come after the groups of these rows.
+
+    Args:
+      other (FireSQLGroupBy): the partial groups
+    """
+    for key, (values, otherStates) in other.groups.items():
+      group = self.groups.get(key)
+      if group is None:
+        self.groups[key] = (values, list(otherStates))
+        continue
+      states = group[1]
+      for i, accumulator in enumerate(self.accumulators):
+        states[i] = accumulator.merge(states[i], otherStates[i])
 
-  def min(self, documents, column):
-    minValue = sys.maxsize
-    for doc in documents:
-      value = doc[column]
-      if isinstance(value, int) or isinstance(value, float):
-        if value < minValue:
-          minValue = value
-    return minValue
-
-  def max(self, documents, column):
-    # 2's compliment binary of maxsize is minsize
-    maxValue = ~sys.maxsize
-    for doc in documents:
-      value = doc[column]
-      if isinstance(value, int) or isinstance(value, float):
-        if value > maxValue:
-          maxValue = value
-    return maxValue 
+  def results(self) -> Iterator[Tuple[Tuple, List]]:
+    """
+    Returns:
+      Iterator: the `(group values, aggregated values)` of each group, in order of appearance
+    """
+    for values, states in self.groups.values():
+      yield values, [accumulator.finalize(state) for (accumulator, state) in zip(self.accumulators, states)]
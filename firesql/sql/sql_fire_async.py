@@ -0,0 +1,312 @@
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Dict, Iterable, List, Optional, Tuple
+
+from .sql_plan import compile_conjunctions
+from .sql_order import FireSQLOrderBy, is_missing_index_error
+from .sql_fire_client import FireSQLAsyncAbstractClient, query_documents, collection_documents
+from .sql_fire_query import SQLFireQuery
+from .sql_fire_update import SQLFireUpdate
+from .sql_fire_insert import SQLFireInsert
+from .sql_fire_delete import SQLFireDelete
+from .sql_fire_explain import SQLFireExplain
+
+# the maximum number of Firestore requests of a statement awaited at once
+ASYNC_MAX_CONCURRENCY = 32
+
+
+async def _aiter(items: Iterable) -> AsyncIterator:
+  for item in items:
+    yield item
+
+
+class SQLFireAsyncExecutor():
+  """
+  SQLFireAsyncExecutor executes a compiled and bound Firestore command with an async client.
+
+  The command plans the reads and post-processes the documents the same as with
+  `FireSQL.execute`, only the Firestore requests are awaited. Independent requests
+  (the conjunctions of an OR, the lookup queries of a JOIN, the writes of an UPDATE
+  or DELETE) are awaited concurrently, at most `maxConcurrency` at once.
+  """
+
+  def __init__(self, client: FireSQLAsyncAbstractClient, fireCommand: Any, maxConcurrency: int = None):
+    self.client = client
+    self.fireCommand = fireCommand
+    if maxConcurrency is None:
+      maxConcurrency = getattr(fireCommand, 'options', {}).get('asyncMaxConcurrency', ASYNC_MAX_CONCURRENCY)
+    self.semaphore = asyncio.Semaphore(maxConcurrency)
+
+  async def _gather(self, coroutines: List[Awaitable]) -> List:
+    # the results of the coroutines in order, bounded by the semaphore
+    async def _bounded(coroutine):
+      async with self.semaphore:
+        return await coroutine
+    return await asyncio.gather(*[_bounded(coroutine) for coroutine in coroutines])
+
+  async def execute(self) -> List:
+    """
+    Returns:
+      docs: A list of executed documents, as `FireSQL.execute_fire_command`
+    """
+    fireCommand = self.fireCommand
+    if isinstance(fireCommand, SQLFireExplain):
+      if fireCommand.analyze:
+        raise Exception('EXPLAIN ANALYZE is not supported by async execution')
+      return fireCommand.post_process()
+
+    if isinstance(fireCommand, SQLFireInsert):
+      if fireCommand.is_valid():
+        document = fireCommand.post_process()
+        docId = self.client.generate_collection_document_id(fireCommand.part)
+        if docId:
+          fireCommand.result = await self.client.set_collection_document(fireCommand.part, docId, document)
+        # assign docid back to document and return
+        document['docid'] = docId
+        return [document]
+      else:
+        return []
+
+    queries = fireCommand.fireQueries
+    fireQueries = fireCommand.firebase_queries(queries)
+    filterQueries = fireCommand.filter_queries(queries)
+    documents = await self.execute_query(fireQueries)
+    filterDocuments = fireCommand.filter_documents(documents, filterQueries)
+
+    if isinstance(fireCommand, SQLFireUpdate):
+      rows = fireCommand.update_rows(filterDocuments)
+      await self._gather([self.client.update_collection_document(fireCommand.defaultPart, docId, updateDoc)
+                          for docId, _, updateDoc in rows if updateDoc])
+      fireCommand.result = fireCommand._success_result()
+      return [jdoc for _, jdoc, _ in rows]
+    elif isinstance(fireCommand, SQLFireDelete):
+      rows = fireCommand.delete_rows(filterDocuments)
+      await self._gather([self.client.delete_collection_document(fireCommand.defaultPart, docId)
+                          for docId, jdoc in rows if jdoc])
+      fireCommand.result = fireCommand._success_result()
+      return [jdoc for _, jdoc in rows]
+    else:
+      return fireCommand.post_process(filterDocuments)
+
+  async def execute_query(self, fireQueries: Dict) -> Dict:
+    """
+    The documents of each part, as `SQLFireQuery.execute_query`. The parts that do not
+    depend on the documents of another part are read concurrently.
+
+    Args:
+      fireQueries (Dict): the Firestore conjunctions of each part
+    Returns:
+      Dict: the documents of each part
+    """
+    fireQuery: SQLFireQuery = self.fireCommand
+    fireQuery.aggregates = await self._execute_aggregation_query(fireQueries)
+    if fireQuery.aggregates is not None:
+      # computed by Firestore, no document to read
+      return {part: {} for part in fireQueries}
+
+    if fireQuery.groupBy and not fireQuery.joins:
+      # hash aggregation of the documents as they are read, they are not kept
+      part = fireQuery.defaultPart
+      fireQuery.groups = fireQuery._group_operator(lambda part, field: field)
+      async for docId, doc in self._stream_part_documents(part, fireQueries.get(part, []), fireQuery._projection_fields(part)):
+        fireQuery.groups.add(lambda field: fireQuery._document_value(docId, doc, field))
+      return {part: {}}
+
+    if fireQuery._streams_aggregation():
+      # all the aggregations are updated as the documents are read, they are not kept
+      part = fireQuery.defaultPart
+      aggregate = fireQuery._aggregate_operator(lambda part, field: field)
+      async for docId, doc in self._stream_part_documents(part, fireQueries.get(part, []), fireQuery._projection_fields(part)):
+        aggregate.add(lambda field: fireQuery._document_value(docId, doc, field))
+      fireQuery.aggregates = aggregate.results()
+      return {part: {}}
+
+    joinOrder = fireQuery._join_order(fireQueries) or []
+    lookups = [step for step in joinOrder if step[2] is not None]
+    lookupParts = [part for (part, _, _, _) in lookups]
+    parts = [part for part in fireQueries if part not in lookupParts]
+    results = await asyncio.gather(*[self._execute_part_query(part, fireQueries[part]) for part in parts])
+    documents = dict(zip(parts, results))
+
+    while lookups:
+      # index-nested-loop joins, only fetch the documents matching the join keys of the driving part.
+      # The parts driven by parts already read are looked up concurrently
+      ready = [step for step in lookups if step[2] in documents]
+      lookups = [step for step in lookups if step[2] not in documents]
+      results = await asyncio.gather(*[
+        self._execute_join_lookup(part, field, fireQueries[part], fireQuery._join_keys(documents[drivingPart], drivingPart, drivingField))
+        for (part, field, drivingPart, drivingField) in ready])
+      documents.update(zip([part for (part, _, _, _) in ready], results))
+    return documents
+
+  async def _execute_aggregation_query(self, fireQueries: Dict) -> Optional[Dict]:
+    fireQuery: SQLFireQuery = self.fireCommand
+    aggregations = fireQuery._server_aggregations(fireQueries)
+    if aggregations is None:
+      return None
+    conjunctions = fireQueries.get(fireQuery.defaultPart, [])
+    if conjunctions:
+      values = await self.client.aggregate_by_where_tuples(fireQuery.collections[fireQuery.defaultPart], conjunctions[0], aggregations)
+      if values is None:
+        return None
+    else:
+      # contradiction, nothing to aggregate
+      values = [None] * len(aggregations)
+    return fireQuery._aggregation_values(aggregations, values)
+
+  async def _execute_part_query(self, part: str, conjunctions: List) -> Dict:
+    fireQuery: SQLFireQuery = self.fireCommand
+    fields = fireQuery._projection_fields(part)
+    count = fireQuery._limit_count()
+    if count is not None and fireQuery._is_part_result(part):
+      return await self._execute_part_top(part, conjunctions, fields, count)
+    if any(not conjunction for conjunction in conjunctions):
+      # a conjunction without firestore query needs the whole collection anyway
+      return await self._get_part_collection(part, fields)
+    # an empty list of conjunctions cannot match, nothing is read
+    documents = {}
+    for results in await self._gather([self._query_conjunction(part, conjunction, fields) for conjunction in conjunctions]):
+      documents.update(results)
+    return documents
+
+  async def _query_conjunction(self, part: str, conjunction: List, fields: Optional[List]) -> Dict:
+    fireQuery: SQLFireQuery = self.fireCommand
+    collectionName = fireQuery.collections[part]
+    if not any(field == 'docid' for (field, _, _) in conjunction):
+      return await query_documents(self.client, collectionName, conjunction, fields=fields)
+
+    docIds, residualQueries, fields = fireQuery._docid_conjunction(conjunction, fields)
+    if docIds is not None:
+      documents = await self._get_documents_by_ids(part, docIds, fields)
+    else:
+      queries = [query for query in residualQueries if query[0] != 'docid']
+      if queries:
+        documents = await query_documents(self.client, collectionName, queries, fields=fields)
+      else:
+        documents = await self._get_part_collection(part, fields)
+    matches = compile_conjunctions([residualQueries])
+    return {docId: doc for docId, doc in documents.items() if matches(docId, doc)}
+
+  async def _get_part_collection(self, part: str, fields: Optional[List]) -> Dict:
+    fireQuery: SQLFireQuery = self.fireCommand
+    collectionName = fireQuery.collections[part]
+    scan = fireQuery._scan_partitions()
+    if scan is None:
+      return await collection_documents(self.client, collectionName, fields=fields)
+    partitions, workers = scan
+    return {docId: doc async for docId, doc in self.client.scan_collection_documents(collectionName, fields=fields, partitions=partitions, workers=workers)}
+
+  async def _get_documents_by_ids(self, part: str, docIds: List, fields: Optional[List]) -> Dict:
+    fireQuery: SQLFireQuery = self.fireCommand
+    docIds = fireQuery._distinct_doc_ids(docIds)
+    if not docIds:
+      return {}
+    documents = await self.client.get_collection_documents_by_ids(fireQuery.collections[part], docIds, fields=fields)
+    fireQuery._add_missing_doc_ids(part, docIds, documents)
+    return documents
+
+  async def _execute_part_top(self, part: str, conjunctions: List, fields: Optional[List], count: int) -> Dict:
+    # the first `count` result documents, as `SQLFireQuery._execute_part_top`
+    if count == 0:
+      return {}
+    orderBy, pushdown = self.fireCommand._top_order(part, conjunctions)
+    stream = self._stream_part_documents(part, conjunctions, fields,
+                                         orderBy=orderBy if pushdown else None,
+                                         limit=count if pushdown else None)
+    items = []
+    try:
+      if orderBy:
+        order = FireSQLOrderBy(orderBy)
+        async for item in stream:
+          if order.has_document_fields(item):
+            items.append(item)
+            if len(items) >= 2 * count:
+              # at most 2 * count documents are kept
+              items = order.top(items, count, key=order.document_key)
+        items = order.top(items, count, key=order.document_key)
+      else:
+        async for item in stream:
+          items.append(item)
+          if len(items) >= count:
+            break
+    finally:
+      await stream.aclose()
+    return dict(items)
+
+  async def _stream_ordered_query(self, collectionName: str, conjunction: List, fields: Optional[List],
+                                  orderBy: List, limit: Optional[int]) -> AsyncIterator[Tuple[str, Dict]]:
+    # the query ordered and limited by Firestore, or on the client when Firestore rejects
+    # the ordered query for a missing composite index, before any document is returned
+    stream = self.client.stream_document_by_where_tuples(collectionName, conjunction, fields=fields, orderBy=orderBy, limit=limit).__aiter__()
+    try:
+      first = await stream.__anext__()
+    except StopAsyncIteration:
+      return
+    except Exception as e:
+      if not is_missing_index_error(e):
+        raise
+      items = [item async for item in self.client.stream_document_by_where_tuples(collectionName, conjunction, fields=fields)]
+      for item in FireSQLOrderBy(orderBy).order_documents(items, limit):
+        yield item
+      return
+    yield first
+    async for item in stream:
+      yield item
+
+  async def _stream_part_documents(self, part: str, conjunctions: List, fields: Optional[List],
+                                   orderBy: List = None, limit: int = None) -> AsyncIterator[Tuple[str, Dict]]:
+    # the (docId, doc) of the part matching its conjunctions and client-side filters, as they are read
+    fireQuery: SQLFireQuery = self.fireCommand
+    collectionName = fireQuery.collections[part]
+    filterConjunctions = fireQuery.filter_queries(fireQuery.fireQueries).get(part)
+    matches = compile_conjunctions(filterConjunctions) if filterConjunctions else None
+    # a document matching several conjunctions is returned once
+    seen = set() if len(conjunctions) > 1 else None
+    scan = fireQuery._scan_partitions()
+    for conjunction in conjunctions:
+      if any(field == 'docid' for (field, _, _) in conjunction):
+        # not a query, the documents are ordered and limited by the caller
+        stream = _aiter((await self._query_conjunction(part, conjunction, fields)).items())
+      elif not conjunction and scan is not None and not orderBy and limit is None:
+        # the collection key ranges are read concurrently
+        partitions, workers = scan
+        stream = self.client.scan_collection_documents(collectionName, fields=fields, partitions=partitions, workers=workers)
+      elif orderBy:
+        stream = self._stream_ordered_query(collectionName, conjunction, fields, orderBy, limit)
+      else:
+        stream = self.client.stream_document_by_where_tuples(collectionName, conjunction, fields=fields, limit=limit)
+      async for docId, doc in stream:
+        if seen is not None:
+          if docId in seen:
+            continue
+          seen.add(docId)
+        if matches is not None and not matches(docId, doc):
+          continue
+        yield docId, doc
+
+  async def _execute_join_lookup(self, part: str, field: str, conjunctions: List, keys: List) -> Dict:
+    # the documents of the part matching the join keys, as `SQLFireQuery._iter_join_lookup`,
+    # with the lookup queries awaited concurrently
+    fireQuery: SQLFireQuery = self.fireCommand
+    if not conjunctions or not keys:
+      # inner join with nothing on the other side
+      return {}
+    if fireQuery._join_lookup_scans(part, field, conjunctions, keys):
+      return {docId: doc async for docId, doc in self._stream_part_documents(part, conjunctions, fireQuery._projection_fields(part))}
+
+    if field == 'docid':
+      # a single batched get of all the keys, the part queries are evaluated on the documents
+      residualQueries = [query for conjunction in conjunctions for query in conjunction]
+      matches = compile_conjunctions(conjunctions)
+      documents = await self._get_documents_by_ids(part, keys, fireQuery._projection_fields(part, residualQueries))
+      return {docId: doc for docId, doc in documents.items() if matches(docId, doc)}
+
+    lookups = fireQuery._join_lookup_conjunctions(field, conjunctions, keys)
+    results = await self._gather([self._query_conjunction(part, lookupConjunction, fireQuery._projection_fields(part, residualQueries))
+                                  for lookupConjunction, residualQueries in lookups])
+    documents = {}
+    for (_, residualQueries), lookupDocuments in zip(lookups, results):
+      matches = compile_conjunctions([residualQueries])
+      for docId, doc in lookupDocuments.items():
+        if docId not in documents and matches(docId, doc):
+          documents[docId] = doc
+    return documents
@@ -1,5 +1,41 @@
+import asyncio
+import functools
+import inspect
+import itertools
 from abc import ABC, abstractmethod
-from typing import Any, List, Dict
+from typing import Any, AsyncIterator, Callable, Iterator, List, Dict, Optional, Tuple
+
+from .sql_order import FireSQLOrderBy
+
+
+@functools.lru_cache(maxsize=None)
+def _takes_fields(function: Callable) -> bool:
+  try:
+    parameters = inspect.signature(function).parameters.values()
+  except (TypeError, ValueError):
+    return True
+  return any(parameter.name == 'fields' or parameter.kind == inspect.Parameter.VAR_KEYWORD for parameter in parameters)
+
+def _call_with_fields(method: Callable, fields: Optional[List], *args) -> Any:
+  # the custom clients written before the field masks implement `query_document_by_where_tuples`
+  # and `get_collection_documents` without the `fields` parameter, they return whole documents
+  if _takes_fields(getattr(method, '__func__', method)):
+    return method(*args, fields=fields)
+  return method(*args)
+
+def query_documents(client: Any, collectionName: str, queries: List, fields: List = None) -> Any:
+  """
+  `client.query_document_by_where_tuples()` with the `fields` mask, if the client supports field masks.
+  The result of an async client is awaitable.
+  """
+  return _call_with_fields(client.query_document_by_where_tuples, fields, collectionName, queries)
+
+def collection_documents(client: Any, collectionName: str, fields: List = None) -> Any:
+  """
+  `client.get_collection_documents()` with the `fields` mask, if the client supports field masks.
+  The result of an async client is awaitable.
+  """
+  return _call_with_fields(client.get_collection_documents, fields, collectionName)
 
 
 class FireSQLAbstractClient(ABC):
@@ -20,15 +56,78 @@ class FireSQLAbstractClient(ABC):
     pass
 
   @abstractmethod
-  def query_document_by_where_tuples(self, collectionName: str, queries: List) -> Dict:
+  def query_document_by_where_tuples(self, collectionName: str, queries: List, fields: List = None) -> Dict:
+    """
+    Query the collection documents by a conjunction of `[field, operator, value]`.
+
+    `fields` is the field mask of the returned documents: None returns whole documents
+    and an empty list only the document Ids (with empty documents).
+    """
     pass
 
+  def stream_document_by_where_tuples(self, collectionName: str, queries: List, fields: List = None,
+                                      orderBy: List[Tuple[str, str]] = None, limit: int = None) -> Iterator[Tuple[str, Dict]]:
+    """
+    Stream the `(docId, document)` of the collection documents matching a conjunction of
+    `[field, operator, value]`, an empty conjunction streams the whole collection.
+
+    The documents are ordered by `orderBy`, a list of `(field, direction)`, and only the
+    first `limit` ones are returned. As in Firestore, documents without an `orderBy` field
+    are left out. Clients that cannot order nor limit on the server fall back to
+    fetching all the matching documents.
+    """
+    if queries:
+      documents = query_documents(self, collectionName, queries, fields=fields)
+    else:
+      documents = collection_documents(self, collectionName, fields=fields)
+    items = documents.items()
+    if orderBy:
+      order = FireSQLOrderBy(orderBy)
+      items = order.sort(filter(order.has_document_fields, items), key=order.document_key)
+    if limit is not None:
+      items = itertools.islice(items, limit)
+    yield from items
+
+  def aggregate_by_where_tuples(self, collectionName: str, queries: List, aggregations: List[Tuple[str, str]]) -> Optional[List]:
+    """
+    Compute aggregations over the collection documents matching a conjunction of `[field, operator, value]`
+    on the server, without reading the documents.
+
+    `aggregations` is a list of `(function, field)`, function being `count` (field `*`), `sum` or `avg`.
+    It returns the value of each aggregation, or None if the client cannot aggregate on the server;
+    the aggregations are then computed on the fetched documents.
+    """
+    return None
+
+  def scan_collection_documents(self, collectionName: str, fields: List = None, partitions: int = 1, workers: int = 1) -> Iterator[Tuple[str, Dict]]:
+    """
+    Stream the `(docId, document)` of the whole collection, split into `partitions` document Id
+    key ranges read in parallel by `workers` readers. The documents of the partitions are interleaved.
+
+    Clients that cannot partition a collection fall back to reading it at once.
+    """
+    yield from collection_documents(self, collectionName, fields=fields).items()
+
+  def get_collection_documents_by_ids(self, collectionName: str, docIds: List[str], fields: List = None) -> Dict:
+    """
+    Get the collection documents by their Ids, the Ids of missing documents are left out.
+
+    `fields` is the field mask of the returned documents, as in `query_document_by_where_tuples`.
+    Clients without a batched get fall back to getting the documents one by one.
+    """
+    documents = {}
+    for docId in docIds:
+      document = self.get_collection_document(collectionName, docId)
+      if document:
+        documents[docId] = document
+    return documents
+
   @abstractmethod
   def get_collection_document(self, collectionName: str, docId: str) -> Dict:
     pass
 
   @abstractmethod
-  def get_collection_documents(self, collectionName: str) -> Dict:
+  def get_collection_documents(self, collectionName: str, fields: List = None) -> Dict:
     pass
 
   @abstractmethod
@@ -66,17 +165,41 @@ class FireSQLClient(FireSQLAbstractClient):
   def get_collection_ref(self, collectionName: str): 
     return self.client.get_collection_ref(collectionName)
 
-  def query_document_by_where_tuples(self, collectionName: str, queries: List) -> Dict:
+  def query_document_by_where_tuples(self, collectionName: str, queries: List, fields: List = None) -> Dict:
     collectionRef = self.get_collection_ref(collectionName)
-    return self.client.query_document_by_where_tuples(collectionRef, queries)
+    return self.client.query_document_by_where_tuples(collectionRef, queries, fields=fields)
   
+  def stream_document_by_where_tuples(self, collectionName: str, queries: List, fields: List = None,
+                                      orderBy: List[Tuple[str, str]] = None, limit: int = None) -> Iterator[Tuple[str, Dict]]:
+    if any(field == 'docid' for (field, _, _) in queries):
+      # document id lookups are not queries, order and limit them here
+      yield from super().stream_document_by_where_tuples(collectionName, queries, fields=fields, orderBy=orderBy, limit=limit)
+      return
+    collectionRef = self.get_collection_ref(collectionName)
+    yield from self.client.stream_document_by_where_tuples(collectionRef, queries, fields=fields, order_by=orderBy, limit=limit)
+
+  def aggregate_by_where_tuples(self, collectionName: str, queries: List, aggregations: List[Tuple[str, str]]) -> Optional[List]:
+    if any(field == 'docid' for (field, _, _) in queries):
+      # document id lookups are not queries
+      return None
+    collectionRef = self.get_collection_ref(collectionName)
+    return self.client.aggregate_by_where_tuples(collectionRef, queries, aggregations)
+
+  def scan_collection_documents(self, collectionName: str, fields: List = None, partitions: int = 1, workers: int = 1) -> Iterator[Tuple[str, Dict]]:
+    collectionRef = self.get_collection_ref(collectionName)
+    yield from self.client.stream_collection_partitions(collectionRef, partitions, workers, fields=fields)
+
+  def get_collection_documents_by_ids(self, collectionName: str, docIds: List[str], fields: List = None) -> Dict:
+    collectionRef = self.get_collection_ref(collectionName)
+    return self.client.get_documents(collectionRef, docIds, fields=fields)
+
   def get_collection_document(self, collectionName: str, docId: str) -> Dict:
     collectionRef = self.get_collection_ref(collectionName)
-    return self.client.get_document(collectionRef)
+    return self.client.get_document(collectionRef, docId)
 
-  def get_collection_documents(self, collectionName: str) -> Dict:
+  def get_collection_documents(self, collectionName: str, fields: List = None) -> Dict:
     collectionRef = self.get_collection_ref(collectionName)
-    return self.client.get_collection_documents(collectionRef)
+    return self.client.get_collection_documents(collectionRef, fields=fields)
 
   def generate_collection_document_id(self, collectionName: str):
     collectionRef = self.get_collection_ref(collectionName)
@@ -93,3 +216,168 @@ class FireSQLClient(FireSQLAbstractClient):
   def delete_collection_document(self, collectionName: str, docId: str):
     collectionRef = self.get_collection_ref(collectionName)
     return self.client.delete_document(collectionRef, docId)
+
+
+class FireSQLAsyncAbstractClient(ABC):
+  """
+  FireSQLAsyncAbstractClient is the asyncio counterpart of FireSQLAbstractClient.
+
+  The methods that query, retrieve and write the collection documents are coroutines,
+  `stream_document_by_where_tuples` is an async iterator.
+  """
+
+  @property
+  @abstractmethod
+  def client(self):
+    pass
+
+  @abstractmethod
+  def get_collection_ref(self, collectionName: str):
+    pass
+
+  @abstractmethod
+  async def query_document_by_where_tuples(self, collectionName: str, queries: List, fields: List = None) -> Dict:
+    """
+    Query the collection documents by a conjunction of `[field, operator, value]`,
+    as in `FireSQLAbstractClient.query_document_by_where_tuples`.
+    """
+    pass
+
+  async def stream_document_by_where_tuples(self, collectionName: str, queries: List, fields: List = None,
+                                            orderBy: List[Tuple[str, str]] = None, limit: int = None) -> AsyncIterator[Tuple[str, Dict]]:
+    """
+    Stream the `(docId, document)` of the collection documents matching a conjunction of
+    `[field, operator, value]`, as in `FireSQLAbstractClient.stream_document_by_where_tuples`.
+    """
+    if queries:
+      documents = await query_documents(self, collectionName, queries, fields=fields)
+    else:
+      documents = await collection_documents(self, collectionName, fields=fields)
+    items = documents.items()
+    if orderBy:
+      order = FireSQLOrderBy(orderBy)
+      items = order.sort(filter(order.has_document_fields, items), key=order.document_key)
+    if limit is not None:
+      items = itertools.islice(items, limit)
+    for item in items:
+      yield item
+
+  async def aggregate_by_where_tuples(self, collectionName: str, queries: List, aggregations: List[Tuple[str, str]]) -> Optional[List]:
+    """
+    Compute aggregations on the server, as in `FireSQLAbstractClient.aggregate_by_where_tuples`.
+    """
+    return None
+
+  async def scan_collection_documents(self, collectionName: str, fields: List = None, partitions: int = 1, workers: int = 1) -> AsyncIterator[Tuple[str, Dict]]:
+    """
+    Stream the `(docId, document)` of the whole collection, as in `FireSQLAbstractClient.scan_collection_documents`.
+    """
+    for item in (await collection_documents(self, collectionName, fields=fields)).items():
+      yield item
+
+  async def get_collection_documents_by_ids(self, collectionName: str, docIds: List[str], fields: List = None) -> Dict:
+    """
+    Get the collection documents by their Ids, the Ids of missing documents are left out.
+
+    Clients without a batched get fall back to getting the documents one by one, concurrently.
+    """
+    documents = await asyncio.gather(*[self.get_collection_document(collectionName, docId) for docId in docIds])
+    return {docId: document for docId, document in zip(docIds, documents) if document}
+
+  @abstractmethod
+  async def get_collection_document(self, collectionName: str, docId: str) -> Dict:
+    pass
+
+  @abstractmethod
+  async def get_collection_documents(self, collectionName: str, fields: List = None) -> Dict:
+    pass
+
+  @abstractmethod
+  def generate_collection_document_id(self, collectionName: str):
+    # generated by the client, no request is sent
+    pass
+
+  @abstractmethod
+  async def set_collection_document(self, collectionName: str, docId: str, document: Dict):
+    pass
+
+  @abstractmethod
+  async def update_collection_document(self, collectionName: str, docId: str, document: Dict):
+    pass
+
+  @abstractmethod
+  async def delete_collection_document(self, collectionName: str, docId: str):
+    pass
+
+
+
+class FireSQLAsyncClient(FireSQLAsyncAbstractClient):
+  """
+  FireSQLAsyncClient is an implementation of the abstract asyncio Firebase connection class,
+  for an `AsyncFirebaseClient`.
+  """
+
+  def __init__(self, firebaseClient: Any):
+    self.firebaseClient = firebaseClient
+
+  @property
+  def client(self):
+    return self.firebaseClient
+
+  def get_collection_ref(self, collectionName: str):
+    return self.client.get_collection_ref(collectionName)
+
+  async def query_document_by_where_tuples(self, collectionName: str, queries: List, fields: List = None) -> Dict:
+    collectionRef = self.get_collection_ref(collectionName)
+    return await self.client.query_document_by_where_tuples(collectionRef, queries, fields=fields)
+
+  async def stream_document_by_where_tuples(self, collectionName: str, queries: List, fields: List = None,
+                                            orderBy: List[Tuple[str, str]] = None, limit: int = None) -> AsyncIterator[Tuple[str, Dict]]:
+    if any(field == 'docid' for (field, _, _) in queries):
+      # document id lookups are not queries, order and limit them here
+      stream = super().stream_document_by_where_tuples(collectionName, queries, fields=fields, orderBy=orderBy, limit=limit)
+    else:
+      collectionRef = self.get_collection_ref(collectionName)
+      stream = self.client.stream_document_by_where_tuples(collectionRef, queries, fields=fields, order_by=orderBy, limit=limit)
+    async for item in stream:
+      yield item
+
+  async def aggregate_by_where_tuples(self, collectionName: str, queries: List, aggregations: List[Tuple[str, str]]) -> Optional[List]:
+    if any(field == 'docid' for (field, _, _) in queries):
+      # document id lookups are not queries
+      return None
+    collectionRef = self.get_collection_ref(collectionName)
+    return await self.client.aggregate_by_where_tuples(collectionRef, queries, aggregations)
+
+  async def scan_collection_documents(self, collectionName: str, fields: List = None, partitions: int = 1, workers: int = 1) -> AsyncIterator[Tuple[str, Dict]]:
+    collectionRef = self.get_collection_ref(collectionName)
+    async for item in self.client.stream_collection_partitions(collectionRef, partitions, workers, fields=fields):
+      yield item
+
+  async def get_collection_documents_by_ids(self, collectionName: str, docIds: List[str], fields: List = None) -> Dict:
+    collectionRef = self.get_collection_ref(collectionName)
+    return await self.client.get_documents(collectionRef, docIds, fields=fields)
+
+  async def get_collection_document(self, collectionName: str, docId: str) -> Dict:
+    collectionRef = self.get_collection_ref(collectionName)
+    return await self.client.get_document(collectionRef, docId)
+
+  async def get_collection_documents(self, collectionName: str, fields: List = None) -> Dict:
+    collectionRef = self.get_collection_ref(collectionName)
+    return await self.client.get_collection_documents(collectionRef, fields=fields)
+
+  def generate_collection_document_id(self, collectionName: str):
+    collectionRef = self.get_collection_ref(collectionName)
+    return self.client.generate_document_id(collectionRef)
+
+  async def set_collection_document(self, collectionName: str, docId: str, document: Dict):
+    collectionRef = self.get_collection_ref(collectionName)
+    return await self.client.set_document(collectionRef, docId, document)
+
+  async def update_collection_document(self, collectionName: str, docId: str, document: Dict):
+    collectionRef = self.get_collection_ref(collectionName)
+    return await self.client.update_document(collectionRef, docId, document)
+
+  async def delete_collection_document(self, collectionName: str, docId: str):
+    collectionRef = self.get_collection_ref(collectionName)
+    return await self.client.delete_document(collectionRef, docId)
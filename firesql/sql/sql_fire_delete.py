@@ -1,8 +1,9 @@
-from typing import Dict, List
+from typing import Dict, List, Optional, Set, Tuple
 
 from .sql_objects import (
   SQL_Delete,
 )
+from .sql_projection import compile_row_builder
 
 from .sql_fire_client import FireSQLAbstractClient
 from .sql_fire_query import SQLFireQuery
@@ -17,9 +18,8 @@ class SQLFireDelete(SQLFireQuery):
     self._init_delete_collection_refs(delete, options)
 
     # create queries for each collections (parts)
-    # return a dicitionary of {part -> [queries]}
-    self.fireQueries = {}
-    self._init_query_refs(delete.where, fireQueries=self.fireQueries)
+    # return a dicitionary of {part -> [[queries] OR [queries] ...]}
+    self._init_query_plan(delete.where)
     return self.fireQueries
 
   def _init_delete_collection_refs(self, delete: SQL_Delete, options: Dict = {}):
@@ -33,45 +33,57 @@ class SQLFireDelete(SQLFireQuery):
 
     self.defaultPart = next(iter(self.aliases))
 
+  def collection_access(self) -> Tuple[Set[str], Set[str]]:
+    return set(self.collections.values()), {self.collections[self.defaultPart]}
+
+  def explain(self) -> List[Dict]:
+    plan = super(SQLFireDelete, self).explain()
+    plan.append({'operator': 'delete', 'collection': self.collections[self.defaultPart], 'detail': '',
+                 'estimatedReads': None, 'probe': 'execute'})
+    return plan
+
+  def _projection_fields(self, part: str, queries: List = []) -> Optional[List]:
+    # whole documents are needed
+    return None
+
   def post_process(self, documents: Dict) -> List:
     docs = []
     if self.defaultPart in documents:
       targetDocs = documents[self.defaultPart]
       fields = self.collectionFields[self.defaultPart]
       fields = self._handle_star_fields(self.defaultPart, fields, targetDocs)
+      buildRow = compile_row_builder(fields, dict(self.columnNameMap[self.defaultPart], docid='docid'))
       for docId, doc in targetDocs.items():
-        jdoc = {}
-        for field in fields:
-          if field == 'docid':
-            jdoc['docid'] = docId
-          else:
-            jdoc[ self.columnNameMap[self.defaultPart][field] ] = self._get_field_value(doc, field)
-        docs.append(jdoc)
+        docs.append(buildRow(docId, doc))
 
     return docs
 
   def execute(self, client: FireSQLAbstractClient, documents: List):
     docs = []
+    for docId, jdoc in self.delete_rows(documents):
+      docs.append(jdoc)
+
+      # execute update to docId
+      if jdoc:
+        self.result = client.delete_collection_document(self.defaultPart, docId)
+
+    self.result = self._success_result()
+    return docs
+
+  def delete_rows(self, documents: Dict) -> List[Tuple[str, Dict]]:
+    """
+    Args:
+      documents (Dict): the filtered documents of each part
+    Returns:
+      List: the `(docId, resultDoc)` of each document to delete
+    """
+    rows = []
     if self.defaultPart in documents:
       targetDocs = documents[self.defaultPart]
       fields = self.collectionFields[self.defaultPart]
       fields = self._handle_star_fields(self.defaultPart, fields, targetDocs)
+      buildRow = compile_row_builder(fields, dict(self.columnNameMap[self.defaultPart], docid='docid'))
       for docId, doc in targetDocs.items():
         # jdoc for return list
-        jdoc = {}
-        for field in fields:
-          if field == 'docid':
-            jdoc['docid'] = docId
-          else:
-            jdoc[ self.columnNameMap[self.defaultPart][field] ] = self._get_field_value(doc, field)
-        docs.append(jdoc)
-
-        # execute update to docId
-        if jdoc:
-          self.result = client.delete_collection_document(self.defaultPart, docId)
-
-    self.result = {
-      'success': True,
-      'message': ''
-    }
-    return docs
+        rows.append((docId, buildRow(docId, doc)))
+    return rows
@@ -0,0 +1,242 @@
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from .sql_prepared import SQL_Parameters
+from .sql_fire_client import FireSQLAbstractClient, query_documents, collection_documents
+
+
+class FireSQLStatsClient(FireSQLAbstractClient):
+  """
+  FireSQLStatsClient wraps a client to measure, for each collection, the Firestore
+  queries, the documents returned, the billed document reads and the wall time.
+
+  As Firestore bills them, a query returning no document costs 1 read and an
+  aggregation query is counted as 1 read.
+  """
+
+  def __init__(self, sqlClient: FireSQLAbstractClient):
+    self.sqlClient = sqlClient
+    self.stats = {}
+
+  @property
+  def client(self):
+    return self.sqlClient.client
+
+  def collection_stats(self, collectionName: str) -> Dict:
+    if collectionName not in self.stats:
+      self.stats[collectionName] = {'queries': 0, 'rows': 0, 'reads': 0, 'writes': 0, 'time': 0.0}
+    return self.stats[collectionName]
+
+  def _read(self, collectionName: str, elapsed: float, rows: int, reads: int = None):
+    stats = self.collection_stats(collectionName)
+    stats['queries'] += 1
+    stats['rows'] += rows
+    stats['reads'] += reads if reads is not None else max(1, rows)
+    stats['time'] += elapsed
+
+  def _write(self, collectionName: str, elapsed: float):
+    stats = self.collection_stats(collectionName)
+    stats['writes'] += 1
+    stats['time'] += elapsed
+
+  def get_collection_ref(self, collectionName: str):
+    return self.sqlClient.get_collection_ref(collectionName)
+
+  def query_document_by_where_tuples(self, collectionName: str, queries: List, fields: List = None) -> Dict:
+    start = time.perf_counter()
+    documents = query_documents(self.sqlClient, collectionName, queries, fields=fields)
+    self._read(collectionName, time.perf_counter() - start, len(documents))
+    return documents
+
+  def stream_document_by_where_tuples(self, collectionName: str, queries: List, fields: List = None,
+                                      orderBy: List[Tuple[str, str]] = None, limit: int = None) -> Iterator[Tuple[str, Dict]]:
+    # only the time spent reading the stream is measured, not the consumer's
+    elapsed = 0.0
+    rows = 0
+    start = time.perf_counter()
+    stream = iter(self.sqlClient.stream_document_by_where_tuples(collectionName, queries, fields=fields, orderBy=orderBy, limit=limit))
+    try:
+      while True:
+        try:
+          item = next(stream)
+        except StopIteration:
+          break
+        rows += 1
+        elapsed += time.perf_counter() - start
+        yield item
+        start = time.perf_counter()
+    finally:
+      elapsed += time.perf_counter() - start
+      self._read(collectionName, elapsed, rows)
+
+  def scan_collection_documents(self, collectionName: str, fields: List = None, partitions: int = 1, workers: int = 1) -> Iterator[Tuple[str, Dict]]:
+    # the partitions are counted as one query, with the wall time of the whole scan
+    rows = 0
+    start = time.perf_counter()
+    try:
+      for item in self.sqlClient.scan_collection_documents(collectionName, fields=fields, partitions=partitions, workers=workers):
+        rows += 1
+        yield item
+    finally:
+      self._read(collectionName, time.perf_counter() - start, rows)
+
+  def aggregate_by_where_tuples(self, collectionName: str, queries: List, aggregations: List[Tuple[str, str]]) -> Optional[List]:
+    start = time.perf_counter()
+    values = self.sqlClient.aggregate_by_where_tuples(collectionName, queries, aggregations)
+    if values is not None:
+      self._read(collectionName, time.perf_counter() - start, 1, reads=1)
+    return values
+
+  def get_collection_documents_by_ids(self, collectionName: str, docIds: List[str], fields: List = None) -> Dict:
+    start = time.perf_counter()
+    documents = self.sqlClient.get_collection_documents_by_ids(collectionName, docIds, fields=fields)
+    self._read(collectionName, time.perf_counter() - start, len(documents))
+    return documents
+
+  def get_collection_document(self, collectionName: str, docId: str) -> Dict:
+    start = time.perf_counter()
+    document = self.sqlClient.get_collection_document(collectionName, docId)
+    self._read(collectionName, time.perf_counter() - start, 1 if document else 0)
+    return document
+
+  def get_collection_documents(self, collectionName: str, fields: List = None) -> Dict:
+    start = time.perf_counter()
+    documents = collection_documents(self.sqlClient, collectionName, fields=fields)
+    self._read(collectionName, time.perf_counter() - start, len(documents))
+    return documents
+
+  def generate_collection_document_id(self, collectionName: str):
+    return self.sqlClient.generate_collection_document_id(collectionName)
+
+  def set_collection_document(self, collectionName: str, docId: str, document: Dict):
+    start = time.perf_counter()
+    result = self.sqlClient.set_collection_document(collectionName, docId, document)
+    self._write(collectionName, time.perf_counter() - start)
+    return result
+
+  def update_collection_document(self, collectionName: str, docId: str, document: Dict):
+    start = time.perf_counter()
+    result = self.sqlClient.update_collection_document(collectionName, docId, document)
+    self._write(collectionName, time.perf_counter() - start)
+    return result
+
+  def delete_collection_document(self, collectionName: str, docId: str):
+    start = time.perf_counter()
+    result = self.sqlClient.delete_collection_document(collectionName, docId)
+    self._write(collectionName, time.perf_counter() - start)
+    return result
+
+
+def _count_rows(result: Any) -> int:
+  # the number of rows or documents produced by an operator
+  if isinstance(result, dict) and all(isinstance(docs, dict) for docs in result.values()):
+    # documents of each part
+    return sum(len(docs) for docs in result.values())
+  try:
+    return len(result)
+  except TypeError:
+    return 1
+
+
+# internal firebase explain
+class SQLFireExplain():
+  """
+  SQLFireExplain is the compiled `EXPLAIN [ANALYZE] statement`.
+
+  Its result is the execution plan of the statement, one row per operator. With ANALYZE,
+  the statement is executed and the actual rows, document reads and wall time of each
+  operator are reported next to the estimates.
+  """
+
+  def __init__(self, fireCommand: Any, analyze: bool = False):
+    self.fireCommand = fireCommand
+    self.analyze = analyze
+    self.statsClient = None
+    self.probes = {}
+    self.result = {}
+
+  def bind(self, parameters: SQL_Parameters = None) -> 'SQLFireExplain':
+    return SQLFireExplain(self.fireCommand.bind(parameters), analyze=self.analyze)
+
+  def select_fields(self) -> List:
+    fields = ['id', 'operator', 'collection', 'detail', 'estimatedReads']
+    if self.analyze:
+      fields += ['rows', 'reads', 'timeMs']
+    return fields
+
+  def execution_result(self) -> Dict:
+    return self.result
+
+  def collection_access(self) -> Tuple[Set[str], Set[str]]:
+    # only EXPLAIN ANALYZE executes the statement
+    if self.analyze:
+      return self.fireCommand.collection_access()
+    return set(), set()
+
+  def instrument(self, client: FireSQLAbstractClient) -> FireSQLStatsClient:
+    """
+    Prepare the statement to be executed by EXPLAIN ANALYZE: the operator methods of
+    the command are timed and the client reads are measured.
+
+    Args:
+      client (FireSQLAbstractClient): the client to execute the statement with
+    Returns:
+      FireSQLStatsClient: the measuring client to execute the statement with
+    """
+    self.statsClient = FireSQLStatsClient(client)
+    self.probes = {}
+    for step in self.fireCommand.explain():
+      probe = step['probe']
+      if probe and probe not in self.probes and hasattr(self.fireCommand, probe):
+        self.probes[probe] = {'rows': 0, 'time': 0.0}
+        setattr(self.fireCommand, probe, self._timed(probe, getattr(self.fireCommand, probe)))
+    return self.statsClient
+
+  def _timed(self, probe: str, method: Callable) -> Callable:
+    def _method(*args, **kwargs):
+      start = time.perf_counter()
+      result = method(*args, **kwargs)
+      self.probes[probe]['time'] += time.perf_counter() - start
+      self.probes[probe]['rows'] = _count_rows(result)
+      return result
+    return _method
+
+  def post_process(self) -> List:
+    """
+    Returns:
+      List: the plan rows, with the actual measures if the statement was executed
+    """
+    rows = []
+    totalReads = 0
+    totalActualReads = 0
+    totalTime = 0.0
+    for index, step in enumerate(self.fireCommand.explain()):
+      row = {
+        'id': index + 1,
+        'operator': step['operator'],
+        'collection': step['collection'],
+        'detail': step['detail'],
+        'estimatedReads': step['estimatedReads'] if step['estimatedReads'] is not None else '',
+      }
+      totalReads += step['estimatedReads'] or 0
+      if self.analyze:
+        probe = step['probe']
+        actual = {'rows': '', 'reads': '', 'time': 0.0}
+        if self.statsClient is not None and probe in self.statsClient.stats:
+          actual = self.statsClient.stats[probe]
+          totalActualReads += actual['reads']
+        elif probe in self.probes:
+          actual = dict(self.probes[probe], reads='')
+        totalTime += actual['time']
+        row.update({'rows': actual['rows'], 'reads': actual['reads'], 'timeMs': round(actual['time'] * 1000, 3)})
+      rows.append(row)
+
+    total = {'id': '', 'operator': 'total', 'collection': '', 'detail': '', 'estimatedReads': totalReads}
+    if self.analyze:
+      total.update({'rows': '', 'reads': totalActualReads, 'timeMs': round(totalTime * 1000, 3)})
+    rows.append(total)
+    self.result = {
+      'success': True,
+      'message': ''
+    }
+    return rows
@@ -1,10 +1,13 @@
+import copy
 import datetime
-from typing import Dict, List
+from typing import Dict, List, Set, Tuple
 
 from .sql_objects import (
   SQL_Insert,
   SQL_ValueJSON,
+  SQL_Parameter,
 )
+from .sql_prepared import SQL_Parameters, bind_parameter_value
 
 from .sql_date import SQLDate
 from .sql_fire_client import FireSQLAbstractClient
@@ -29,16 +32,27 @@ class SQLFireInsert():
       self.columns.append(colRef.column)
 
     for valueRef in insert.values: 
+      if isinstance(valueRef, SQL_Parameter):
+        # bind parameter is substituted at execution time
+        self.values.append(valueRef)
+        continue
       value = valueRef.value
       if isinstance(value, str) and SQLDate.validate_iso8601(value):
         value = datetime.datetime.fromisoformat(value)
       self.values.append(value)
 
+    return self.is_valid()
+
+  def is_valid(self) -> bool:
     # if number of columns do not match the number of values
-    if len(self.columns) != len(self.values):
-      return False
+    return len(self.columns) == len(self.values)
 
-    return True
+  def bind(self, parameters: SQL_Parameters = None) -> 'SQLFireInsert':
+    bound = copy.copy(self)
+    bound.columns = list(self.columns)
+    bound.values = [bind_parameter_value(value, parameters) for value in self.values]
+    bound.result = {}
+    return bound
 
   def select_fields(self) -> List:
     fields = ['docid']
@@ -49,6 +63,15 @@ class SQLFireInsert():
   def execution_result(self) -> Dict:
     return self.result
 
+  def collection_access(self) -> Tuple[Set[str], Set[str]]:
+    # the collections read and written by the statement
+    return set(), {self.part}
+
+  def explain(self) -> List[Dict]:
+    # a single document write, no read
+    return [{'operator': 'insert', 'collection': self.part, 'detail': ', '.join(self.columns),
+             'estimatedReads': 0, 'probe': 'execute'}]
+
   def post_process(self) -> Dict:
     doc = {}
     if '*' in self.columns:
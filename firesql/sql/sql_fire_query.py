@@ -1,6 +1,9 @@
-import re
+import copy
+import dataclasses
+import itertools
+import math
 import datetime
-from typing import Dict, List
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 from .sql_objects import (
   SQL_Select,
@@ -9,12 +12,38 @@ from .sql_objects import (
   SQL_ColumnRef,
   SQL_SelectFrom,
 )
-from .sql_join import JoinPart, FireSQLJoin
-from .sql_aggregation import FireSQLAggregate
+from .sql_prepared import SQL_Parameters, bind_parameter_value
+from .sql_plan import (
+  FireSQLPlanner,
+  PlanBool,
+  PlanNode,
+  PlanPredicate,
+  MISSING_VALUE,
+  DEFAULT_COLLECTION_SIZE,
+  FIRESTORE_IN_LIMIT,
+  FILTER_OPERATORS,
+  MULTI_VALUE_OPERATORS,
+  RANGE_OPERATORS,
+  compare_values,
+  compile_conjunctions,
+  estimate_cardinality,
+  format_conjunctions,
+  is_prefix_pattern,
+  like_range_queries,
+  get_document_value,
+  literal_value,
+)
+from .sql_join import JoinPart, JoinStep, FireSQLJoin, SpillBuffer, JOIN_LOOKUP_MAX_QUERIES
+from .sql_aggregation import FireSQLAggregate, FireSQLGroupBy
+from .sql_order import FireSQLOrderBy, is_missing_index_error
+from .sql_schema import schema_catalog
+from .sql_projection import compile_row_builder, compile_join_row_builder
 
-from .sql_date import SQLDate
-from .sql_fire_client import FireSQLAbstractClient
+from .sql_fire_client import FireSQLAbstractClient, query_documents, collection_documents
 
+# key ranges of a parallel collection scan for each worker, so that the
+# workers finishing first take over the ranges left
+SCAN_PARTITIONS_PER_WORKER = 4
 
 # internal firebase query
 class SQLFireQuery():
@@ -23,59 +52,94 @@ class SQLFireQuery():
     self.clear()
 
   def clear(self):
+    self.mode = 'all'
     self.columns = []
     self.columnNameMap = {}
     self.collections = {}
     self.aliases = {}
     self.collectionFields= {}
     self.aggregationFields={}
-    self.on = None
+    self.aggregationNames = {}
+    self.joinParts = []
+    self.joins = []
+    self.orderBy = []
+    self.limit = None
+    self.offset = 0
+    self.groupBy = []
+    self.groupAggregations = []
+    self.having = None
+    self.groups = None
+    self.aggregates = None
+    self.missingDocIds = {}
+    self.options = {}
+    self.schemaCatalog = None
     self.result = {}
 
   def generate(self, select: SQL_Select, options: Dict = {}) -> Dict:
     self.mode = select.mode
+    self.options = options
+    self.schemaCatalog = schema_catalog(options.get('schemaCatalog'))
     self._init_collection_refs(select, options)
     self._init_field_refs(select, options)
     self._init_column_names()
+    self._init_aggregation_names()
+    self._init_order_limit(select)
+    self._init_group_by(select)
     # create queries for each collections (parts)
-    # return a dicitionary of {part -> [queries]}
-    self.fireQueries = {}
-    self._init_query_refs(select.where, fireQueries=self.fireQueries)
+    # return a dicitionary of {part -> [[queries] OR [queries] ...]}
+    self._init_query_plan(select.where)
     return self.fireQueries
 
   def _init_collection_refs(self, select: SQL_Select, options: Dict = {}):
     for table in select.froms:
       if isinstance(table, SQL_JoinExpression):
-        joinTables = [table.left, table.right]
-        for join in joinTables:
-          self.collections[join.part] = join.part
-          self.aliases[join.part] = join.part
-          if join.alias:
-            self.aliases[join.alias] = join.part
-        # ON must be done after the join tables has been defined
-        if table.on:
-          leftRef: SQL_ColumnRef = table.on.left
-          rightRef: SQL_ColumnRef = table.on.right
-          self.on = [
-              (self.aliases[leftRef.table], leftRef.column),
-              table.on.operator,
-              (self.aliases[rightRef.table], rightRef.column)
-            ]
+        self._init_join(table)
       else:
-        self.collections[table.part] = table.part
-        self.aliases[table.part] = table.part
-        if table.alias:
-          self.aliases[table.alias] = table.part
+        self._add_collection(table)
     self.defaultPart = next(iter(self.aliases))
+    if self.joins:
+      # every joined collection must be reached by the ON clauses
+      joined = {self.joinParts[0]}
+      for (part, _, _, _) in self._join_expansion(self.joinParts[0], {}):
+        joined.add(part)
+      for part in self.joinParts:
+        if part not in joined:
+          raise Exception(f"collection '{part}' is not joined by an ON clause")
+
+  def _add_collection(self, table: SQL_SelectFrom):
+    self.collections[table.part] = table.part
+    self.aliases[table.part] = table.part
+    if table.alias:
+      self.aliases[table.alias] = table.part
+
+  def _init_join(self, join: SQL_JoinExpression):
+    # the joined collections in FROM order, and the [(part, field), operator, (part, field)] of each ON
+    if isinstance(join.left, SQL_JoinExpression):
+      self._init_join(join.left)
+    else:
+      self._add_collection(join.left)
+      self.joinParts.append(join.left.part)
+    if join.right.part in self.joinParts:
+      raise Exception(f"collection '{join.right.part}' can only be joined once")
+    self._add_collection(join.right)
+    self.joinParts.append(join.right.part)
+    # ON must be done after the join tables has been defined
+    if join.on:
+      leftRef: SQL_ColumnRef = join.on.left
+      rightRef: SQL_ColumnRef = join.on.right
+      on = [
+          (self.aliases[leftRef.table], leftRef.column),
+          join.on.operator,
+          (self.aliases[rightRef.table], rightRef.column)
+        ]
+      if on[0][0] == on[2][0]:
+        raise Exception("JOIN ON must compare the fields of two collections")
+      self.joins.append(on)
   
   def _init_field_refs(self, select: SQL_Select, options: Dict = {}):
-    self.columns = select.columns
-    for sel in select.columns:
-      if sel.table:
-        partName = self.aliases[sel.table]
-      else:
-        # no table name, get the first table name
-        partName = self.aliases[self.defaultPart]
+    self.columns = [self._resolve_column(sel) for sel in select.columns]
+    for sel in self.columns:
+      partName = self._get_part(sel)
 
       if partName not in self.collectionFields:
         self.collectionFields[partName] = []
@@ -85,47 +149,112 @@ class SQLFireQuery():
 
       # if there is an aggregation function on column
       if sel.func:
+        if sel.column == '*' and (sel.func == 'count_distinct' or sel.func.startswith('approx_')):
+          raise Exception("{} must aggregate the values of a field".format(FireSQLAggregate.fieldName(sel.func, '...').upper()))
         self.aggregationFields[partName].append( (sel.func, sel.column) )
 
-  def _init_query_refs(self, query: SQL_BinaryExpression, fireQueries={}):
-    if query:
-      if query.operator in ('and', 'or'):
-        self._init_query_refs(query.left, fireQueries=fireQueries)
-        self._init_query_refs(query.right, fireQueries=fireQueries)
+  def _init_order_limit(self, select: SQL_Select):
+    # ORDER BY as [(part, field, direction)], ordering by a column alias orders by its column
+    self.orderBy = []
+    aliasColumns = {c.alias: c for c in self.columns if c.alias}
+    for orderBy in (select.orderBy or []):
+      column = orderBy.column
+      if not column.table and not column.func and column.column in aliasColumns:
+        column = aliasColumns[column.column]
+      if column.func:
+        # an aggregated value, ordered in the result rows
+        column = self._resolve_column(column)
+        self.orderBy.append( (None, self._aggregation_name(self._get_part(column), column.func, column.column), orderBy.direction) )
       else:
-        leftRef = query.left
-        rightRef = query.right
-
-        if isinstance(rightRef, List):
-          valList = [v.value for v in rightRef]
-          fireQuery = [leftRef.column, query.operator, valList]
-        elif isinstance(rightRef, SQL_ColumnRef):
-          fireQuery = [leftRef.column, query.operator, rightRef.column]
-        else:
-          if rightRef:
-            value = rightRef.value
-          else:
-            value = None
-          if isinstance(value, str) and SQLDate.validate_iso8601(value):
-            value = datetime.datetime.fromisoformat(value)
-          fireQuery = [leftRef.column, query.operator, value]
-
-        if leftRef.table:
-          partName = self.aliases[leftRef.table]
-        else:
-          partName = self.aliases[self.defaultPart]
+        part, field = self._get_part_field(column)
+        self.orderBy.append( (part, field, orderBy.direction) )
+    self.limit = select.limit
+    self.offset = select.offset or 0
+
+  def _init_group_by(self, select: SQL_Select):
+    # GROUP BY as [(part, field)], with the aggregations [(part, func, column)] of the
+    # selected columns, HAVING and ORDER BY computed for each group
+    self.groupBy = [self._get_part_field(column) for column in (select.groupBy or [])]
+    if select.having and not self.groupBy:
+      raise Exception("HAVING requires a GROUP BY clause")
+    if not self.groupBy:
+      return
 
-        if partName not in fireQueries:
-          fireQueries[partName] = []
+    self.groupAggregations = []
+    def _add_aggregation(column: SQL_ColumnRef):
+      column = self._resolve_column(column)
+      aggregation = (self._get_part(column), column.func, column.column)
+      if aggregation not in self.groupAggregations:
+        self.groupAggregations.append(aggregation)
 
-        fireQueries[partName].append(fireQuery)
+    for column in self.columns:
+      if column.func:
+        _add_aggregation(column)
+      elif self._get_part_field(column) not in self.groupBy:
+        raise Exception(f"field '{column.column}' must be in the GROUP BY clause or aggregated")
+    for orderBy in (select.orderBy or []):
+      if orderBy.column.func:
+        _add_aggregation(orderBy.column)
+    self.having = self._init_having(select.having, _add_aggregation) if select.having else None
+
+  def _init_having(self, expr: SQL_BinaryExpression, addAggregation) -> PlanNode:
+    # HAVING as a tree of plan nodes on the group row fields
+    if expr.operator in ('and', 'or'):
+      return PlanBool(expr.operator, [self._init_having(expr.left, addAggregation), self._init_having(expr.right, addAggregation)])
+    column = expr.left
+    if not isinstance(column, SQL_ColumnRef):
+      raise Exception("HAVING must compare an aggregation or a GROUP BY field to a value")
+    if column.func:
+      addAggregation(column)
+      column = self._resolve_column(column)
+      name = self._aggregation_name(self._get_part(column), column.func, column.column)
+    else:
+      partField = self._get_part_field(column)
+      if partField not in self.groupBy:
+        raise Exception(f"HAVING field '{column.column}' must be in the GROUP BY clause or aggregated")
+      name = self._group_name(*partField)
+    return PlanPredicate(part=None, query=[name, expr.operator, literal_value(expr.right)])
+
+  def _group_name(self, part: str, field: str) -> str:
+    # the result row name of a GROUP BY field
+    return self.columnNameMap.get(part, {}).get(field, field)
+
+  def _limit_count(self) -> Optional[int]:
+    # the number of rows needed to answer LIMIT and OFFSET
+    if self.limit is None:
+      return None
+    return self.offset + self.limit
+
+  def _get_part(self, columnRef: SQL_ColumnRef) -> str:
+    if columnRef.table:
+      return self.aliases[columnRef.table]
+    else:
+      # no table name, get the first table name
+      return self.aliases[self.defaultPart]
+
+  def _resolve_column(self, columnRef: SQL_ColumnRef) -> SQL_ColumnRef:
+    # a table name that is not an alias is the parent of a sub-field, e.g. `addr.city`
+    if columnRef.table and columnRef.table not in self.aliases:
+      return dataclasses.replace(columnRef, table=None, column=f'{columnRef.table}.{columnRef.column}')
+    return columnRef
+
+  def _get_part_field(self, columnRef: SQL_ColumnRef) -> Tuple[str, str]:
+    # (part, field) of a column
+    columnRef = self._resolve_column(columnRef)
+    return (self._get_part(columnRef), columnRef.column)
+
+  def _init_query_plan(self, where: SQL_BinaryExpression):
+    # optimize the where clause into firestore queries for each collections (parts)
+    planner = FireSQLPlanner(self._get_part)
+    self.plan = planner.plan(where, parts=list(self.collections.keys()))
+    self.fireQueries = self.plan.queries
 
   def _init_column_names(self):
     self.columnNameMap = {}
     colNames = [c.column for c in self.columns]
     colAliases = [c.alias for c in self.columns]  # new
     for ci in range(len(colNames)):
-      tableName = self.aliases[ self.columns[ci].table ] if self.columns[ci].table else self.defaultPart
+      tableName = self._get_part(self.columns[ci])
       if tableName not in self.columnNameMap:
         self.columnNameMap[ tableName ] = {}
       # self.columnNameMap[ tableName ][ colNames[ci] ] = self.columns[ci].column
@@ -136,60 +265,636 @@ class SQLFireQuery():
           # self.columnNameMap[ tableName ][ colNames[ci] ] = '_'.join( [self.columns[ci].table, self.columns[ci].column] )
           self.columnNameMap[ tableName ][ colNames[ci] ] = '_'.join( [tableName, self.columns[ci].column] )  # new
 
+  def _init_aggregation_names(self):
+    # the result name of each selected aggregation: its alias, or its function and column,
+    # qualified by the table when the same function and column are aggregated in several parts
+    self.aggregationNames = {}
+    columns = [c for c in self.columns if c.func]
+    fieldParts = {}
+    for c in columns:
+      fieldParts.setdefault(FireSQLAggregate.fieldName(c.func, c.column), set()).add(self._get_part(c))
+    for c in columns:
+      part = self._get_part(c)
+      name = FireSQLAggregate.fieldName(c.func, c.column)
+      if c.alias:
+        name = c.alias
+      elif len(fieldParts[name]) > 1:
+        name = FireSQLAggregate.fieldName(c.func, '{}.{}'.format(c.table or part, c.column))
+      self.aggregationNames[(part, c.func, c.column)] = name
+
+  def _aggregation_name(self, part: str, func: str, column: str) -> str:
+    # the name of an aggregation in the result rows
+    return self.aggregationNames.get((part, func, column), FireSQLAggregate.fieldName(func, column))
+
+  def bind(self, parameters: SQL_Parameters = None) -> 'SQLFireQuery':
+    """
+    Return a copy of the generated query for execution, with the bind parameter
+    values substituted into the Firestore queries.
+
+    Args:
+      parameters (List|Dict): positional values for `?` or named values for `:name`
+    Returns:
+      The bound copy, the generated query itself is left untouched
+    """
+    bound = copy.copy(self)
+    bound.columns = list(self.columns)
+    bound.columnNameMap = {part: dict(names) for part, names in self.columnNameMap.items()}
+    bound.result = {}
+    bound.missingDocIds = {}
+    bound.fireQueries = {}
+    for part, conjunctions in self.fireQueries.items():
+      bound.fireQueries[part] = [
+        [[field, operator, bind_parameter_value(value, parameters)] for (field, operator, value) in conjunction]
+        for conjunction in conjunctions
+      ]
+    if self.having:
+      bound.having = self._bind_having(self.having, parameters)
+    if parameters is not None:
+      # the bound values may fold further, e.g. into a contradiction
+      bound.fireQueries = FireSQLPlanner.optimize_queries(bound.fireQueries)
+    return bound
+
+  def _bind_having(self, node: PlanNode, parameters: SQL_Parameters) -> PlanNode:
+    if isinstance(node, PlanBool):
+      return PlanBool(node.operator, [self._bind_having(child, parameters) for child in node.children])
+    name, operator, value = node.query
+    return PlanPredicate(part=None, query=[name, operator, bind_parameter_value(value, parameters)])
+
+  def _split_conjunction(self, conjunction: List) -> Tuple[Optional[List], List, List]:
+    """
+    Split a conjunction into the queries executed by Firestore and the filters evaluated on the client.
+
+    A LIKE pattern with a literal prefix is also read as the range of its prefix, e.g. `email LIKE 'john%'`
+    as `email >= 'john' AND email < 'joho'`. When the prefix is the whole pattern, the LIKE is not
+    evaluated on the client at all. Firestore ranges are kept on a single field.
+
+    Args:
+      conjunction (List): the `[field, operator, value]` queries of a conjunction
+    Returns:
+      the Firestore queries (None if the conjunction cannot match), the client-side filters
+      and the LIKE queries pushed down as ranges
+    """
+    fireQueries = [query for query in conjunction if query[1] not in FILTER_OPERATORS]
+    filters = []
+    pushed = []
+    inequalityFields = set(field for (field, operator, _) in fireQueries if operator in RANGE_OPERATORS + ('!=', 'not_in'))
+    for query in conjunction:
+      (field, operator, value) = query
+      if operator not in FILTER_OPERATORS:
+        continue
+      rangeQueries = []
+      if operator == 'like' and self.options.get('likePushdown', True) and inequalityFields <= {field}:
+        rangeQueries = like_range_queries(field, value)
+      if rangeQueries:
+        fireQueries.extend(rangeQueries)
+        inequalityFields.add(field)
+        pushed.append(query)
+        if is_prefix_pattern(value):
+          continue
+      filters.append(query)
+    if pushed:
+      # merge the ranges with the other queries of their field
+      fireQueries = FireSQLPlanner.optimize_conjunction(fireQueries)
+    return fireQueries, filters, pushed
+
   def firebase_queries(self, allQueries: Dict) -> Dict:
+    # the queries that Firestore can execute, for each conjunction
     fireQueries = {}
     if allQueries:
-      for part in allQueries.keys():
+      for part, conjunctions in allQueries.items():
         fireQueries[part] = []
-        for query in allQueries[part]:
-          (_, operator, _) = query
-          if operator not in ['like', 'not_like']:
-            fireQueries[part].append(query)
+        for conjunction in conjunctions:
+          queries, _, _ = self._split_conjunction(conjunction)
+          if queries is not None:
+            fireQueries[part].append(queries)
     return fireQueries
 
   def filter_queries(self, allQueries: Dict) -> Dict:
+    # the queries that must be evaluated on the fetched documents
     filterQueries = {}
     if allQueries:
-      for part in allQueries.keys():
+      for part, conjunctions in allQueries.items():
         filterQueries[part] = []
-        for query in allQueries[part]:
-          (_, operator, _) = query
-          if operator in ['like', 'not_like']:
-            filterQueries[part].append(query)
+        filters = [self._split_conjunction(conjunction)[1] for conjunction in conjunctions]
+        if not any(filters):
+          continue
+        if len(conjunctions) == 1:
+          filterQueries[part].append(filters[0])
+        else:
+          # documents fetched by one conjunction must be checked against all the others
+          filterQueries[part] = conjunctions
     return filterQueries
 
   def execute_query(self, client: FireSQLAbstractClient, fireQueries: Dict) -> Dict:
+    self.aggregates = self._execute_aggregation_query(client, fireQueries)
+    if self.aggregates is not None:
+      # computed by Firestore, no document to read
+      return {part: {} for part in fireQueries}
+
+    if self.groupBy and not self.joins:
+      # hash aggregation of the documents as they are read, they are not kept
+      part = self.defaultPart
+      self.groups = self._group_operator(lambda part, field: field)
+      documents = self._stream_part_documents(client, part, fireQueries.get(part, []), self._projection_fields(part))
+      for docId, doc in documents:
+        self.groups.add(lambda field: self._document_value(docId, doc, field))
+      return {part: {}}
+
+    if self._streams_aggregation():
+      # all the aggregations are updated as the documents are read, they are not kept
+      part = self.defaultPart
+      aggregate = self._aggregate_operator(lambda part, field: field)
+      documents = self._stream_part_documents(client, part, fireQueries.get(part, []), self._projection_fields(part))
+      for docId, doc in documents:
+        aggregate.add(lambda field: self._document_value(docId, doc, field))
+      self.aggregates = aggregate.results()
+      return {part: {}}
+
     documents = {}
-    if fireQueries:
-      for part in fireQueries.keys():
-        collectionName = self.collections[part]
-        if fireQueries[part]:
-          documents[part] = client.query_document_by_where_tuples(collectionName, fireQueries[part])
-        else:
-          documents[part] = client.get_collection_documents(collectionName)
+    joinOrder = self._join_order(fireQueries) or []
+    lookupParts = [part for (part, _, drivingPart, _) in joinOrder if drivingPart is not None]
+    spills = self.joins and self.options.get('joinMemoryBudget') is not None
+    for part, conjunctions in fireQueries.items():
+      if part in lookupParts:
+        continue
+      if spills:
+        documents[part] = self._join_documents(self._stream_part_documents(client, part, conjunctions, self._projection_fields(part)))
+      else:
+        documents[part] = self._execute_part_query(client, part, conjunctions)
+
+    for (part, field, drivingPart, drivingField) in joinOrder:
+      if drivingPart is None:
+        continue
+      # index-nested-loop join, only fetch the documents matching the join keys of the driving part
+      keys = self._join_keys(documents[drivingPart], drivingPart, drivingField)
+      if spills:
+        documents[part] = self._join_documents(self._iter_join_lookup(client, part, field, fireQueries[part], keys))
+      else:
+        documents[part] = self._execute_join_lookup(client, part, field, fireQueries[part], keys)
+    return documents
+
+  def _join_documents(self, items: Iterable[Tuple[str, Dict]]):
+    # the (docId, doc) of a joined part, spilled to a temp file beyond its share of the `joinMemoryBudget`
+    # option: the build sides of the hash joins are then partitioned on disk
+    budget = self.options.get('joinMemoryBudget')
+    if budget is None:
+      return dict(items)
+    documents = SpillBuffer(budget // len(self.joinParts))
+    documents.extend(items)
+    return documents
+
+  def _streams_aggregation(self) -> bool:
+    # the aggregations without GROUP BY of a single collection are computed on the documents, not on the rows
+    return (FireSQLAggregate.hasAggregation(self.aggregationFields) and not self.groupBy and not self.joins
+            and self.mode == 'all')
+
+  def _aggregate_operator(self, getName) -> FireSQLAggregate:
+    # the aggregations without GROUP BY, of the selected columns of all the parts, `getName(part, field)`
+    # is the name of a field in the aggregated rows
+    aggregations = []
+    names = []
+    for part, partAggregations in self.aggregationFields.items():
+      for (func, column) in partAggregations:
+        aggregations.append( (func, column if column == '*' else getName(part, column)) )
+        names.append(self._aggregation_name(part, func, column))
+    return FireSQLAggregate(aggregations, names)
+
+  def _server_aggregations(self, fireQueries: Dict) -> Optional[List]:
+    # the (func, column) aggregations that Firestore aggregation queries can compute:
+    # COUNT(*), SUM and AVG of a single collection, None when computed on the documents
+    if not FireSQLAggregate.hasAggregation(self.aggregationFields) or self.groupBy or self.joins or self.mode != 'all':
+      return None
+    part = self.defaultPart
+    aggregations = self.aggregationFields.get(part, [])
+    if not all(FireSQLAggregate.isServerAggregation(func, column) for (func, column) in aggregations):
+      return None
+    if len(fireQueries.get(part, [])) > 1 or self.filter_queries(self.fireQueries).get(part):
+      return None
+    return aggregations
+
+  def _execute_aggregation_query(self, client: FireSQLAbstractClient, fireQueries: Dict) -> Optional[Dict]:
+    # the aggregations computed by Firestore, None when they must be computed on the documents
+    aggregations = self._server_aggregations(fireQueries)
+    if aggregations is None:
+      return None
+    part = self.defaultPart
+    conjunctions = fireQueries.get(part, [])
+    if conjunctions:
+      values = client.aggregate_by_where_tuples(self.collections[part], conjunctions[0], aggregations)
+      if values is None:
+        return None
     else:
-      collectionName = self.collections[self.defaultPart]
-      documents[self.defaultPart] = client.get_collection_documents(collectionName)
+      # contradiction, nothing to aggregate
+      values = [None] * len(aggregations)
+    return self._aggregation_values(aggregations, values)
+
+  def _aggregation_values(self, aggregations: List, values: List) -> Dict:
+    # the aggregates of the values computed by Firestore
+    aggregates = {}
+    for (func, column), value in zip(aggregations, values):
+      # without numeric value, COUNT and SUM are 0 and AVG is None, as computed on the documents
+      if value is None and func in ('count', 'sum'):
+        value = 0
+      aggregates[self._aggregation_name(self.defaultPart, func, column)] = value
+    return aggregates
+
+  def _execute_part_query(self, client: FireSQLAbstractClient, part: str, conjunctions: List) -> Dict:
+    fields = self._projection_fields(part)
+    count = self._limit_count()
+    if count is not None and self._is_part_result(part):
+      return self._execute_part_top(client, part, conjunctions, fields, count)
+    if any(not conjunction for conjunction in conjunctions):
+      # a conjunction without firestore query needs the whole collection anyway
+      return self._get_part_collection(client, part, fields)
+    # an empty list of conjunctions cannot match, nothing is read
+    documents = {}
+    for conjunction in conjunctions:
+      documents.update(self._query_conjunction(client, part, conjunction, fields))
     return documents
 
+  def _scan_partitions(self) -> Optional[Tuple[int, int]]:
+    # the (partitions, workers) of a parallel collection scan, None for a serial scan
+    workers = self.options.get('scanWorkers', 1)
+    if workers <= 1:
+      return None
+    return self.options.get('scanPartitions', workers * SCAN_PARTITIONS_PER_WORKER), workers
+
+  def _get_part_collection(self, client: FireSQLAbstractClient, part: str, fields: Optional[List]) -> Dict:
+    # the whole collection of the part, read in parallel key ranges with the `scanWorkers` option
+    collectionName = self.collections[part]
+    scan = self._scan_partitions()
+    if scan is None:
+      return collection_documents(client, collectionName, fields=fields)
+    partitions, workers = scan
+    return dict(client.scan_collection_documents(collectionName, fields=fields, partitions=partitions, workers=workers))
+
+  def _query_conjunction(self, client: FireSQLAbstractClient, part: str, conjunction: List, fields: Optional[List]) -> Dict:
+    # the part documents matching a conjunction. Document Id lookups are batched gets, then the
+    # other queries are evaluated on the documents; `docid !=` is evaluated on the query results
+    collectionName = self.collections[part]
+    if not any(field == 'docid' for (field, _, _) in conjunction):
+      return query_documents(client, collectionName, conjunction, fields=fields)
+
+    docIds, residualQueries, fields = self._docid_conjunction(conjunction, fields)
+    if docIds is not None:
+      documents = self._get_documents_by_ids(client, part, docIds, fields)
+    else:
+      queries = [query for query in residualQueries if query[0] != 'docid']
+      if queries:
+        documents = query_documents(client, collectionName, queries, fields=fields)
+      else:
+        documents = self._get_part_collection(client, part, fields)
+    matches = compile_conjunctions([residualQueries])
+    return {docId: doc for docId, doc in documents.items() if matches(docId, doc)}
+
+  def _docid_conjunction(self, conjunction: List, fields: Optional[List]) -> Tuple[Optional[List], List, Optional[List]]:
+    # the document ids to get (None for a query or scan), the queries evaluated on the
+    # documents, and the field mask extended with the fields of these queries
+    docIds = None
+    residualQueries = []
+    for query in conjunction:
+      (field, operator, value) = query
+      if field == 'docid' and operator in ('==', 'in') and docIds is None:
+        docIds = [value] if operator == '==' else value
+      else:
+        residualQueries.append(query)
+    if fields is not None:
+      fields = fields + [field for (field, _, _) in residualQueries if field != 'docid' and field not in fields]
+    return docIds, residualQueries, fields
+
+  def _conjunction_access(self, conjunction: List) -> str:
+    # how the documents of a conjunction are read, as executed by `_query_conjunction`
+    if any(field == 'docid' and operator in ('==', 'in') for (field, operator, _) in conjunction):
+      return 'batched get'
+    elif all(field == 'docid' for (field, _, _) in conjunction):
+      return 'collection scan'
+    return 'query'
+
+  def _get_documents_by_ids(self, client: FireSQLAbstractClient, part: str, docIds: List, fields: Optional[List]) -> Dict:
+    # batched get of the distinct document ids, the missing ones are reported in the execution result
+    docIds = self._distinct_doc_ids(docIds)
+    if not docIds:
+      return {}
+    documents = client.get_collection_documents_by_ids(self.collections[part], docIds, fields=fields)
+    self._add_missing_doc_ids(part, docIds, documents)
+    return documents
+
+  def _distinct_doc_ids(self, docIds: List) -> List:
+    return list(dict.fromkeys(docId for docId in docIds if isinstance(docId, str)))
+
+  def _add_missing_doc_ids(self, part: str, docIds: List, documents: Dict):
+    # the missing ids of each collection as dict keys, without duplicates in order of lookup
+    missing = self.missingDocIds.setdefault(self.collections[part], {})
+    missing.update(dict.fromkeys(docId for docId in docIds if docId not in documents))
+
+  def _is_part_result(self, part: str) -> bool:
+    # the part documents are the result rows: no join, grouping, aggregation nor distinct
+    return (not self.joins and not self.groupBy and self.mode == 'all' and not FireSQLAggregate.hasAggregation(self.aggregationFields)
+            and all(orderPart == part for (orderPart, _, _) in self.orderBy))
+
+  def _can_push_order(self, conjunction: List, orderBy: List) -> bool:
+    # Firestore orders by the inequality field first, and not by a field with an equality filter
+    if not self.options.get('orderPushdown', True):
+      return False
+    if not orderBy:
+      return True
+    orderFields = [field for (field, _) in orderBy]
+    inequalityFields = set(field for (field, operator, _) in conjunction if operator in RANGE_OPERATORS + ('!=', 'not_in'))
+    equalityFields = set(field for (field, operator, _) in conjunction if operator in ('==', 'in'))
+    if 'docid' in orderFields or equalityFields.intersection(orderFields):
+      return False
+    return not inequalityFields or inequalityFields == {orderFields[0]}
+
+  def _execute_part_top(self, client: FireSQLAbstractClient, part: str, conjunctions: List, fields: Optional[List], count: int) -> Dict:
+    # the first `count` result documents, streamed: Firestore orders and limits the queries
+    # when it can, otherwise the documents are kept in a bounded heap (ORDER BY) or the
+    # stream stops at the `count`th matching document (no ORDER BY)
+    if count == 0:
+      return {}
+    orderBy, pushdown = self._top_order(part, conjunctions)
+    documents = self._stream_part_documents(client, part, conjunctions, fields,
+                                            orderBy=orderBy if pushdown else None,
+                                            limit=count if pushdown else None)
+    if orderBy:
+      order = FireSQLOrderBy(orderBy)
+      items = order.top(filter(order.has_document_fields, documents), count, key=order.document_key)
+    else:
+      items = itertools.islice(documents, count)
+    return dict(items)
+
+  def _top_order(self, part: str, conjunctions: List) -> Tuple[List, bool]:
+    # the ORDER BY of the part, and whether Firestore can order and limit its queries
+    orderBy = [(field, direction) for (_, field, direction) in self.orderBy]
+    filterConjunctions = self.filter_queries(self.fireQueries).get(part)
+    pushdown = not filterConjunctions and all(self._can_push_order(conjunction, orderBy) for conjunction in conjunctions)
+    return orderBy, pushdown
+
+  def _stream_ordered_query(self, client: FireSQLAbstractClient, collectionName: str, conjunction: List, fields: Optional[List],
+                            orderBy: List, limit: Optional[int]) -> Iterator[Tuple[str, Dict]]:
+    # the query ordered and limited by Firestore, or on the client when Firestore rejects
+    # the ordered query for a missing composite index, before any document is returned
+    stream = iter(client.stream_document_by_where_tuples(collectionName, conjunction, fields=fields, orderBy=orderBy, limit=limit))
+    try:
+      first = next(stream, None)
+    except Exception as e:
+      if not is_missing_index_error(e):
+        raise
+      stream = iter(FireSQLOrderBy(orderBy).order_documents(
+        client.stream_document_by_where_tuples(collectionName, conjunction, fields=fields), limit))
+      first = next(stream, None)
+    if first is not None:
+      yield first
+      yield from stream
+
+  def _stream_part_documents(self, client: FireSQLAbstractClient, part: str, conjunctions: List, fields: Optional[List],
+                             orderBy: List = None, limit: int = None) -> Iterator[Tuple[str, Dict]]:
+    # the (docId, doc) of the part matching its conjunctions and client-side filters, as they are read
+    collectionName = self.collections[part]
+    filterConjunctions = self.filter_queries(self.fireQueries).get(part)
+    matches = compile_conjunctions(filterConjunctions) if filterConjunctions else None
+    if any(not conjunction for conjunction in conjunctions):
+      # a conjunction without firestore query needs the whole collection anyway
+      conjunctions = [[]]
+    # a document matching several conjunctions is returned once
+    seen = set() if len(conjunctions) > 1 else None
+    scan = self._scan_partitions()
+    for conjunction in conjunctions:
+      if any(field == 'docid' for (field, _, _) in conjunction):
+        # not a query, the documents are ordered and limited by the caller
+        stream = self._query_conjunction(client, part, conjunction, fields).items()
+      elif not conjunction and scan is not None and not orderBy and limit is None:
+        # the collection key ranges are read in parallel
+        partitions, workers = scan
+        stream = client.scan_collection_documents(collectionName, fields=fields, partitions=partitions, workers=workers)
+      elif orderBy:
+        stream = self._stream_ordered_query(client, collectionName, conjunction, fields, orderBy, limit)
+      else:
+        stream = client.stream_document_by_where_tuples(collectionName, conjunction, fields=fields, limit=limit)
+      for docId, doc in stream:
+        if seen is not None:
+          if docId in seen:
+            continue
+          seen.add(docId)
+        if matches is not None and not matches(docId, doc):
+          continue
+        yield docId, doc
+
+  def _projection_fields(self, part: str, queries: List = []) -> Optional[List]:
+    # the field mask of the part documents: the selected fields, the join key, the ORDER BY fields
+    # and the fields of the client-side filters. None fetches whole documents, [] only the document ids
+    fields = []
+    def _add_field(field):
+      if field != 'docid' and field not in fields:
+        fields.append(field)
+
+    for column in self.columns:
+      if column.column == '*' and not column.table and column.func != 'count':
+        # an unqualified `*` selects the fields of every part of a join
+        return None
+      if self._get_part(column) != part:
+        continue
+      if column.column == '*':
+        if column.func == 'count':
+          continue
+        return None
+      _add_field(column.column)
+    for (leftRef, _, rightRef) in self.joins:
+      for (joinPart, joinField) in (leftRef, rightRef):
+        if joinPart == part:
+          _add_field(joinField)
+    for (orderPart, orderField, _) in self.orderBy:
+      if orderPart == part:
+        _add_field(orderField)
+    for (groupPart, groupField) in self.groupBy:
+      if groupPart == part:
+        _add_field(groupField)
+    for (aggregationPart, _, aggregationField) in self.groupAggregations:
+      if aggregationPart == part and aggregationField != '*':
+        _add_field(aggregationField)
+    for conjunction in self.filter_queries(self.fireQueries).get(part, []) + [queries]:
+      for (field, _, _) in conjunction:
+        _add_field(field)
+    return fields
+
+  def _estimate_part(self, part: str, conjunctions: List) -> float:
+    # the estimated number of documents of the part, of its collection size in the `collectionSizes` option
+    collectionSize = self.options.get('collectionSizes', {}).get(self.collections[part], DEFAULT_COLLECTION_SIZE)
+    return estimate_cardinality(conjunctions, collectionSize)
+
+  def _join_edges(self) -> Iterator[Tuple[str, str, str, str]]:
+    # the (part, field, other part, other field) of the ON clauses, both ways
+    for ((leftPart, leftField), _, (rightPart, rightField)) in self.joins:
+      yield (leftPart, leftField, rightPart, rightField)
+      yield (rightPart, rightField, leftPart, leftField)
+
+  def _join_expansion(self, part: str, sizes: Dict) -> List[Tuple[str, str, str, str]]:
+    # the other joined parts, from the part: the smallest part joined to the parts so far comes next.
+    # The `(part, field, joinedPart, joinedField)` of each part, joined to the field of a part before
+    expansion = []
+    joined = {part}
+    while True:
+      candidates = [(nextPart, nextField, joinedPart, joinedField) for (joinedPart, joinedField, nextPart, nextField) in self._join_edges()
+                    if joinedPart in joined and nextPart not in joined]
+      if not candidates:
+        return expansion
+      step = min(candidates, key=lambda candidate: sizes.get(candidate[0], 0))
+      expansion.append(step)
+      joined.add(step[0])
+
+  def _estimate_keys(self, part: str, field: str, size: float, conjunctions: List) -> float:
+    # the estimated number of distinct join keys of `size` documents of a part: an equality or IN
+    # on the join field in every conjunction bounds them to its values
+    bound = 0
+    for conjunction in conjunctions:
+      values = [len(value) if operator == 'in' else 1 for (queryField, operator, value) in conjunction
+                if queryField == field and operator in ('==', 'in')]
+      if not values:
+        return size
+      bound += min(values)
+    return min(size, bound)
+
+  def _estimate_lookup(self, field: str, keys: float, estimate: float) -> float:
+    # the estimated number of documents of a part of `estimate` documents, looked up by `keys` join keys:
+    # one document per key of the document ids, the documents of an equality per key of another field,
+    # and at least one read for each IN query of up to FIRESTORE_IN_LIMIT keys
+    if keys <= 0:
+      return 0.0
+    if field == 'docid':
+      return min(estimate, keys)
+    perKey = max(1.0, estimate_cardinality([[[field, '==', None]]], estimate))
+    return max(float(math.ceil(keys / FIRESTORE_IN_LIMIT)), min(estimate, keys * perKey))
+
+  def _join_order(self, fireQueries: Dict) -> Optional[List[Tuple]]:
+    """
+    The order the joined collections are read in, chosen from their estimated number of documents so that
+    the fewest documents are read and hashed. The first collection is read by its own queries, then the
+    joined collection with the fewest estimated documents is looked up by the join keys of the collection
+    it is joined to, and so on. Each collection is tried first, the order reading the fewest documents wins.
+
+    Args:
+      fireQueries (Dict): the Firestore conjunctions of each part
+    Returns:
+      the `(part, field, drivingPart, drivingField)` of each joined part in read order, the driving
+      part and field of the first part are None. None without JOIN
+    """
+    if not self.joins:
+      return None
+    estimates = {part: self._estimate_part(part, fireQueries[part]) for part in self.joinParts}
+    best = None
+    for first in self.joinParts:
+      order = [(first, None, None, None)]
+      sizes = {first: estimates[first]}
+      while len(order) < len(self.joinParts):
+        candidates = [(self._estimate_lookup(nextField, self._estimate_keys(part, field, sizes[part], fireQueries[part]), estimates[nextPart]),
+                       (nextPart, nextField, part, field))
+                      for (part, field, nextPart, nextField) in self._join_edges() if part in sizes and nextPart not in sizes]
+        size, step = min(candidates, key=lambda candidate: candidate[0])
+        order.append(step)
+        sizes[step[0]] = size
+      # ties go to the smallest first collection, then to the FROM order
+      cost = (sum(sizes.values()), estimates[first])
+      if best is None or cost < best[0]:
+        best = (cost, order)
+    return best[1]
+
+  def _join_read_estimates(self, fireQueries: Dict, joinOrder: List[Tuple]) -> Dict:
+    # the estimated number of documents read of each joined part, in the join order
+    sizes = {}
+    for (part, field, drivingPart, drivingField) in joinOrder:
+      estimate = self._estimate_part(part, fireQueries[part])
+      if drivingPart is None:
+        sizes[part] = estimate
+      else:
+        keys = self._estimate_keys(drivingPart, drivingField, sizes[drivingPart], fireQueries[drivingPart])
+        sizes[part] = self._estimate_lookup(field, keys, estimate)
+    return sizes
+
+  def _join_keys(self, documents: Dict, part: str, field: str) -> List:
+    # the distinct join keys of the driving documents, after their client-side filters
+    filterConjunctions = self.filter_queries(self.fireQueries).get(part)
+    matches = compile_conjunctions(filterConjunctions) if filterConjunctions else None
+    keys = []
+    seen = set()
+    for docId, doc in documents.items():
+      if matches is not None and not matches(docId, doc):
+        continue
+      key = get_document_value(docId, doc, field)
+      if isinstance(key, (str, int, float, datetime.datetime)) and key not in seen:
+        seen.add(key)
+        keys.append(key)
+    return keys
+
+  def _execute_join_lookup(self, client: FireSQLAbstractClient, part: str, field: str, conjunctions: List, keys: List) -> Dict:
+    return dict(self._iter_join_lookup(client, part, field, conjunctions, keys))
+
+  def _iter_join_lookup(self, client: FireSQLAbstractClient, part: str, field: str, conjunctions: List, keys: List) -> Iterator[Tuple[str, Dict]]:
+    # the (docId, doc) of the part matching the join keys, as they are read
+    if not conjunctions or not keys:
+      # inner join with nothing on the other side
+      return
+    if self._join_lookup_scans(part, field, conjunctions, keys):
+      yield from self._stream_part_documents(client, part, conjunctions, self._projection_fields(part))
+      return
+
+    if field == 'docid':
+      # a single batched get of all the keys, the part queries are evaluated on the documents
+      residualQueries = [query for conjunction in conjunctions for query in conjunction]
+      matches = compile_conjunctions(conjunctions)
+      documents = self._get_documents_by_ids(client, part, keys, self._projection_fields(part, residualQueries))
+      yield from ((docId, doc) for docId, doc in documents.items() if matches(docId, doc))
+      return
+
+    # a document matching several conjunctions is returned once
+    seen = set() if len(conjunctions) > 1 else None
+    for lookupConjunction, residualQueries in self._join_lookup_conjunctions(field, conjunctions, keys):
+      fields = self._projection_fields(part, residualQueries)
+      matches = compile_conjunctions([residualQueries])
+      for docId, doc in self._query_conjunction(client, part, lookupConjunction, fields).items():
+        if not matches(docId, doc):
+          continue
+        if seen is not None:
+          if docId in seen:
+            continue
+          seen.add(docId)
+        yield docId, doc
+
+  def _join_lookup_scans(self, part: str, field: str, conjunctions: List, keys: List) -> bool:
+    # whether a plain scan of the part is cheaper than looking up the keys
+    estimate = self._estimate_part(part, conjunctions)
+    if field == 'docid':
+      # more keys than documents to scan
+      return len(keys) > estimate
+    lookupQueries = math.ceil(len(keys) / FIRESTORE_IN_LIMIT) * len(conjunctions)
+    maxQueries = self.options.get('joinLookupMaxQueries', JOIN_LOOKUP_MAX_QUERIES)
+    return lookupQueries > maxQueries or lookupQueries > estimate
+
+  def _join_lookup_conjunctions(self, field: str, conjunctions: List, keys: List) -> List[Tuple[List, List]]:
+    # the `(lookupConjunction, residualQueries)` of the `field IN` queries of the keys,
+    # chunked by the Firestore IN limit, for each conjunction of the part
+    chunks = [keys[i:i + FIRESTORE_IN_LIMIT] for i in range(0, len(keys), FIRESTORE_IN_LIMIT)]
+    lookups = []
+    for conjunction in conjunctions:
+      if any(operator in MULTI_VALUE_OPERATORS or operator == '!=' for (_, operator, _) in conjunction):
+        # the keys cannot be combined with the part queries, evaluate them on the fetched documents
+        baseQueries, residualQueries = [], conjunction
+      else:
+        baseQueries, residualQueries = conjunction, []
+      for chunk in chunks:
+        lookupConjunction = FireSQLPlanner.optimize_conjunction(baseQueries + [[field, 'in', chunk]])
+        if lookupConjunction is not None:
+          lookups.append((lookupConjunction, residualQueries))
+    return lookups
+
   def filter_documents(self, documents, filterQueries: Dict) -> Dict:
     if filterQueries:
       filterDocs = {}
-      for part in filterQueries.keys():
-        if filterQueries[part]:
-          filterDocs[part] = {}
-          for filter in filterQueries[part]:
-            (field, operator, pattern) = filter
-            pattern = pattern.replace('%', '.*')
-            matchPattern = re.compile(pattern).match
-            if operator == 'like':
-              for docId, doc in documents[part].items():
-                if field in doc and matchPattern(doc[field]):
-                  filterDocs[part][docId] = doc
-            elif operator == 'not_like':
-              for docId, doc in documents[part].items():
-                if field in doc and not matchPattern(doc[field]):
-                  filterDocs[part][docId] = doc
+      for part in documents.keys():
+        conjunctions = filterQueries.get(part)
+        if conjunctions:
+          # the residual queries are compiled once, the documents are filtered in a single pass
+          matches = compile_conjunctions(conjunctions)
+          items = ((docId, doc) for docId, doc in documents[part].items() if matches(docId, doc))
+          filterDocs[part] = self._join_documents(items) if isinstance(documents[part], SpillBuffer) else dict(items)
         else:
           filterDocs[part] = documents[part]
       return filterDocs
@@ -198,12 +903,23 @@ class SQLFireQuery():
     
   def select_fields(self) -> List:
     fields = []
-    if FireSQLAggregate.hasAggregation(self.aggregationFields):
+    if self.groupBy:
+      # the GROUP BY fields and aggregations, in the selected order
+      # (the columns of a `*` expansion are not grouped)
+      for c in self.columns:
+        if c.func:
+          field = self._aggregation_name(self._get_part(c), c.func, c.column)
+        elif self._get_part_field(c) in self.groupBy:
+          field = self._group_name(*self._get_part_field(c))
+        else:
+          continue
+        if field not in fields:
+          fields.append(field)
+    elif FireSQLAggregate.hasAggregation(self.aggregationFields):
       for part in self.aggregationFields.keys():
         if self.aggregationFields[part]:
           for func, column in self.aggregationFields[part]:
-            fieldName = FireSQLAggregate.fieldName(func, column)
-            fields.append(fieldName)
+            fields.append(self._aggregation_name(part, func, column))
     else:
       # check if any field is ambiguous, rename it to become table_column
       for c in self.columns:
@@ -214,17 +930,19 @@ class SQLFireQuery():
 
   def _handle_star_fields(self, tableName: str, fields: List, documents: Dict) -> List:
     if '*' in fields:
-      if documents:
-        # find all the fields from a sample document
-        firstDocKey = next(iter(documents))
-        doc = documents[firstDocKey]
+      # the fields of the collection schema, then the other fields of the given documents
+      starFields = dict.fromkeys(self.schemaCatalog.fields(self.collections[tableName]) or []) if self.schemaCatalog else {}
+      for _, doc in documents.items():
+        if not starFields.keys() >= doc.keys():
+          starFields.update(dict.fromkeys(doc))
+      if starFields:
         # integrate all document fields into the field list
         # but skip the '*' field
         jfields = []
         for field in fields:
           if field != '*':
             jfields.append(field)
-        for field in doc.keys():
+        for field in starFields:
           if field not in fields:
             jfields.append(field)
         fields = jfields
@@ -238,21 +956,7 @@ class SQLFireQuery():
 
     return fields
 
-  def _get_field_value(self, doc, field):
-    tokens = field.split('.')
-    if len(tokens) == 1:
-      return doc.get(field, '')
-    else:
-      # loop through the subfields to reach the lowest value
-      dd = doc
-      for f in tokens:
-        dd = dd.get(f, '')
-        if not dd:
-          break
-      return dd
-
-  def _get_join_part(self, documents: Dict, partRef: SQL_SelectFrom, isStar: bool = False):
-    part, field = partRef
+  def _get_join_part(self, documents: Dict, part: str, isStar: bool = False):
     try:
       docs = documents[part]
     except Exception as e:
@@ -260,26 +964,71 @@ class SQLFireQuery():
     if isStar:
       fields = ['*']
     else:
-      fields = self.collectionFields[part]
+      # a joined collection may have no selected field
+      fields = self.collectionFields.get(part, [])
     fields = self._handle_star_fields(part, fields, docs)
-    nameMap = self.columnNameMap[part]
-    return JoinPart(docs=docs, joinField=field, selectFields=fields, nameMap=nameMap)
+    nameMap = self.columnNameMap.get(part, {})
+    return JoinPart(docs=docs, joinField=None, selectFields=fields, nameMap=nameMap)
+
+  def _join_rows(self, documents: Dict) -> List:
+    # the documents of the largest collection are probed through the hash tables of the others
+    part = max(self.joinParts, key=lambda part: len(documents.get(part, {})))
+    if part not in documents:
+      raise Exception(f"error retrieving documents from collection '{part}'")
+    return list(self._join_pipeline(documents, part, documents[part].items()))
+
+  def _join_pipeline(self, documents: Dict, probePart: str, items: Iterable[Tuple[str, Dict]]) -> Iterator[Dict]:
+    # the joined rows of the (docId, doc) items of the probe part, streamed through a left-deep pipeline
+    # of hash joins on the documents of the other parts, the smallest joined first
+    items = iter(items)
+    first = next(items, None)
+    if first is None:
+      # inner join with nothing on the probe side
+      return
+    items = itertools.chain([first], items)
+
+    # COUNT(*) does not select all the fields
+    isStar = any(c.column == '*' and not c.func for c in self.columns)
+    joinParts = {}
+    for part in self.joinParts:
+      # the fields of `*` of the probe part are its schema fields and the fields of its first document
+      joinParts[part] = self._get_join_part({probePart: dict([first])} if part == probePart else documents, part, isStar=isStar)
+    if isStar:
+      # the whole documents infer the schemas of their collections
+      for part in self.joinParts:
+        if part != probePart:
+          for _ in self._observe_schema(part, documents[part].items()):
+            pass
+      items = self._observe_schema(probePart, items)
+
+    sizes = {part: len(joinPart.docs) for part, joinPart in joinParts.items()}
+    pipelineParts = [probePart]
+    steps = []
+    for (part, field, probedPart, probeField) in self._join_expansion(probePart, sizes):
+      steps.append(JoinStep(part=dataclasses.replace(joinParts[part], joinField=field),
+                            probeIndex=pipelineParts.index(probedPart), probeField=probeField))
+      pipelineParts.append(part)
+
+    matches = FireSQLJoin().pipeline(items, steps)
+    first = next(matches, None)
+    if first is None:
+      return
+    # the fields of the rows in FROM order
+    rowParts = [(joinParts[part].selectFields, joinParts[part].nameMap) for part in self.joinParts]
+    buildRow = compile_join_row_builder(rowParts, [pipelineParts.index(part) for part in self.joinParts], missing=self._missing_value())
+    yield buildRow(first)
+    yield from map(buildRow, matches)
 
   def post_process(self, documents: Dict) -> List:
     docs = []
-    if self.on:
-      # there is join, unpack the join-on operator
-      leftRef, operator, rightRef = self.on
-      leftPart, _ = leftRef
-      leftFields = self.collectionFields[leftPart]
-      isStar = True if '*' in leftFields else False
-      # get left part
-      leftJoinPart = self._get_join_part(documents, leftRef, isStar=isStar)
-      # get right part
-      rightJoinPart = self._get_join_part(documents, rightRef, isStar=isStar)
-
-      joinOp = FireSQLJoin()
-      docs = joinOp.inner_join(leftJoinPart, rightJoinPart)
+    if self.groupBy:
+      # there is group by, one row for each group
+      docs = self.group_by(documents)
+
+    elif self.joins:
+      # there is join
+      docs = self._join_rows(documents)
+      docs = self._order_rows(docs)
 
     else:
       # there is no join
@@ -287,14 +1036,7 @@ class SQLFireQuery():
         targetDocs = documents[self.defaultPart]
         fields = self.collectionFields[self.defaultPart]
         fields = self._handle_star_fields(self.defaultPart, fields, targetDocs)
-        for docId, doc in targetDocs.items():
-          jdoc = {}
-          for field in fields:
-            if field == 'docid':
-              jdoc['docid'] = docId
-            else:
-              jdoc[ self.columnNameMap[self.defaultPart][field] ] = self._get_field_value(doc, field)
-          docs.append(jdoc)
+        docs = list(self._document_rows(self.defaultPart, fields, self._order_documents(self.defaultPart, targetDocs)))
 
     # if select distinct mode
     if self.mode == 'distinct':
@@ -303,11 +1045,233 @@ class SQLFireQuery():
       docs = self.all_distinct(docs)
 
     aggDocs = self.aggregation(docs)
-    self.result = {
+    aggDocs = self._limit_rows(aggDocs)
+    self.result = self._success_result()
+    return aggDocs
+
+  def _observe_schema(self, part: str, items: Iterable[Tuple[str, Dict]]) -> Iterable[Tuple[str, Dict]]:
+    # the whole documents of the part infer the schema of its collection as they go through
+    if self.schemaCatalog is None or self._projection_fields(part) is not None:
+      return items
+    return self.schemaCatalog.observe(self.collections[part], items)
+
+  def _missing_value(self) -> Optional[str]:
+    # a missing field is '' in the result rows, and None in the rows that are aggregated, so that
+    # the aggregations do not count it, the same as computed on the documents
+    return None if self.groupBy or FireSQLAggregate.hasAggregation(self.aggregationFields) else ''
+
+  def _document_rows(self, part: str, fields: List, items: Iterable[Tuple[str, Dict]]) -> Iterator[Dict]:
+    # the result rows of the selected fields of the part (docId, doc)
+    if '*' in self.collectionFields.get(part, []):
+      items = self._observe_schema(part, items)
+    items = iter(items)
+    first = next(items, None)
+    if first is None:
+      return
+    # the row builder is generated once the fields of `*` are known
+    buildRow = compile_row_builder(fields, dict(self.columnNameMap[part], docid='docid'), missing=self._missing_value())
+    yield buildRow(*first)
+    yield from itertools.starmap(buildRow, items)
+
+  def execute_iter(self, client: FireSQLAbstractClient) -> Iterator[Dict]:
+    """
+    Execute the query as a pull-based pipeline of operators, yielding each result row as soon as
+    it is produced: scan -> filter -> project -> join probe -> distinct -> limit.
+
+    The documents are streamed from Firestore through the operators without being collected,
+    so the first row comes after the first page of documents and the memory does not grow with
+    the result. The blocking operators collect their input first: an ORDER BY that Firestore
+    cannot serve (bounded to OFFSET + LIMIT documents with a LIMIT), GROUP BY, aggregations,
+    DISTINCT on the first field, and the build sides of a JOIN.
+
+    Args:
+      client (FireSQLAbstractClient): the client to read the documents with
+    Returns:
+      Iterator[Dict]: the result rows, the same as returned by `post_process`
+    """
+    fireQueries = self.firebase_queries(self.fireQueries)
+    if self.groupBy or FireSQLAggregate.hasAggregation(self.aggregationFields) or self.mode == 'distinct':
+      # blocking plan, the rows are produced once all the documents are read
+      documents = self.execute_query(client, fireQueries)
+      yield from self.post_process(self.filter_documents(documents, self.filter_queries(self.fireQueries)))
+      return
+
+    if self.joins:
+      rows = self._iter_join_rows(client, fireQueries)
+      if self.orderBy:
+        rows = iter(self._order_rows(list(rows)))
+    else:
+      rows = self._iter_part_rows(client, fireQueries)
+    if self.mode == 'alldistinct':
+      rows = self._iter_all_distinct(rows)
+    if self.limit is not None:
+      rows = itertools.islice(rows, self.offset, self.offset + self.limit)
+    yield from rows
+    self.result = self._success_result()
+
+  def _iter_part_rows(self, client: FireSQLAbstractClient, fireQueries: Dict) -> Iterator[Dict]:
+    # the rows of a single collection, in ORDER BY order
+    part = self.defaultPart
+    conjunctions = fireQueries.get(part, [])
+    fields = self._projection_fields(part)
+    orderBy = [(field, direction) for (_, field, direction) in self.orderBy]
+    count = self._limit_count()
+    if count is not None and self._is_part_result(part):
+      # at most OFFSET + LIMIT documents, ordered and limited by Firestore when it can
+      items = self._execute_part_top(client, part, conjunctions, fields, count).items()
+    elif (orderBy and len(conjunctions) == 1 and self._conjunction_access(conjunctions[0]) == 'query'
+          and not self.filter_queries(self.fireQueries).get(part) and self._can_push_order(conjunctions[0], orderBy)):
+      # streamed in order by Firestore
+      items = self._stream_part_documents(client, part, conjunctions, fields, orderBy=orderBy)
+    elif orderBy:
+      order = FireSQLOrderBy(orderBy)
+      items = order.sort(filter(order.has_document_fields, self._stream_part_documents(client, part, conjunctions, fields)),
+                         key=order.document_key)
+    else:
+      items = self._stream_part_documents(client, part, conjunctions, fields)
+
+    items = iter(items)
+    fields = self.collectionFields[part]
+    if '*' in fields:
+      # the fields of `*` are the schema fields and the fields of the first document
+      first = next(items, None)
+      if first is None:
+        return
+      fields = self._handle_star_fields(part, fields, dict([first]))
+      items = itertools.chain([first], items)
+    yield from self._document_rows(part, fields, items)
+
+  def _iter_join_rows(self, client: FireSQLAbstractClient, fireQueries: Dict) -> Iterator[Dict]:
+    # the joined rows: the collections are read in join order, each one looked up by the join keys
+    # of the one before, the documents of the last one are streamed through the hash tables of the others
+    joinOrder = self._join_order(fireQueries)
+    filterQueries = self.filter_queries(self.fireQueries)
+    documents = {}
+    for index, (part, field, drivingPart, drivingField) in enumerate(joinOrder):
+      if drivingPart is None:
+        # filtered as they are read
+        items = self._stream_part_documents(client, part, fireQueries[part], self._projection_fields(part))
+      else:
+        keys = self._join_keys(documents[drivingPart], drivingPart, drivingField)
+        items = self._iter_join_lookup(client, part, field, fireQueries[part], keys)
+        if filterQueries.get(part):
+          matches = compile_conjunctions(filterQueries[part])
+          items = ((docId, doc) for docId, doc in items if matches(docId, doc))
+      if index < len(joinOrder) - 1:
+        documents[part] = self._join_documents(items)
+    yield from self._join_pipeline(documents, part, items)
+
+  def _iter_all_distinct(self, rows: Iterable[Dict]) -> Iterator[Dict]:
+    # the first row of each distinct combination of values, as in `all_distinct`
+    seen = set()
+    for row in rows:
+      key = tuple(row.values())
+      if key not in seen:
+        seen.add(key)
+        yield row
+
+  def _success_result(self) -> Dict:
+    result = {
       'success': True,
       'message': ''
     }
-    return aggDocs
+    missingDocIds = {collectionName: list(docIds) for collectionName, docIds in self.missingDocIds.items() if docIds}
+    if missingDocIds:
+      # the looked up document ids without a document, for each collection
+      result['missingDocIds'] = missingDocIds
+    return result
+
+  def _order_documents(self, part: str, documents: Dict) -> List:
+    # the (docId, doc) of the part in ORDER BY order, documents without an ORDER BY field are left out
+    orderBy = [(field, direction) for (orderPart, field, direction) in self.orderBy if orderPart == part]
+    if not orderBy:
+      return documents.items()
+    order = FireSQLOrderBy(orderBy)
+    items = filter(order.has_document_fields, documents.items())
+    count = self._limit_count()
+    if count is not None and self._is_part_result(part):
+      return order.top(items, count, key=order.document_key)
+    return order.sort(items, key=order.document_key)
+
+  def _order_rows(self, rows: List) -> List:
+    # order the joined rows by their selected ORDER BY columns
+    orderBy = []
+    for (part, field, direction) in self.orderBy:
+      if part is None:
+        continue
+      orderBy.append( (self._join_row_name(part, field), direction) )
+    if not orderBy:
+      return rows
+    order = FireSQLOrderBy(orderBy)
+    return order.sort(rows, key=order.row_key)
+
+  def _join_row_name(self, part: str, field: str) -> str:
+    # the name of a field in the joined rows, only the selected fields are joined
+    name = self.columnNameMap.get(part, {}).get(field)
+    if name is None:
+      raise Exception(f"field '{field}' of a JOIN must be selected to be ordered or grouped")
+    return name
+
+  def _document_value(self, docId: str, doc: Dict, field: str):
+    value = get_document_value(docId, doc, field)
+    return None if value is MISSING_VALUE else value
+
+  def _group_operator(self, getName) -> FireSQLGroupBy:
+    # the hash aggregation of the GROUP BY fields and aggregations, `getName(part, field)`
+    # is the name of a field in the aggregated rows
+    groupFields = [getName(part, field) for (part, field) in self.groupBy]
+    aggregations = [(func, column if column == '*' else getName(part, column)) for (part, func, column) in self.groupAggregations]
+    return FireSQLGroupBy(groupFields, aggregations)
+
+  def group_by(self, documents: Dict) -> List:
+    if self.groups is None:
+      # the documents were not aggregated as they were read
+      if self.joins:
+        rows = self._join_rows(documents)
+        self.groups = self._group_operator(self._join_row_name)
+        for row in rows:
+          self.groups.add(lambda name: row.get(name))
+      else:
+        self.groups = self._group_operator(lambda part, field: field)
+        for docId, doc in documents.get(self.defaultPart, {}).items():
+          self.groups.add(lambda field: self._document_value(docId, doc, field))
+
+    groupNames = [self._group_name(part, field) for (part, field) in self.groupBy]
+    aggregationNames = [self._aggregation_name(part, func, column) for (part, func, column) in self.groupAggregations]
+    rows = []
+    for groupValues, aggregationValues in self.groups.results():
+      row = dict(zip(groupNames, groupValues))
+      row.update(zip(aggregationNames, aggregationValues))
+      if self.having is None or self._match_having(self.having, row):
+        rows.append(row)
+
+    orderBy = []
+    for (part, field, direction) in self.orderBy:
+      if part is None:
+        orderBy.append( (field, direction) )
+      elif (part, field) in self.groupBy:
+        orderBy.append( (self._group_name(part, field), direction) )
+      else:
+        raise Exception(f"ORDER BY field '{field}' must be in the GROUP BY clause or aggregated")
+    if orderBy:
+      order = FireSQLOrderBy(orderBy)
+      rows = order.sort(rows, key=order.row_key)
+
+    # only the selected columns
+    fields = self.select_fields()
+    return [{field: row[field] for field in fields} for row in rows]
+
+  def _match_having(self, node: PlanNode, row: Dict) -> bool:
+    if isinstance(node, PlanBool):
+      matches = (self._match_having(child, row) for child in node.children)
+      return all(matches) if node.operator == 'and' else any(matches)
+    name, operator, value = node.query
+    return compare_values(operator, row.get(name, MISSING_VALUE), value)
+
+  def _limit_rows(self, rows: List) -> List:
+    if self.limit is None:
+      return rows
+    return rows[self.offset:self.offset + self.limit]
 
   def distinct(self, documents: Dict) -> List:
     # distinct only for the first field
@@ -330,11 +1294,140 @@ class SQLFireQuery():
     return list( distinctDocs.values() )
 
   def aggregation(self, documents: Dict) -> List:
+    if self.aggregates is not None:
+      return [dict(self.aggregates)]
+    if self.groupBy:
+      # aggregated for each group
+      return documents
     if FireSQLAggregate.hasAggregation(self.aggregationFields):
-      fireAggregate = FireSQLAggregate()
-      return fireAggregate.aggregation(self.aggregationFields, documents)
+      # a single row of the aggregations of all the rows
+      aggregate = self._aggregate_operator(self._join_row_name)
+      for doc in documents:
+        aggregate.add(doc.get)
+      return [aggregate.results()]
     else:
       return documents
 
   def execution_result(self) -> Dict:
     return self.result
+
+  def collection_access(self) -> Tuple[Set[str], Set[str]]:
+    # the collections read and written by the statement
+    return set(self.collections.values()), set()
+
+  def explain(self) -> List[Dict]:
+    """
+    Describe the execution plan of the query, without executing it.
+
+    Returns:
+      List[Dict]: the operators in execution order, with their `operator`, `collection`, `detail`
+        and `estimatedReads`, and the `probe` that EXPLAIN ANALYZE measures: the collection name
+        for Firestore reads, or the name of the method executing the operator
+    """
+    plan = []
+    def _add(operator, collection='', detail='', estimatedReads=None, probe=None):
+      plan.append({'operator': operator, 'collection': collection, 'detail': detail,
+                   'estimatedReads': estimatedReads, 'probe': probe})
+
+    fireQueries = self.firebase_queries(self.fireQueries)
+    filterQueries = self.filter_queries(self.fireQueries)
+    aggregations = self._server_aggregations(fireQueries)
+    joinOrder = self._join_order(fireQueries) or []
+    joinEstimates = self._join_read_estimates(fireQueries, joinOrder)
+    lookups = {part: (field, drivingPart, drivingField) for (part, field, drivingPart, drivingField) in joinOrder if drivingPart is not None}
+    parts = [part for part in fireQueries if part not in lookups] + list(lookups)
+
+    for part in parts:
+      collectionName = self.collections[part]
+      conjunctions = fireQueries[part]
+      estimate = self._estimate_part(part, conjunctions)
+      where = format_conjunctions(conjunctions)
+      fields = self._projection_fields(part)
+      if fields is None:
+        notes = ''
+      else:
+        notes = f"fields {', '.join(fields)}" if fields else 'document ids only'
+      pushed = []
+      for conjunction in self.fireQueries.get(part, []):
+        pushed.extend(query for query in self._split_conjunction(conjunction)[2] if query not in pushed)
+      if pushed:
+        pushedText = ', '.join(format_conjunctions([[query]]) for query in pushed)
+        notes = '; '.join(filter(None, [f'pushed down {pushedText}', notes]))
+
+      if not conjunctions:
+        _add('no read', collectionName, 'the WHERE clause is always false', 0, probe=collectionName)
+      elif aggregations is not None:
+        names = ', '.join(FireSQLAggregate.fieldName(func, column) for (func, column) in aggregations)
+        detail = f'{names} WHERE {where}' if where else names
+        # Firestore bills an aggregation query 1 read per 1000 index entries
+        _add('aggregation query', collectionName, detail, max(1, math.ceil(estimate / 1000)), probe=collectionName)
+      elif part in lookups:
+        lookupField, drivingPart, drivingField = lookups[part]
+        if lookupField == 'docid':
+          detail = f'docid IN ({drivingPart}.{drivingField} keys), batched get'
+        else:
+          detail = f'{lookupField} IN ({drivingPart}.{drivingField} keys), {FIRESTORE_IN_LIMIT} keys per query'
+        if where:
+          detail += f' AND {where}'
+        _add('join lookup', collectionName, '; '.join(filter(None, [detail, notes])), math.ceil(joinEstimates[part]), probe=collectionName)
+      else:
+        accesses = [self._conjunction_access(conjunction) for conjunction in conjunctions]
+        if 'collection scan' in accesses:
+          operator = 'collection scan'
+        elif all(access == 'batched get' for access in accesses):
+          operator = 'batched get'
+        else:
+          operator = 'query'
+        detail = where
+        scan = self._scan_partitions()
+        count = self._limit_count()
+        if count is not None and self._is_part_result(part) and operator != 'batched get':
+          orderBy = [(field, direction) for (_, field, direction) in self.orderBy]
+          if not filterQueries.get(part) and all(self._can_push_order(conjunction, orderBy) for conjunction in conjunctions):
+            orderText = ', '.join(f'{field} {direction.upper()}' for (field, direction) in orderBy)
+            detail += (f' ORDER BY {orderText}' if orderBy else '') + f' LIMIT {count}'
+            estimate = min(estimate, count * len(conjunctions))
+            # a limited scan is a single query
+            scan = None
+        if operator == 'collection scan' and scan is not None:
+          notes = '; '.join(filter(None, ['{} key ranges, {} workers'.format(*scan), notes]))
+        _add(operator, collectionName, '; '.join(filter(None, [detail.strip(), notes])), math.ceil(estimate), probe=collectionName)
+
+    for part, conjunctions in filterQueries.items():
+      if conjunctions:
+        _add('filter', self.collections[part], format_conjunctions(conjunctions), probe='filter_documents')
+
+    if joinOrder:
+      # the collection read last is probed through the hash tables of the others, in a pipeline
+      # (the largest collection once all are read, known at run time)
+      steps = self._join_expansion(joinOrder[-1][0], joinEstimates)
+      budget = self.options.get('joinMemoryBudget')
+      spill = f'; spilled to disk over {budget // len(self.joinParts)} bytes' if budget is not None else ''
+      for index, (part, field, probedPart, probeField) in enumerate(steps):
+        _add('hash join', f'{probedPart}, {part}', f'{probedPart}.{probeField} = {part}.{field}; build side {part} (estimated){spill}',
+             probe='_join_rows' if index == len(steps) - 1 else None)
+
+    if self.groupBy:
+      detail = 'GROUP BY ' + ', '.join(field for (_, field) in self.groupBy)
+      if self.groupAggregations:
+        detail += '; ' + ', '.join(FireSQLAggregate.fieldName(func, column) for (_, func, column) in self.groupAggregations)
+      if self.having:
+        detail += '; HAVING'
+      _add('hash aggregate', detail=detail, probe='group_by')
+    elif FireSQLAggregate.hasAggregation(self.aggregationFields) and aggregations is None:
+      _add('aggregate', detail=', '.join(self.select_fields()), probe='aggregation')
+
+    if self.mode == 'distinct':
+      _add('distinct', detail=', '.join(self.select_fields()[:1]), probe='distinct')
+    elif self.mode == 'alldistinct':
+      _add('distinct', detail=', '.join(self.select_fields()), probe='all_distinct')
+
+    if self.orderBy and not self.groupBy:
+      detail = 'ORDER BY ' + ', '.join(f'{field} {direction.upper()}' for (_, field, direction) in self.orderBy)
+      count = self._limit_count()
+      operator = 'top-n sort' if count is not None and self._is_part_result(self.defaultPart) else 'sort'
+      _add(operator, detail=detail, probe='_order_rows' if self.joins else '_order_documents')
+
+    if self.limit is not None:
+      _add('limit', detail=f'LIMIT {self.limit} OFFSET {self.offset}', probe='_limit_rows')
+    return plan
@@ -1,8 +1,12 @@
-from typing import Dict, List
+from typing import Dict, List, Optional, Set, Tuple
 
 from .sql_objects import (
   SQL_Update,
+  SQL_Parameter,
 )
+from .sql_prepared import SQL_Parameters, bind_parameter_value
+from .sql_plan import format_value
+from .sql_projection import compile_row_builder
 
 from .sql_fire_client import FireSQLAbstractClient
 from .sql_fire_query import SQLFireQuery
@@ -18,9 +22,8 @@ class SQLFireUpdate(SQLFireQuery):
     self._init_update_sets(update)
 
     # create queries for each collections (parts)
-    # return a dicitionary of {part -> [queries]}
-    self.fireQueries = {}
-    self._init_query_refs(update.where, fireQueries=self.fireQueries)
+    # return a dicitionary of {part -> [[queries] OR [queries] ...]}
+    self._init_query_plan(update.where)
     return self.fireQueries
 
   def _init_update_collection_refs(self, update: SQL_Update, options: Dict = {}):
@@ -39,48 +42,87 @@ class SQLFireUpdate(SQLFireQuery):
     self.sets[table.part] = {}
     for expr in update.sets:
       field = expr.left.column
-      value = expr.right.value
+      # bind parameter is substituted at execution time
+      value = expr.right if isinstance(expr.right, SQL_Parameter) else expr.right.value
       self.sets[table.part][field] = value
 
+  def bind(self, parameters: SQL_Parameters = None) -> 'SQLFireUpdate':
+    bound = super(SQLFireUpdate, self).bind(parameters)
+    bound.sets = {}
+    for part, sets in self.sets.items():
+      bound.sets[part] = {field: bind_parameter_value(value, parameters) for field, value in sets.items()}
+    return bound
+
+  def collection_access(self) -> Tuple[Set[str], Set[str]]:
+    return set(self.collections.values()), {self.collections[self.defaultPart]}
+
+  def explain(self) -> List[Dict]:
+    plan = super(SQLFireUpdate, self).explain()
+    sets = ', '.join(f'{field} = {format_value(value)}' for field, value in self.sets[self.defaultPart].items())
+    plan.append({'operator': 'update', 'collection': self.collections[self.defaultPart], 'detail': f'SET {sets}',
+                 'estimatedReads': None, 'probe': 'execute'})
+    return plan
+
+  def _projection_fields(self, part: str, queries: List = []) -> Optional[List]:
+    # whole documents are needed
+    return None
+
   def post_process(self, documents: Dict) -> List:
     docs = []
     if self.defaultPart in documents:
       targetDocs = documents[self.defaultPart]
       fields = self.collectionFields[self.defaultPart]
       fields = self._handle_star_fields(self.defaultPart, fields, targetDocs)
+      buildRow = compile_row_builder(fields, dict(self.columnNameMap[self.defaultPart], docid='docid'))
       for docId, doc in targetDocs.items():
-        jdoc = {}
+        jdoc = buildRow(docId, doc)
         for field in fields:
-          if field == 'docid':
-            jdoc['docid'] = docId
-          elif field in self.sets[self.defaultPart]:
+          if field != 'docid' and field in self.sets[self.defaultPart]:
             jdoc[ self.columnNameMap[self.defaultPart][field] ] = self.sets[self.defaultPart][field]
-          else:
-            jdoc[ self.columnNameMap[self.defaultPart][field] ] = self._get_field_value(doc, field)
         docs.append(jdoc)
 
     return docs
 
   def execute(self, client: FireSQLAbstractClient, documents: List):
     docs = []
+    for docId, jdoc, updateDoc in self.update_rows(documents):
+      docs.append(jdoc)
+
+      # execute update to docId
+      if updateDoc:
+        self.result = client.update_collection_document(self.defaultPart, docId, updateDoc)
+
+    self.result = self._success_result()
+    return docs
+
+  def update_rows(self, documents: Dict) -> List[Tuple[str, Dict, Dict]]:
+    """
+    Args:
+      documents (Dict): the filtered documents of each part
+    Returns:
+      List: the `(docId, resultDoc, updateDoc)` of each document to update
+    """
+    rows = []
     if self.defaultPart in documents:
       targetDocs = documents[self.defaultPart]
       fields = self.collectionFields[self.defaultPart]
       fields = self._handle_star_fields(self.defaultPart, fields, targetDocs)
+      buildRow = compile_row_builder(fields, dict(self.columnNameMap[self.defaultPart], docid='docid'))
       for docId, doc in targetDocs.items():
         # jdoc for return list
-        jdoc = {}
+        jdoc = buildRow(docId, doc)
         # udoc for update
         updateDoc = {}
         for field in fields:
           if field == 'docid':
-            jdoc['docid'] = docId
-          elif field in self.sets[self.defaultPart]:
-            jdoc[ self.columnNameMap[self.defaultPart][field] ] = self.sets[self.defaultPart][field]
-            updateDoc[ self.columnNameMap[self.defaultPart][field] ] = self.sets[self.defaultPart][field]
-          else:
-            jdoc[ self.columnNameMap[self.defaultPart][field] ] = self._get_field_value(doc, field)
-            updateDoc[ self.columnNameMap[self.defaultPart][field] ] = self._get_field_value(doc, field)
+            continue
+          name = self.columnNameMap[self.defaultPart][field]
+          if field in self.sets[self.defaultPart]:
+            jdoc[name] = self.sets[self.defaultPart][field]
+            updateDoc[name] = self.sets[self.defaultPart][field]
+          elif field in doc:
+            # the fields of the other documents are not added
+            updateDoc[name] = jdoc[name]
 
         # catch all new fields the update
         for field in self.sets[self.defaultPart].keys():
@@ -88,14 +130,5 @@ class SQLFireUpdate(SQLFireQuery):
             jdoc[field] = self.sets[self.defaultPart][field]
             updateDoc[field] = self.sets[self.defaultPart][field]
 
-        docs.append(jdoc)
-
-        # execute update to docId
-        if updateDoc:
-          self.result = client.update_collection_document(self.defaultPart, docId, updateDoc)
-
-    self.result = {
-      'success': True,
-      'message': ''
-    }
-    return docs
+        rows.append((docId, jdoc, updateDoc))
+    return rows
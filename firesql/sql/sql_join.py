@@ -1,5 +1,27 @@
+import dataclasses
+import math
+import pickle
+import tempfile
 from dataclasses import dataclass
-from typing import Dict, List
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from .sql_projection import compile_join_row_builder
+
+# maximum number of chunked IN queries to look up a join part by the join keys,
+# beyond that the join part is read by its own queries
+JOIN_LOOKUP_MAX_QUERIES = 100
+
+# partitions of a hash join spilled to disk, each one a temp file for each side,
+# and how many times a partition still over the memory budget is partitioned again
+JOIN_SPILL_MAX_PARTITIONS = 64
+JOIN_SPILL_MAX_DEPTH = 3
+
+# in memory, the documents take about 3 times the size of their pickle
+SPILL_MEMORY_FACTOR = 3
+
+# records of a spilled join side pickled together, fewer for the partitions that are all written at once
+SPILL_CHUNK_RECORDS = 256
+SPILL_PARTITION_CHUNK_RECORDS = 16
 
 @dataclass
 class JoinPart():
@@ -8,6 +30,113 @@ class JoinPart():
   selectFields: List
   nameMap: Dict
 
+@dataclass
+class JoinStep():
+  # a hash join of a pipeline: the part documents are hashed by their join field, and probed
+  # with the `probeField` of the `probeIndex`th part already matched
+  part: JoinPart
+  probeIndex: int
+  probeField: str
+
+
+class SpillBuffer():
+  """
+  The records of a join side, e.g. the (docId, doc) of a part, kept in memory until their
+  size exceeds the memory budget, then all written to a temp file. The size in memory is
+  estimated from the pickled records, measured and written `chunk` records at a time.
+  The temp file is deleted once closed or garbage collected.
+
+  Like the dict of the documents of a part, the (docId, doc) are iterated by `items()`.
+  """
+
+  def __init__(self, budget: int, chunk: int = SPILL_CHUNK_RECORDS):
+    self.budget = budget
+    self.chunk = chunk
+    self.count = 0
+    self.records = []
+    self.file = None
+    self._bytes = 0
+    # the records not measured yet, at the end of `records`
+    self._pending = 0
+
+  @property
+  def spilled(self) -> bool:
+    self.flush()
+    return self.file is not None
+
+  @property
+  def bytes(self) -> int:
+    self.flush()
+    return self._bytes
+
+  def append(self, record: Tuple):
+    self.records.append(record)
+    self.count += 1
+    self._pending += 1
+    if self._pending >= self.chunk:
+      self.flush()
+
+  def extend(self, records: Iterable[Tuple]):
+    for record in records:
+      self.append(record)
+
+  def flush(self):
+    # measure the pending records, and write them once over the budget
+    if not self._pending:
+      return
+    pending = self.records[-self._pending:]
+    self._pending = 0
+    data = self._dumps(pending)
+    self._bytes += len(data) * SPILL_MEMORY_FACTOR
+    if self.file is not None:
+      self.file.write(data)
+      self.records = []
+    elif self._bytes > self.budget:
+      self.file = tempfile.TemporaryFile()
+      memoryRecords = self.records[:-len(pending)]
+      for start in range(0, len(memoryRecords), self.chunk):
+        self.file.write(self._dumps(memoryRecords[start:start + self.chunk]))
+      self.file.write(data)
+      self.records = []
+
+  def _dumps(self, records: List[Tuple]) -> bytes:
+    try:
+      return pickle.dumps(records, protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception as e:
+      raise Exception(f"cannot spill the join documents to disk: {e}")
+
+  def __len__(self) -> int:
+    return self.count
+
+  def __iter__(self) -> Iterator[Tuple]:
+    self.flush()
+    if self.file is None:
+      yield from self.records
+      return
+    self.file.flush()
+    # each iteration keeps its offset, so the records can be iterated more than once at a time,
+    # the file is left at its end for the next appends
+    end = self.file.seek(0, 2)
+    offset = 0
+    try:
+      while offset < end:
+        self.file.seek(offset)
+        records = pickle.load(self.file)
+        offset = self.file.tell()
+        yield from records
+    finally:
+      if self.file is not None and not self.file.closed:
+        self.file.seek(0, 2)
+
+  def items(self) -> Iterator[Tuple]:
+    return iter(self)
+
+  def close(self):
+    if self.file is not None:
+      self.file.close()
+      self.file = None
+    self.records = []
+
 
 class FireSQLJoin():
 
@@ -48,7 +177,6 @@ class FireSQLJoin():
 
 
   def inner_join(self, leftJoinPart: JoinPart, rightJoinPart: JoinPart) -> List:
-    docs = []
     # assign longer part to be lookupPart and the other part is loopPart
     if len(leftJoinPart.docs) > len(rightJoinPart.docs):
       lookupPart = leftJoinPart
@@ -57,16 +185,43 @@ class FireSQLJoin():
       lookupPart = rightJoinPart
       loopPart = leftJoinPart
 
-    # create fast lookup for the right part
+    keyLookup = self.build(lookupPart)
+    return list(self.probe(loopPart, loopPart.docs.items(), lookupPart, keyLookup))
+
+  def build(self, lookupPart: JoinPart) -> Dict:
+    """
+    Build the hash table of the lookup part documents by their join key.
+
+    Args:
+      lookupPart (JoinPart): the documents to look up
+    Returns:
+      Dict: join key -> list of (docId, doc)
+    """
     keyLookup = {}
     for docId, doc in lookupPart.docs.items():
+      if lookupPart.joinField != "docid" and lookupPart.joinField not in doc:
+        # without a join key, nothing to join with
+        continue
       key = doc[lookupPart.joinField] if lookupPart.joinField != "docid" else docId
       if key not in keyLookup:
         keyLookup[key] = [ (docId, doc) ]
       else:
         keyLookup[key].append( (docId, doc) )
+    return keyLookup
 
-    for ldocId, ldoc in loopPart.docs.items():
+  def probe(self, loopPart: JoinPart, items: Iterable[Tuple[str, Dict]], lookupPart: JoinPart, keyLookup: Dict) -> Iterator[Dict]:
+    """
+    Probe the hash table with the loop part documents, yielding the joined rows as they are matched.
+
+    Args:
+      loopPart (JoinPart): the join field, select fields and name map of the loop part
+      items (Iterable): the (docId, doc) of the loop part, e.g. streamed from Firestore
+      lookupPart (JoinPart): the lookup part of the hash table
+      keyLookup (Dict): the hash table returned by `build`
+    Returns:
+      Iterator[Dict]: the joined rows
+    """
+    for ldocId, ldoc in items:
       # if ldoc[loopPart.joinField] in keyLookup:
       if loopPart.joinField == "docid":
         joinField_val = ldocId
@@ -90,6 +245,100 @@ class FireSQLJoin():
               jdoc[lookupPart.nameMap[field]] = rdocId
             else:
               jdoc[ lookupPart.nameMap[ field ] ] = self._get_field_value(rdoc, field)
-          docs.append(jdoc)
+          yield jdoc
 
-    return docs
+  def pipeline(self, items: Iterable[Tuple[str, Dict]], steps: List[JoinStep]) -> Iterator[Tuple]:
+    """
+    Join the streamed documents through a left-deep pipeline of hash joins. Each document is
+    probed through the hash tables of the steps in turn, only the matches of the document are
+    kept in between, so no intermediate result is built.
+
+    The step parts that spilled to disk (their docs a `SpillBuffer` over its budget) are joined
+    as partitioned (Grace) hash joins instead: the rows are the same, in another order.
+
+    Args:
+      items (Iterable): the (docId, doc) of the streamed part
+      steps (List[JoinStep]): the hash joins, in pipeline order
+    Returns:
+      Iterator[Tuple]: the (docId, doc) of each part of a joined row, the streamed part first
+        then the part of each step
+    """
+    matches = ((item,) for item in items)
+    for step in steps:
+      if isinstance(step.part.docs, SpillBuffer) and step.part.docs.spilled:
+        matches = self.partitioned_join(matches, step, step.part.docs.budget)
+      else:
+        matches = self._hash_join(matches, step)
+    yield from matches
+
+  def _hash_join(self, matches: Iterable[Tuple], step: JoinStep) -> Iterator[Tuple]:
+    # the matches extended by the step part documents with the same join key, hashed in memory
+    keyLookup = self.build(step.part)
+    for match in matches:
+      for lookup in keyLookup.get(self._join_key(match[step.probeIndex], step.probeField), ()):
+        yield match + (lookup,)
+
+  def partitioned_join(self, matches: Iterable[Tuple], step: JoinStep, budget: int, depth: int = 0) -> Iterator[Tuple]:
+    """
+    Grace hash join of the matches with the step part documents: both sides are partitioned by the
+    hash of their join key into temp files, so that the documents of a partition fit in the memory
+    budget, then each pair of partitions is hash joined in memory. A partition still over the budget,
+    e.g. of a skewed key, is partitioned again with another hash.
+
+    Args:
+      matches (Iterable): the matched (docId, doc) tuples to probe with
+      step (JoinStep): the hash join, its part documents are read once
+      budget (int): the memory budget of the hash table, in bytes
+      depth (int): the number of times the documents were partitioned already
+    Returns:
+      Iterator[Tuple]: the matches extended by each matching (docId, doc) of the step part
+    """
+    buildDocs = step.part.docs
+    size = buildDocs.bytes if isinstance(buildDocs, SpillBuffer) else 0
+    count = min(JOIN_SPILL_MAX_PARTITIONS, max(2, math.ceil(2 * size / max(budget, 1))))
+    # the partitions are written to disk right away
+    buildPartitions = [SpillBuffer(0, chunk=SPILL_PARTITION_CHUNK_RECORDS) for _ in range(count)]
+    probePartitions = [SpillBuffer(0, chunk=SPILL_PARTITION_CHUNK_RECORDS) for _ in range(count)]
+    try:
+      joinField = step.part.joinField
+      for docId, doc in buildDocs.items():
+        if joinField != "docid" and joinField not in doc:
+          # without a join key, nothing to join with
+          continue
+        key = self._join_key((docId, doc), joinField)
+        buildPartitions[hash((depth, key)) % count].append((docId, doc))
+      for match in matches:
+        key = self._join_key(match[step.probeIndex], step.probeField)
+        probePartitions[hash((depth, key)) % count].append(match)
+
+      for buildPartition, probePartition in zip(buildPartitions, probePartitions):
+        if not len(buildPartition) or not len(probePartition):
+          continue
+        partitionStep = dataclasses.replace(step, part=dataclasses.replace(step.part, docs=buildPartition))
+        if buildPartition.bytes > budget and depth < JOIN_SPILL_MAX_DEPTH:
+          yield from self.partitioned_join(probePartition, partitionStep, budget, depth + 1)
+        else:
+          yield from self._hash_join(probePartition, partitionStep)
+        buildPartition.close()
+        probePartition.close()
+    finally:
+      for partition in buildPartitions + probePartitions:
+        partition.close()
+
+  def _join_key(self, item: Tuple[str, Dict], field: str):
+    # the join key of a (docId, doc) to probe a hash table with
+    docId, doc = item
+    return docId if field == "docid" else doc.get(field, None)
+
+  def join_row(self, joinParts: List[JoinPart], items: List[Tuple[str, Dict]]) -> Dict:
+    """
+    The joined row of the selected fields of the (docId, doc) of each part.
+
+    Args:
+      joinParts (List[JoinPart]): the select fields and name map of each part
+      items (List): the (docId, doc) of each part, in the same order
+    Returns:
+      Dict: the joined row
+    """
+    buildRow = compile_join_row_builder([(joinPart.selectFields, joinPart.nameMap) for joinPart in joinParts], range(len(joinParts)))
+    return buildRow(items)
@@ -42,7 +42,16 @@ class SQL_ValueJSON():
   type='json'
   value: Any
 
-SQL_Value = Union[SQL_ValueBool, SQL_ValueNumber, SQL_ValueString, SQL_ValueDateTime, SQL_ValueJSON]
+@dataclass
+class SQL_Parameter():
+  """
+  Store information about a bind parameter placeholder, `?` or `:name`
+  """
+  type='parameter'
+  index: int
+  name: str = None
+
+SQL_Value = Union[SQL_ValueBool, SQL_ValueNumber, SQL_ValueString, SQL_ValueDateTime, SQL_ValueJSON, SQL_Parameter]
 SQL_ValueList = List[SQL_Value]
 
 @dataclass
@@ -76,12 +85,21 @@ class SQL_BinaryExpression():
 
 @dataclass
 class SQL_JoinExpression():
+  """
+  Store information about a JOIN, the left of a chain of JOINs is the JOIN before
+  """
   type='join_expr'
   operator: str
-  left: SQL_SelectFrom
+  left: Union[SQL_SelectFrom, 'SQL_JoinExpression']
   right: SQL_SelectFrom
   on: SQL_BinaryExpression
 
+@dataclass
+class SQL_OrderBy():
+  type='order_by'
+  column: SQL_ColumnRef
+  direction: str
+
 @dataclass
 class SQL_Select():
   type='select'
@@ -89,6 +107,11 @@ class SQL_Select():
   columns: List[SQL_ColumnRef]
   froms: Union[SQL_JoinExpression, List[SQL_SelectFrom]]
   where: SQL_BinaryExpression
+  groupBy: List[SQL_ColumnRef] = None
+  having: SQL_BinaryExpression = None
+  orderBy: List[SQL_OrderBy] = None
+  limit: int = None
+  offset: int = None
   
 @dataclass
 class SQL_Update():
@@ -111,3 +134,9 @@ class SQL_Delete():
   where: SQL_BinaryExpression
 
 SQL_DML_Command = Union[SQL_Select, SQL_Insert, SQL_Update, SQL_Delete]
+
+@dataclass
+class SQL_Explain():
+  type='explain'
+  command: SQL_DML_Command
+  analyze: bool
@@ -0,0 +1,128 @@
+import datetime
+import heapq
+from typing import Any, Callable, Iterable, List, Tuple
+
+from .sql_plan import MISSING_VALUE, get_document_value
+
+# Firestore ordering of values of different types
+def _type_rank(value: Any) -> int:
+  if value is MISSING_VALUE:
+    return -1
+  elif value is None:
+    return 0
+  elif isinstance(value, bool):
+    return 1
+  elif isinstance(value, (int, float)):
+    return 2
+  elif isinstance(value, datetime.datetime):
+    return 3
+  elif isinstance(value, str):
+    return 4
+  elif isinstance(value, bytes):
+    return 5
+  elif isinstance(value, list):
+    return 8
+  elif isinstance(value, dict):
+    return 9
+  return 10
+
+
+def order_value_key(value: Any) -> Tuple:
+  """
+  The sort key of a field value, values of different types are ordered the same as Firestore:
+  null < boolean < number < timestamp < string < bytes < array < map.
+  Missing fields sort before null.
+
+  Args:
+    value (Any): a document field value, or `MISSING_VALUE`
+  Returns:
+    Tuple: a key comparable with the key of any other value
+  """
+  rank = _type_rank(value)
+  if rank in (-1, 0):
+    return (rank, 0)
+  elif rank == 8:
+    return (rank, [order_value_key(v) for v in value])
+  elif rank == 9:
+    return (rank, [(k, order_value_key(v)) for k, v in sorted(value.items())])
+  elif rank == 10:
+    return (rank, repr(value))
+  return (rank, value)
+
+
+def is_missing_index_error(error: Exception) -> bool:
+  """
+  Whether a Firestore query failed with `FailedPrecondition`, as an ordered query without its
+  composite index does. The error is recognized by its class name, so the Google API client is not imported.
+  """
+  return any(errorClass.__name__ == 'FailedPrecondition' for errorClass in type(error).__mro__)
+
+
+class _Descending():
+  # reverse the comparison of a sort key
+  __slots__ = ('key',)
+
+  def __init__(self, key):
+    self.key = key
+
+  def __lt__(self, other):
+    return other.key < self.key
+
+  def __eq__(self, other):
+    return self.key == other.key
+
+
+class FireSQLOrderBy():
+  """
+  FireSQLOrderBy orders documents or result rows by a list of `(field, direction)`,
+  direction being `asc` or `desc`.
+  """
+
+  def __init__(self, orderBy: List[Tuple[str, str]]):
+    self.orderBy = orderBy
+
+  def key(self, getValue: Callable[[str], Any]) -> Tuple:
+    keys = []
+    for field, direction in self.orderBy:
+      key = order_value_key(getValue(field))
+      keys.append(_Descending(key) if direction == 'desc' else key)
+    return tuple(keys)
+
+  def document_key(self, item: Tuple[str, dict]) -> Tuple:
+    docId, doc = item
+    return self.key(lambda field: get_document_value(docId, doc, field))
+
+  def has_document_fields(self, item: Tuple[str, dict]) -> bool:
+    # as in Firestore, a document without an ORDER BY field is not part of the ordered result
+    docId, doc = item
+    return all(get_document_value(docId, doc, field) is not MISSING_VALUE for field, _ in self.orderBy)
+
+  def row_key(self, row: dict) -> Tuple:
+    return self.key(lambda field: row.get(field, MISSING_VALUE))
+
+  def sort(self, items: Iterable, key: Callable) -> List:
+    return sorted(items, key=key)
+
+  def top(self, items: Iterable, count: int, key: Callable) -> List:
+    """
+    The first `count` items in order, with a bounded heap: the items are consumed
+    one at a time and at most `count` of them are kept in memory.
+
+    Args:
+      items (Iterable): the items to order
+      count (int): the number of items to keep
+      key (Callable): `document_key` or `row_key`
+    Returns:
+      List: the ordered first items
+    """
+    return heapq.nsmallest(count, items, key=key)
+
+  def order_documents(self, items: Iterable, limit: int = None) -> List:
+    """
+    Order the `(docId, doc)` on the client as Firestore orders a query, documents without
+    an ORDER BY field left out, and keep the first `limit` ones.
+    """
+    items = filter(self.has_document_fields, items)
+    if limit is None:
+      return self.sort(items, key=self.document_key)
+    return self.top(items, limit, key=self.document_key)
@@ -0,0 +1,745 @@
+import datetime
+import functools
+import re
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Pattern, Union
+
+from .sql_date import SQLDate
+from .sql_objects import (
+  SQL_BinaryExpression,
+  SQL_ColumnRef,
+  SQL_Parameter,
+)
+
+# Firestore limit on the number of values in an IN query
+FIRESTORE_IN_LIMIT = 30
+# upper bound on the number of conjunctions when normalizing a WHERE clause
+MAX_DISJUNCTIONS = 64
+
+RANGE_OPERATORS = ('<', '<=', '>', '>=')
+FILTER_OPERATORS = ('like', 'not_like')
+MULTI_VALUE_OPERATORS = ('in', 'not_in', 'array_contains_any')
+
+# operator after swapping `value op column` into `column op value`
+_MIRROR_OPERATORS = {
+  '==': '==',
+  '!=': '!=',
+  '<': '>',
+  '>': '<',
+  '<=': '>=',
+  '>=': '<=',
+}
+
+# the value of a field that a document does not have
+MISSING_VALUE = object()
+
+# assumed collection size and selectivity of the query operators, without collection statistics
+DEFAULT_COLLECTION_SIZE = 10000
+_SELECTIVITY = {
+  '==': 0.01,
+  'array_contains': 0.05,
+  '<': 0.3,
+  '<=': 0.3,
+  '>': 0.3,
+  '>=': 0.3,
+  '!=': 0.9,
+  'not_in': 0.9,
+}
+
+
+@dataclass
+class PlanPredicate():
+  """
+  A single comparison on a collection field, as a Firestore query `[field, operator, value]`
+  """
+  part: str
+  query: List
+
+@dataclass
+class PlanBool():
+  """
+  AND/OR of plan nodes
+  """
+  operator: str
+  children: List
+
+@dataclass
+class PlanConstant():
+  """
+  A folded comparison, always true or always false
+  """
+  value: bool
+
+PlanNode = Union[PlanPredicate, PlanBool, PlanConstant]
+
+@dataclass
+class LogicalPlan():
+  """
+  The optimized WHERE clause, as a disjunction of conjunctive Firestore queries for each collection.
+
+  `queries` maps each collection part to its list of conjunctions (each a list of `[field, operator, value]`):
+  `[[]]` reads the whole collection and `[]` means that nothing can match, no read is needed.
+  """
+  queries: Dict[str, List[List]]
+
+  @property
+  def empty(self) -> bool:
+    return any(not conjunctions for conjunctions in self.queries.values())
+
+
+def estimate_cardinality(conjunctions: List[List], collectionSize: int = DEFAULT_COLLECTION_SIZE) -> float:
+  """
+  Estimate the number of documents matched by a disjunction of conjunctive queries.
+
+  Args:
+    conjunctions (List): the conjunctions of `[field, operator, value]` of a collection
+    collectionSize (int): the number of documents of the collection, if known
+  Returns:
+    float: the estimated number of documents read
+  """
+  total = 0.0
+  for conjunction in conjunctions:
+    estimate = float(collectionSize)
+    for (field, operator, value) in conjunction:
+      if field == 'docid' and operator in ('==', 'in'):
+        # document ids are unique
+        estimate = min(estimate, 1 if operator == '==' else len(value))
+      elif operator in ('in', 'array_contains_any') and isinstance(value, list):
+        estimate *= min(1.0, _SELECTIVITY['=='] * len(value))
+      else:
+        estimate *= _SELECTIVITY.get(operator, 1.0)
+    total += estimate
+  return min(total, float(collectionSize))
+
+
+def get_document_value(docId: str, doc: Dict, field: str) -> Any:
+  """
+  Get the (dotted sub-)field value of a document, `docid` is the document Id.
+
+  Returns:
+    the field value, or `MISSING_VALUE` if the document does not have the field
+  """
+  if field == 'docid':
+    return docId
+  value = doc
+  for token in field.split('.'):
+    if not isinstance(value, dict) or token not in value:
+      return MISSING_VALUE
+    value = value[token]
+  return value
+
+
+def _same_value(a: Any, b: Any) -> bool:
+  # Firestore does not consider true equals to 1
+  return isinstance(a, bool) == isinstance(b, bool) and a == b
+
+def _contains(values: List, value: Any) -> bool:
+  return any(_same_value(v, value) for v in values)
+
+
+# the SQL LIKE wildcards
+LIKE_WILDCARDS = ('%', '_')
+
+
+@functools.lru_cache(maxsize=256)
+def like_regex(pattern: str) -> Pattern:
+  """
+  Compile a LIKE pattern into a regular expression matching the whole string:
+  `%` matches any characters, `_` a single character, everything else is literal.
+  """
+  regex = []
+  for char in pattern:
+    if char == '%':
+      regex.append('.*')
+    elif char == '_':
+      regex.append('.')
+    else:
+      regex.append(re.escape(char))
+  return re.compile(''.join(regex), re.DOTALL)
+
+
+def compare_values(operator: str, fieldValue: Any, value: Any) -> bool:
+  """
+  Evaluate a query operator against a field value on the client side, like Firestore does.
+
+  Args:
+    operator (str): the query operator
+    fieldValue (Any): the document field value, `MISSING_VALUE` if the document has no such field
+    value (Any): the query value
+  Returns:
+    bool: True if the field value satisfies the query
+  """
+  if fieldValue is MISSING_VALUE:
+    return False
+  try:
+    if operator == '==':
+      return _same_value(fieldValue, value)
+    elif operator == '!=':
+      return not _same_value(fieldValue, value)
+    elif operator == '<':
+      return fieldValue < value
+    elif operator == '<=':
+      return fieldValue <= value
+    elif operator == '>':
+      return fieldValue > value
+    elif operator == '>=':
+      return fieldValue >= value
+    elif operator == 'in':
+      return _contains(value, fieldValue)
+    elif operator == 'not_in':
+      return not _contains(value, fieldValue)
+    elif operator == 'array_contains':
+      return isinstance(fieldValue, list) and _contains(fieldValue, value)
+    elif operator == 'array_contains_any':
+      return isinstance(fieldValue, list) and any(_contains(fieldValue, v) for v in value)
+    elif operator in FILTER_OPERATORS:
+      if not isinstance(fieldValue, str):
+        return False
+      matched = like_regex(value).fullmatch(fieldValue) is not None
+      return matched if operator == 'like' else not matched
+  except TypeError:
+    # values of different types are not comparable
+    return False
+  raise Exception(f"unsupported operator '{operator}'")
+
+
+def like_prefix(pattern: str) -> str:
+  """
+  The literal prefix of a LIKE pattern, before its first wildcard.
+  """
+  for pos, char in enumerate(pattern):
+    if char in LIKE_WILDCARDS:
+      return pattern[:pos]
+  return pattern
+
+
+def prefix_upper_bound(prefix: str) -> Optional[str]:
+  """
+  The smallest string greater than every string starting with `prefix`, e.g. `joho` for `john`.
+
+  Returns:
+    the exclusive upper bound, or None when there is none
+  """
+  while prefix:
+    code = ord(prefix[-1]) + 1
+    if 0xD800 <= code <= 0xDFFF:
+      # surrogates cannot be encoded in UTF-8, skip them
+      code = 0xE000
+    if code <= 0x10FFFF:
+      return prefix[:-1] + chr(code)
+    prefix = prefix[:-1]
+  return None
+
+
+def like_range_queries(field: str, pattern: Any) -> List[List]:
+  """
+  Rewrite a LIKE pattern with a literal prefix into the Firestore range of the prefix,
+  e.g. `email LIKE 'john%'` reads `email >= 'john' AND email < 'joho'`.
+
+  Args:
+    field (str): the LIKE field
+    pattern (Any): the LIKE pattern
+  Returns:
+    List: the range queries `[field, operator, value]`, empty when the pattern has no prefix
+  """
+  if not isinstance(pattern, str):
+    return []
+  prefix = like_prefix(pattern)
+  if not prefix:
+    return []
+  if prefix == pattern:
+    # no wildcard, an exact match
+    return [[field, '==', prefix]]
+  queries = [[field, '>=', prefix]]
+  upper = prefix_upper_bound(prefix)
+  if upper is not None:
+    queries.append([field, '<', upper])
+  return queries
+
+
+def is_prefix_pattern(pattern: Any) -> bool:
+  """
+  True if the range of the LIKE pattern prefix matches exactly the pattern, e.g. `john%`.
+  """
+  if not isinstance(pattern, str):
+    return False
+  prefix = like_prefix(pattern)
+  return bool(prefix) and pattern[len(prefix):] in ('', '%')
+
+
+def match_query(docId: str, doc: Dict, query: List) -> bool:
+  """
+  Evaluate a Firestore query `[field, operator, value]` against a document on the client side.
+  """
+  (field, operator, value) = query
+  return compare_values(operator, get_document_value(docId, doc, field), value)
+
+
+DocumentPredicate = Callable[[str, Dict], bool]
+
+_RANGE_COMPARATORS = {
+  '<': lambda a, b: a < b,
+  '<=': lambda a, b: a <= b,
+  '>': lambda a, b: a > b,
+  '>=': lambda a, b: a >= b,
+}
+
+
+def _compile_field(field: str) -> Callable[[str, Dict], Any]:
+  # the accessor of a document field value, the dotted path is split once
+  if field == 'docid':
+    return lambda docId, doc: docId
+  if '.' not in field:
+    return lambda docId, doc: doc.get(field, MISSING_VALUE)
+  tokens = field.split('.')
+  def _get(docId, doc):
+    value = doc
+    for token in tokens:
+      if not isinstance(value, dict) or token not in value:
+        return MISSING_VALUE
+      value = value[token]
+    return value
+  return _get
+
+
+def compile_query(query: List) -> DocumentPredicate:
+  """
+  Compile a Firestore query `[field, operator, value]` into a predicate of `(docId, doc)`,
+  evaluated like `match_query` but with the field path and the LIKE pattern prepared once.
+  """
+  (field, operator, value) = query
+  getValue = _compile_field(field)
+  if operator in FILTER_OPERATORS:
+    match = like_regex(value).fullmatch if isinstance(value, str) else None
+    matched = operator == 'like'
+    def _like(docId, doc):
+      fieldValue = getValue(docId, doc)
+      if not isinstance(fieldValue, str) or match is None:
+        return False
+      return (match(fieldValue) is not None) == matched
+    return _like
+  elif operator == '==' and not isinstance(value, (bool, int, float)):
+    # only numbers can equal a boolean, the type check is not needed
+    def _equals(docId, doc):
+      return getValue(docId, doc) == value
+    return _equals
+  elif operator in _RANGE_COMPARATORS:
+    compare = _RANGE_COMPARATORS[operator]
+    def _range(docId, doc):
+      fieldValue = getValue(docId, doc)
+      if fieldValue is MISSING_VALUE:
+        return False
+      try:
+        return compare(fieldValue, value)
+      except TypeError:
+        return False
+    return _range
+  return lambda docId, doc: compare_values(operator, getValue(docId, doc), value)
+
+
+def _and(a: DocumentPredicate, b: DocumentPredicate) -> DocumentPredicate:
+  return lambda docId, doc: a(docId, doc) and b(docId, doc)
+
+def _or(a: DocumentPredicate, b: DocumentPredicate) -> DocumentPredicate:
+  return lambda docId, doc: a(docId, doc) or b(docId, doc)
+
+
+def compile_conjunctions(conjunctions: List[List]) -> DocumentPredicate:
+  """
+  Compile an OR of AND queries into a single predicate of `(docId, doc)`, to filter documents in one pass.
+
+  Args:
+    conjunctions (List): the conjunctions of `[field, operator, value]`
+  Returns:
+    Callable: True if the document matches all the queries of any conjunction
+  """
+  disjunction = None
+  for conjunction in conjunctions:
+    # the queries are chained, evaluated in order and short-circuited
+    predicate = None
+    for query in conjunction:
+      compiled = compile_query(query)
+      predicate = compiled if predicate is None else _and(predicate, compiled)
+    if predicate is None:
+      # no query, every document matches
+      return lambda docId, doc: True
+    disjunction = predicate if disjunction is None else _or(disjunction, predicate)
+  if disjunction is None:
+    return lambda docId, doc: False
+  return disjunction
+
+
+def _has_parameter(value: Any) -> bool:
+  if isinstance(value, SQL_Parameter):
+    return True
+  elif isinstance(value, list):
+    return any(isinstance(v, SQL_Parameter) for v in value)
+  return False
+
+
+def literal_value(valueRef: Any) -> Any:
+  """
+  The query value of a parsed literal (or list of literals), ISO-8601 strings become datetime.
+  A `SQL_Parameter` placeholder is kept, to be bound at execution time.
+  """
+  if isinstance(valueRef, list):
+    return [literal_value(v) for v in valueRef]
+  elif isinstance(valueRef, SQL_ColumnRef):
+    return valueRef.column
+  elif isinstance(valueRef, SQL_Parameter):
+    # bind parameter is substituted at execution time
+    return valueRef
+  elif valueRef is None:
+    return None
+  return SQLDate.value_to_datetime(valueRef.value)
+
+
+# FireSQL syntax of the query operators
+_OPERATOR_NAMES = {
+  '==': '=',
+  'in': 'IN',
+  'not_in': 'NOT IN',
+  'array_contains': 'CONTAIN',
+  'array_contains_any': 'ANY CONTAIN',
+  'like': 'LIKE',
+  'not_like': 'NOT LIKE',
+}
+
+
+def format_value(value: Any) -> str:
+  """
+  A query value in FireSQL syntax, for EXPLAIN.
+  """
+  if isinstance(value, SQL_Parameter):
+    return f':{value.name}' if value.name is not None else '?'
+  elif value is None:
+    return 'NULL'
+  elif isinstance(value, bool):
+    return 'true' if value else 'false'
+  elif isinstance(value, str):
+    return "'{}'".format(value)
+  elif isinstance(value, datetime.datetime):
+    return "'{}'".format(value.isoformat())
+  elif isinstance(value, list):
+    return '({})'.format(', '.join(format_value(v) for v in value))
+  return str(value)
+
+
+def format_conjunctions(conjunctions: List) -> str:
+  """
+  An OR of AND Firestore queries in FireSQL syntax, for EXPLAIN.
+  """
+  texts = []
+  for conjunction in conjunctions:
+    text = ' AND '.join(f'{field} {_OPERATOR_NAMES.get(operator, operator)} {format_value(value)}' for (field, operator, value) in conjunction)
+    texts.append(f'({text})' if len(conjunctions) > 1 and len(conjunction) > 1 else text)
+  return ' OR '.join(texts)
+
+
+class FireSQLPlanner():
+  """
+  FireSQLPlanner turns a WHERE clause into a `LogicalPlan` of Firestore queries.
+
+  The boolean expression is rewritten by a set of rules before any query is issued:
+  - constant folding, comparisons between literals become true or false
+  - normalization into a disjunction of conjunctions for each collection
+  - duplicate predicates and conjunctions removal
+  - contradiction detection, e.g. `a = 1 AND a = 2` reads nothing
+  - range normalization, e.g. `a > 1 AND a > 3` becomes `a > 3`
+  - merging `=` predicates of a field into `IN`, e.g. `a = 1 OR a = 2` becomes `a IN (1, 2)`
+  """
+
+  def __init__(self, partResolver: Callable[[SQL_ColumnRef], str]):
+    self.partResolver = partResolver
+
+  def plan(self, where: SQL_BinaryExpression, parts: List[str]) -> LogicalPlan:
+    """
+    Build the optimized logical plan of a WHERE clause.
+
+    Args:
+      where (SQL_BinaryExpression): the parsed WHERE clause, or None
+      parts (List[str]): all the collection parts of the statement
+    Returns:
+      LogicalPlan: the optimized queries for each part
+    """
+    partChildren = {part: [] for part in parts}
+    isFalse = False
+    if where:
+      for child in self._conjunction_children(self._build(where)):
+        if isinstance(child, PlanConstant):
+          isFalse = isFalse or not child.value
+          continue
+        childParts = self._parts(child)
+        if len(childParts) > 1:
+          raise Exception("OR between different collections is not supported")
+        partChildren[childParts.pop()].append(child)
+
+    queries = {}
+    for part, children in partChildren.items():
+      disjunctions = self._to_dnf(PlanBool('and', children))
+      queries[part] = [[predicate.query for predicate in conjunction] for conjunction in disjunctions]
+    if isFalse:
+      queries = {part: [] for part in parts}
+    return LogicalPlan(queries=FireSQLPlanner.optimize_queries(queries))
+
+  @classmethod
+  def optimize_queries(cls, queries: Dict[str, List[List]]) -> Dict[str, List[List]]:
+    """
+    Apply the rewrite rules on the queries of each collection part.
+
+    The rules are re-applied when the bind parameter values become known.
+    When any part cannot match, no part needs to be read.
+
+    Args:
+      queries (Dict): part -> list of conjunctions of `[field, operator, value]`
+    Returns:
+      Dict: the optimized queries
+    """
+    optimized = {part: cls.optimize_disjunctions(conjunctions) for part, conjunctions in queries.items()}
+    if any(not conjunctions for conjunctions in optimized.values()):
+      optimized = {part: [] for part in optimized}
+    return optimized
+
+  @classmethod
+  def optimize_disjunctions(cls, disjunctions: List[List]) -> List[List]:
+    conjunctions = []
+    for conjunction in disjunctions:
+      conjunction = cls.optimize_conjunction(conjunction)
+      if conjunction is None:
+        # contradiction, this conjunction cannot match
+        continue
+      if not conjunction:
+        # always true, the whole disjunction matches everything
+        return [[]]
+      if not any(cls._is_subset(c, conjunction) for c in conjunctions):
+        # absorption, drop the conjunctions more restrictive than this one
+        conjunctions = [c for c in conjunctions if not cls._is_subset(conjunction, c)]
+        conjunctions.append(conjunction)
+    return cls._merge_equals(conjunctions)
+
+  @classmethod
+  def optimize_conjunction(cls, conjunction: List) -> Optional[List]:
+    """
+    Simplify a conjunction of queries.
+
+    Returns:
+      the simplified queries, or None if the conjunction is a contradiction
+    """
+    fields = {}
+    for query in conjunction:
+      queries = fields.setdefault(query[0], [])
+      if query not in queries:
+        queries.append(query)
+
+    optimized = []
+    for field, queries in fields.items():
+      fieldQueries = cls._optimize_field(field, queries)
+      if fieldQueries is None:
+        return None
+      optimized.extend(fieldQueries)
+    return optimized
+
+  @classmethod
+  def _optimize_field(cls, field: str, queries: List) -> Optional[List]:
+    if len(queries) == 1 and queries[0][1] != 'in':
+      return queries
+    if any(_has_parameter(value) for (_, _, value) in queries):
+      # values are unknown until bound
+      return queries
+
+    kept = []
+    equals = None
+    excluded = []
+    lower = None
+    upper = None
+    try:
+      for query in queries:
+        (_, operator, value) = query
+        if operator in ('==', 'in'):
+          candidates = [value] if operator == '==' else value
+          if equals is None:
+            equals = []
+            for v in candidates:
+              if not _contains(equals, v):
+                equals.append(v)
+          else:
+            equals = [v for v in equals if _contains(candidates, v)]
+        elif operator == '!=':
+          excluded.append(value)
+        elif operator == 'not_in':
+          excluded.extend(value)
+        elif operator in ('>', '>='):
+          bound = (value, operator == '>=')
+          if lower is None or value > lower[0] or (value == lower[0] and not bound[1]):
+            lower = bound
+        elif operator in ('<', '<='):
+          bound = (value, operator == '<=')
+          if upper is None or value < upper[0] or (value == upper[0] and not bound[1]):
+            upper = bound
+        else:
+          kept.append(query)
+
+      if lower and upper:
+        if lower[0] > upper[0] or (lower[0] == upper[0] and not (lower[1] and upper[1])):
+          return None
+        if lower[0] == upper[0]:
+          # a >= x AND a <= x
+          equals = [v for v in equals if _same_value(v, lower[0])] if equals is not None else [lower[0]]
+          lower = upper = None
+
+      def _in_range(v):
+        if lower and not (v > lower[0] or (lower[1] and v == lower[0])):
+          return False
+        if upper and not (v < upper[0] or (upper[1] and v == upper[0])):
+          return False
+        return True
+
+      optimized = []
+      if equals is not None:
+        equals = [v for v in equals if not _contains(excluded, v) and _in_range(v)]
+        if not equals:
+          return None
+        if len(equals) == 1:
+          optimized.append([field, '==', equals[0]])
+        else:
+          optimized.append([field, 'in', equals])
+      else:
+        if lower:
+          optimized.append([field, '>=' if lower[1] else '>', lower[0]])
+        if upper:
+          optimized.append([field, '<=' if upper[1] else '<', upper[0]])
+        notEquals = []
+        for v in excluded:
+          if _in_range(v) and not _contains(notEquals, v):
+            notEquals.append(v)
+        if len(notEquals) == 1:
+          optimized.append([field, '!=', notEquals[0]])
+        elif notEquals:
+          optimized.append([field, 'not_in', notEquals])
+    except TypeError:
+      # values of different types are not comparable, leave them to Firestore
+      return queries
+
+    return optimized + kept
+
+  @classmethod
+  def _is_subset(cls, a: List, b: List) -> bool:
+    return all(query in b for query in a)
+
+  @classmethod
+  def _merge_equals(cls, conjunctions: List[List]) -> List[List]:
+    # (rest AND a = 1) OR (rest AND a = 2) -> rest AND a IN (1, 2)
+    merged = True
+    while merged:
+      merged = False
+      for i in range(len(conjunctions)):
+        for j in range(i + 1, len(conjunctions)):
+          conjunction = cls._merge_pair(conjunctions[i], conjunctions[j])
+          if conjunction is not None:
+            conjunctions = conjunctions[:i] + [conjunction] + conjunctions[i+1:j] + conjunctions[j+1:]
+            merged = True
+            break
+        if merged:
+          break
+    return conjunctions
+
+  @classmethod
+  def _merge_pair(cls, a: List, b: List) -> Optional[List]:
+    if len(a) != len(b):
+      return None
+    onlyA = [query for query in a if query not in b]
+    onlyB = [query for query in b if query not in a]
+    if len(onlyA) != 1 or len(onlyB) != 1:
+      return None
+    (fieldA, operatorA, valueA), (fieldB, operatorB, valueB) = onlyA[0], onlyB[0]
+    if fieldA != fieldB or operatorA not in ('==', 'in') or operatorB not in ('==', 'in'):
+      return None
+    if _has_parameter(valueA) or _has_parameter(valueB):
+      return None
+    rest = [query for query in a if query is not onlyA[0]]
+    if any(operator in MULTI_VALUE_OPERATORS for (_, operator, _) in rest):
+      # Firestore allows a single IN in a query
+      return None
+    values = []
+    for v in (valueA if operatorA == 'in' else [valueA]) + (valueB if operatorB == 'in' else [valueB]):
+      if v is None:
+        return None
+      if not _contains(values, v):
+        values.append(v)
+    if len(values) > FIRESTORE_IN_LIMIT:
+      return None
+    return rest + [[fieldA, 'in', values]]
+
+  def _build(self, expr: SQL_BinaryExpression) -> PlanNode:
+    if expr.operator in ('and', 'or'):
+      return PlanBool(expr.operator, [self._build(expr.left), self._build(expr.right)])
+
+    operator = expr.operator
+    leftRef = expr.left
+    rightRef = expr.right
+    if not isinstance(leftRef, SQL_ColumnRef):
+      if isinstance(rightRef, SQL_ColumnRef) and operator in _MIRROR_OPERATORS:
+        # value op column -> column op value
+        leftRef, rightRef = rightRef, leftRef
+        operator = _MIRROR_OPERATORS[operator]
+      elif _has_parameter(leftRef) or _has_parameter(rightRef):
+        raise Exception("bind parameter must be compared to a field")
+      else:
+        # constant folding of literal comparisons
+        return PlanConstant(compare_values(operator, leftRef.value, literal_value(rightRef)))
+
+    return PlanPredicate(part=self.partResolver(leftRef), query=[leftRef.column, operator, literal_value(rightRef)])
+
+  def _conjunction_children(self, node: PlanNode) -> List[PlanNode]:
+    if isinstance(node, PlanBool) and node.operator == 'and':
+      children = []
+      for child in node.children:
+        children.extend(self._conjunction_children(child))
+      return children
+    return [self._fold(node)]
+
+  def _fold(self, node: PlanNode) -> PlanNode:
+    if not isinstance(node, PlanBool):
+      return node
+    children = []
+    for child in node.children:
+      child = self._fold(child)
+      if isinstance(child, PlanConstant):
+        if child.value == (node.operator == 'or'):
+          # a OR true, a AND false
+          return child
+        continue
+      children.append(child)
+    if not children:
+      return PlanConstant(node.operator == 'and')
+    if len(children) == 1:
+      return children[0]
+    return PlanBool(node.operator, children)
+
+  def _parts(self, node: PlanNode) -> set:
+    if isinstance(node, PlanPredicate):
+      return {node.part}
+    elif isinstance(node, PlanBool):
+      parts = set()
+      for child in node.children:
+        parts |= self._parts(child)
+      return parts
+    return set()
+
+  def _to_dnf(self, node: PlanNode) -> List[List[PlanPredicate]]:
+    if isinstance(node, PlanConstant):
+      return [[]] if node.value else []
+    elif isinstance(node, PlanPredicate):
+      return [[node]]
+    elif node.operator == 'or':
+      disjunctions = []
+      for child in node.children:
+        disjunctions.extend(self._to_dnf(child))
+    else:
+      disjunctions = [[]]
+      for child in node.children:
+        childDisjunctions = self._to_dnf(child)
+        disjunctions = [a + b for a in disjunctions for b in childDisjunctions]
+    if len(disjunctions) > MAX_DISJUNCTIONS:
+      raise Exception(f"WHERE clause expands to more than {MAX_DISJUNCTIONS} OR queries")
+    return disjunctions
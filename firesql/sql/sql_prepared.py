@@ -0,0 +1,133 @@
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Union
+
+from .sql_date import SQLDate
+from .sql_objects import SQL_Parameter
+
+# quoted strings and field names are kept as-is, whitespace and `--` comments are collapsed
+_NORMALIZE_REGEX = re.compile(r"('[^']*'|\"(?:[^\"\\]|\\.)*\")|(?:--[^\n]*|\s)+")
+
+SQL_Parameters = Union[List, Dict[str, Any]]
+
+
+def normalize_sql(sql: str) -> str:
+  """
+  Normalize a FireSQL script into the plan cache key.
+
+  Whitespace and comments outside of quoted strings are collapsed and the optional trailing `;` is dropped,
+  so the same statement written on one or many lines shares one cached plan.
+
+  Args:
+    sql (str): FireSQL statements
+  Returns:
+    str: the normalized statements
+  """
+  normalized = _NORMALIZE_REGEX.sub(lambda m: m.group(1) or ' ', sql).strip()
+  return normalized.rstrip(';').rstrip()
+
+
+def _lookup_parameter(parameter: SQL_Parameter, parameters: SQL_Parameters):
+  if parameter.name is not None:
+    if not isinstance(parameters, dict) or parameter.name not in parameters:
+      raise Exception(f"missing value for bind parameter ':{parameter.name}'")
+    return parameters[parameter.name]
+  else:
+    if parameters is None or isinstance(parameters, dict) or parameter.index >= len(parameters):
+      raise Exception(f"missing value for bind parameter #{parameter.index + 1}")
+    return parameters[parameter.index]
+
+
+def bind_parameter_value(value: Any, parameters: SQL_Parameters = None) -> Any:
+  """
+  Substitute a bind parameter placeholder (or a list of them) by its bound value.
+
+  Bound ISO-8601 strings are converted to datetime, the same as string literals.
+
+  Args:
+    value (Any): a query value, possibly a `SQL_Parameter` placeholder
+    parameters (List|Dict): positional values for `?` or named values for `:name`
+  Returns:
+    the bound value
+  """
+  if isinstance(value, SQL_Parameter):
+    return SQLDate.value_to_datetime(_lookup_parameter(value, parameters))
+  elif isinstance(value, list):
+    return [bind_parameter_value(v, parameters) for v in value]
+  else:
+    return value
+
+
+class FireSQLPreparedStatement():
+  """
+  FireSQLPreparedStatement is a compiled FireSQL script.
+
+  It holds the generated Firestore commands of every statement, with the
+  `?` and `:name` placeholders left unbound until execution.
+  """
+
+  def __init__(self, sql: str, fireCommands: List, options: Dict = {}):
+    self.sql = sql
+    self.fireCommands = fireCommands
+    self.options = options
+
+  def bind(self, parameters: SQL_Parameters = None) -> List:
+    """
+    Bind the parameter values to a fresh copy of each compiled command.
+
+    Args:
+      parameters (List|Dict): positional values for `?` or named values for `:name`
+    Returns:
+      The list of commands ready to be executed
+    """
+    return [fireCommand.bind(parameters) for fireCommand in self.fireCommands]
+
+
+class FireSQLPlanCache():
+  """
+  FireSQLPlanCache is a bounded LRU cache of prepared statements, keyed by normalized FireSQL.
+
+  The `hits` and `misses` counters are exposed for monitoring.
+  """
+
+  def __init__(self, maxsize: int = 256):
+    self.maxsize = maxsize
+    self.hits = 0
+    self.misses = 0
+    self._plans = OrderedDict()
+    self._lock = threading.Lock()
+
+  def __len__(self) -> int:
+    return len(self._plans)
+
+  def get(self, key: Hashable) -> FireSQLPreparedStatement:
+    with self._lock:
+      plan = self._plans.get(key)
+      if plan is None:
+        self.misses += 1
+      else:
+        self.hits += 1
+        self._plans.move_to_end(key)
+      return plan
+
+  def put(self, key: Hashable, plan: FireSQLPreparedStatement):
+    with self._lock:
+      self._plans[key] = plan
+      self._plans.move_to_end(key)
+      while len(self._plans) > self.maxsize:
+        self._plans.popitem(last=False)
+
+  def clear(self):
+    with self._lock:
+      self._plans.clear()
+      self.hits = 0
+      self.misses = 0
+
+  def info(self) -> Dict:
+    return {
+      'hits': self.hits,
+      'misses': self.misses,
+      'size': len(self._plans),
+      'maxsize': self.maxsize,
+    }
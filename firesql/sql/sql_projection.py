@@ -0,0 +1,98 @@
+import functools
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# a result row of the (docId, doc) of a part
+RowBuilder = Callable[[str, Dict], Dict]
+# a joined row of the (docId, doc) of each part matched by a join pipeline
+JoinRowBuilder = Callable[[Sequence[Tuple[str, Dict]]], Dict]
+
+
+def _value_source(lines: List[str], variable: str, docVariable: str, field: str, missing):
+  # the statements reading a dotted field into the variable. A missing (sub-)field is '' in the
+  # result rows, a falsy value stops at that level; it is `missing` otherwise, as `get_document_value`
+  tokens = field.split('.')
+  indent = '  '
+  lines.append(f"{indent}{variable} = {docVariable}.get({tokens[0]!r}, {missing!r})")
+  for token in tokens[1:]:
+    if missing == '':
+      lines.append(f"{indent}if {variable}:")
+      indent += '  '
+      lines.append(f"{indent}{variable} = {variable}.get({token!r}, '')")
+    else:
+      lines.append(f"{indent}{variable} = {variable}.get({token!r}, {missing!r}) if isinstance({variable}, dict) else {missing!r}")
+
+
+def _row_source(lines: List[str], parts: Sequence[Tuple[Tuple, Tuple, str, str]], missing) -> str:
+  # the dict display of the row, the dotted fields are read first into local variables
+  entries = []
+  for (fields, names, docIdVariable, docVariable) in parts:
+    for field, name in zip(fields, names):
+      if field == 'docid':
+        value = docIdVariable
+      elif '.' in field:
+        value = f"v{len(lines)}"
+        _value_source(lines, value, docVariable, field, missing)
+      else:
+        value = f"{docVariable}.get({field!r}, {missing!r})"
+      entries.append(f"{name!r}: {value}")
+  return "  return {" + ", ".join(entries) + "}"
+
+
+def _compile(name: str, lines: List[str]) -> Callable:
+  namespace = {}
+  exec(compile("\n".join(lines) + "\n", f"<firesql {name}>", "exec"), namespace)
+  return namespace[name]
+
+
+@functools.lru_cache(maxsize=256)
+def _row_builder(fields: Tuple[str, ...], names: Tuple[str, ...], missing) -> RowBuilder:
+  lines = ["def build_row(docId, doc):"]
+  lines.append(_row_source(lines, [(fields, names, 'docId', 'doc')], missing))
+  return _compile('build_row', lines)
+
+
+@functools.lru_cache(maxsize=256)
+def _join_row_builder(parts: Tuple[Tuple[Tuple[str, ...], Tuple[str, ...], int], ...], missing) -> JoinRowBuilder:
+  lines = ["def build_join_row(match):"]
+  rowParts = []
+  for index, (fields, names, position) in enumerate(parts):
+    lines.append(f"  docId{index}, doc{index} = match[{position}]")
+    rowParts.append((fields, names, f"docId{index}", f"doc{index}"))
+  lines.append(_row_source(lines, rowParts, missing))
+  return _compile('build_join_row', lines)
+
+
+def compile_row_builder(fields: List[str], nameMap: Dict[str, str], missing: Optional[str] = '') -> RowBuilder:
+  """
+  Generate the function building the result rows of a part, from its selected fields and their names.
+
+  The fields are looked up in the name map and split once here; the generated function reads
+  each field with its constant keys and returns the row as a dict display, so building a row
+  does no string splitting nor name lookup. The functions are cached by fields and names.
+
+  Args:
+    fields (List[str]): the selected (dotted) fields, `docid` is the document Id
+    nameMap (Dict): the name of each field in the rows
+    missing (str): the value of the missing fields, None in the rows that are aggregated
+
+  Returns:
+    Callable: the row of a `(docId, doc)`
+  """
+  return _row_builder(tuple(fields), tuple(nameMap[field] for field in fields), missing)
+
+
+def compile_join_row_builder(parts: List[Tuple[List[str], Dict[str, str]]], positions: List[int],
+                             missing: Optional[str] = '') -> JoinRowBuilder:
+  """
+  Generate the function building the joined rows, from the selected fields and names of each part.
+
+  Args:
+    parts (List[Tuple]): the `(fields, nameMap)` of each part, in the order of the row fields
+    positions (List[int]): the position of the `(docId, doc)` of each part in the matches
+    missing (str): the value of the missing fields, None in the rows that are aggregated
+
+  Returns:
+    Callable: the joined row of the `(docId, doc)` matches of the parts
+  """
+  return _join_row_builder(tuple((tuple(fields), tuple(nameMap[field] for field in fields), position)
+                                 for (fields, nameMap), position in zip(parts, positions)), missing)
@@ -0,0 +1,269 @@
+import os
+import json
+import time
+import datetime
+import tempfile
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+# a collection schema is inferred again from the documents read once it is a day old
+SCHEMA_TTL_SECONDS = 24 * 60 * 60
+
+SCHEMA_CATALOG_VERSION = 1
+
+# the type names of the field values
+_TYPE_NAMES = {
+  type(None): 'null',
+  bool: 'boolean',
+  int: 'integer',
+  float: 'float',
+  str: 'string',
+  bytes: 'bytes',
+  dict: 'map',
+  list: 'array',
+  datetime.datetime: 'timestamp',
+}
+
+def field_type_name(value: Any) -> str:
+  """
+  Args:
+    value (Any): a document field value
+
+  Returns:
+    str: the type name of the value, e.g. 'string', 'integer', 'map' or 'timestamp'
+  """
+  typeName = _TYPE_NAMES.get(type(value))
+  if typeName is None:
+    # e.g. the Firestore timestamps with nanoseconds, geo points and document references
+    typeName = 'timestamp' if isinstance(value, datetime.datetime) else type(value).__name__
+  return typeName
+
+
+class FireSQLSchema():
+  """
+  FireSQLSchema is the schema of a collection inferred from its documents: the field names in
+  order of appearance, the types of their values, and whether they are nullable, i.e. null
+  or missing in some of the documents.
+  """
+
+  def __init__(self, inferred: float = None, documents: int = 0, fields: Dict = None):
+    """
+    Args:
+      inferred (float): the time the inference started, now by default
+      documents (int): the number of documents observed
+      fields (Dict): the `{field: {'types': [type names], 'nullable': bool}}` observed
+    """
+    self.inferred = time.time() if inferred is None else inferred
+    self.documents = documents
+    self.fields = {} if fields is None else fields
+    # the (field names, value types) of the documents observed, the fields change with the new shapes only
+    self.shapes = set()
+    self._lock = threading.Lock()
+
+  def field_names(self) -> List[str]:
+    return list(self.fields)
+
+  def is_expired(self, ttl: float, now: float = None) -> bool:
+    return (time.time() if now is None else now) - self.inferred > ttl
+
+  def observe(self, doc: Dict) -> bool:
+    """
+    Infer the schema from one more document.
+
+    Args:
+      doc (Dict): a whole document
+
+    Returns:
+      bool: True if the fields changed
+    """
+    self.documents += 1
+    shape = (*doc, *map(type, doc.values()))
+    if shape in self.shapes:
+      return False
+    with self._lock:
+      self.shapes.add(shape)
+      return self._add_fields(doc)
+
+  def _add_fields(self, doc: Dict) -> bool:
+    changed = False
+    for field, value in doc.items():
+      info = self.fields.get(field)
+      if info is None:
+        # missing in the documents observed before
+        info = {'types': [], 'nullable': self.documents > 1}
+        self.fields[field] = info
+        changed = True
+      typeName = field_type_name(value)
+      if typeName not in info['types']:
+        info['types'].append(typeName)
+        changed = True
+      if value is None and not info['nullable']:
+        info['nullable'] = True
+        changed = True
+    if len(doc) < len(self.fields):
+      for field, info in self.fields.items():
+        if field not in doc and not info['nullable']:
+          info['nullable'] = True
+          changed = True
+    return changed
+
+  def to_dict(self) -> Dict:
+    with self._lock:
+      fields = {field: {'types': list(info['types']), 'nullable': info['nullable']} for field, info in self.fields.items()}
+    return {'inferred': self.inferred, 'documents': self.documents, 'fields': fields}
+
+  @classmethod
+  def from_dict(cls, value: Dict) -> 'FireSQLSchema':
+    return cls(inferred=value['inferred'], documents=value['documents'], fields=value['fields'])
+
+
+class FireSQLSchemaCatalog():
+  """
+  FireSQLSchemaCatalog keeps the schemas of the collections, inferred incrementally from the whole
+  documents read by the queries and persisted in a local JSON file, so that the fields of `SELECT *`
+  are known from the previous executions instead of sampled from the first document.
+
+  A schema expires `ttl` seconds after its inference started, it is then inferred again from the
+  next documents read, so that the fields removed from a collection do not stay in its schema.
+  """
+
+  def __init__(self, path: str = None, ttl: float = SCHEMA_TTL_SECONDS):
+    """
+    Args:
+      path (str): the JSON file of the catalog, None keeps the schemas in memory only
+      ttl (float): the lifetime of a schema, in seconds
+    """
+    self.path = path
+    self.ttl = ttl
+    self.schemas = {}
+    self.dirty = False
+    self._lock = threading.Lock()
+    if path:
+      self.load()
+
+  def load(self):
+    """
+    Read the schemas of the catalog file, a missing or unreadable file is an empty catalog.
+    """
+    try:
+      with open(self.path) as catalogFile:
+        catalog = json.load(catalogFile)
+      if catalog.get('version') != SCHEMA_CATALOG_VERSION:
+        return
+      schemas = {collection: FireSQLSchema.from_dict(schema) for collection, schema in catalog['collections'].items()}
+    except (OSError, ValueError, KeyError, TypeError):
+      return
+    with self._lock:
+      self.schemas = schemas
+      self.dirty = False
+
+  def save(self):
+    """
+    Write the schemas into the catalog file, if they changed. The file is replaced at once,
+    so a concurrent reader never sees a partial catalog.
+    """
+    if not self.path or not self.dirty:
+      return
+    with self._lock:
+      catalog = {
+        'version': SCHEMA_CATALOG_VERSION,
+        'collections': {collection: schema.to_dict() for collection, schema in self.schemas.items()},
+      }
+      directory = os.path.dirname(os.path.abspath(self.path))
+      os.makedirs(directory, exist_ok=True)
+      fd, tempPath = tempfile.mkstemp(dir=directory, prefix='.schema-', suffix='.json')
+      try:
+        with os.fdopen(fd, 'w') as catalogFile:
+          json.dump(catalog, catalogFile, indent=2)
+        os.replace(tempPath, self.path)
+      except Exception:
+        os.unlink(tempPath)
+        raise
+      self.dirty = False
+
+  def schema(self, collection: str) -> Optional[FireSQLSchema]:
+    """
+    Args:
+      collection (str): the collection name
+
+    Returns:
+      FireSQLSchema: the schema of the collection, None if unknown or expired
+    """
+    schema = self.schemas.get(collection)
+    if schema is None or schema.is_expired(self.ttl):
+      return None
+    return schema
+
+  def fields(self, collection: str) -> Optional[List[str]]:
+    """
+    Args:
+      collection (str): the collection name
+
+    Returns:
+      List[str]: the fields of the collection in order of appearance, None if its schema is unknown or expired
+    """
+    schema = self.schema(collection)
+    return schema.field_names() if schema is not None else None
+
+  def invalidate(self, collection: str = None):
+    """
+    Forget the schema of a collection, or of all the collections.
+
+    Args:
+      collection (str): the collection name, None for all
+    """
+    with self._lock:
+      if collection is None:
+        self.schemas = {}
+      else:
+        self.schemas.pop(collection, None)
+      self.dirty = True
+
+  def observe(self, collection: str, items: Iterable[Tuple[str, Dict]]) -> Iterator[Tuple[str, Dict]]:
+    """
+    Pass the (docId, doc) of whole documents through, inferring the schema of their collection.
+    The catalog is saved once the items are exhausted or the iteration is stopped.
+
+    Args:
+      collection (str): the collection of the documents
+      items (Iterable): the (docId, doc) read
+
+    Returns:
+      Iterator: the same (docId, doc)
+    """
+    with self._lock:
+      schema = self.schemas.get(collection)
+      if schema is None or schema.is_expired(self.ttl):
+        schema = FireSQLSchema()
+        self.schemas[collection] = schema
+        self.dirty = True
+    try:
+      for item in items:
+        if schema.observe(item[1]):
+          self.dirty = True
+        yield item
+    finally:
+      self.save()
+
+
+# the catalogs of the `schemaCatalog` paths are shared by all the queries in the process
+_CATALOGS = {}
+_CATALOGS_LOCK = threading.Lock()
+
+def schema_catalog(catalog: Union[str, FireSQLSchemaCatalog, None]) -> Optional[FireSQLSchemaCatalog]:
+  """
+  The catalog of the `schemaCatalog` option.
+
+  Args:
+    catalog (str|FireSQLSchemaCatalog): the catalog, or the path of its JSON file
+
+  Returns:
+    FireSQLSchemaCatalog: the catalog, None without the option
+  """
+  if catalog is None or isinstance(catalog, FireSQLSchemaCatalog):
+    return catalog
+  path = os.path.abspath(os.path.expanduser(catalog))
+  with _CATALOGS_LOCK:
+    if path not in _CATALOGS:
+      _CATALOGS[path] = FireSQLSchemaCatalog(path)
+    return _CATALOGS[path]
@@ -0,0 +1,148 @@
+import queue
+import threading
+from typing import Iterable, Iterator, List, Set, Tuple, Union
+
+
+def split_statements(script: Union[str, Iterable[str]]) -> Iterator[str]:
+  """
+  Split a FireSQL script into its statements, one at a time.
+
+  The script can be a string, or any iterable of string chunks such as an open file,
+  which is then consumed incrementally. Statements are separated by `;` outside of
+  `'...'` string literals, `"..."` quoted names and `--` line comments.
+
+  Args:
+    script (str|Iterable[str]): FireSQL script
+  Returns:
+    Iterator[str]: the text of each non-empty statement
+  """
+  if isinstance(script, str):
+    script = [script]
+
+  statement = []
+  quote = None
+  escaped = False
+  comment = False
+  dash = False
+  for chunk in script:
+    start = 0
+    for pos, char in enumerate(chunk):
+      if comment:
+        if char == '\n':
+          comment = False
+          start = pos
+      elif quote:
+        if escaped:
+          escaped = False
+        elif char == '\\' and quote == '"':
+          escaped = True
+        elif char == quote:
+          quote = None
+      elif char == '-' and dash:
+        # the comment is left out of the statement, its first dash may end the previous chunk
+        comment = True
+        if pos > 0:
+          statement.append(chunk[start:pos - 1])
+        else:
+          statement[-1] = statement[-1][:-1]
+      elif char in ('"', "'"):
+        quote = char
+      elif char == ';':
+        statement.append(chunk[start:pos])
+        start = pos + 1
+        sql = ''.join(statement).strip()
+        statement = []
+        if sql:
+          yield sql
+      dash = char == '-' and not comment and not quote
+    if not comment:
+      statement.append(chunk[start:])
+
+  sql = ''.join(statement).strip()
+  if sql:
+    yield sql
+
+
+def statement_dependencies(accesses: List[Tuple[Set[str], Set[str]]]) -> List[List[int]]:
+  """
+  The earlier statements that each statement of a script must wait for, given the
+  `(readCollections, writeCollections)` of every statement.
+
+  A statement depends on the last statement writing a collection it reads or writes, and
+  on the statements reading a collection it writes since that collection was last written.
+  The other earlier statements are ordered before it through these dependencies, or do not
+  conflict with it.
+
+  Args:
+    accesses (List): the read and written collection names of each statement
+  Returns:
+    List[List[int]]: the indexes of the earlier statements each statement depends on
+  """
+  dependencies = []
+  lastWriter = {}
+  readers = {}
+  for index, (reads, writes) in enumerate(accesses):
+    depends = set()
+    for collection in reads | writes:
+      if collection in lastWriter:
+        depends.add(lastWriter[collection])
+    for collection in writes:
+      depends.update(readers.get(collection, []))
+    for collection in reads:
+      readers.setdefault(collection, []).append(index)
+    for collection in writes:
+      lastWriter[collection] = index
+      readers[collection] = []
+    depends.discard(index)
+    dependencies.append(sorted(depends))
+  return dependencies
+
+
+_END_OF_ITERATION = object()
+
+
+def prefetch(iterable: Iterable, depth: int = 16) -> Iterator:
+  """
+  Iterate in a background thread, staying at most `depth` items ahead of the consumer.
+
+  It lets the consumer work on item N (e.g. executing a statement against Firestore)
+  while item N+1 is produced (e.g. parsed). An exception raised by the iterable is
+  re-raised to the consumer.
+
+  Args:
+    iterable (Iterable): the items to produce
+    depth (int): the maximum number of items produced ahead
+  Returns:
+    Iterator: the items, in order
+  """
+  items = queue.Queue(maxsize=depth)
+  stopped = threading.Event()
+
+  def _produce():
+    try:
+      for item in iterable:
+        if stopped.is_set():
+          return
+        items.put((item, None))
+      items.put((_END_OF_ITERATION, None))
+    except BaseException as e:
+      items.put((_END_OF_ITERATION, e))
+
+  producer = threading.Thread(target=_produce, daemon=True)
+  producer.start()
+  try:
+    while True:
+      item, error = items.get()
+      if item is _END_OF_ITERATION:
+        if error is not None:
+          raise error
+        return
+      yield item
+  finally:
+    # consumer stopped early, let the producer finish
+    stopped.set()
+    while producer.is_alive():
+      try:
+        items.get_nowait()
+      except queue.Empty:
+        producer.join(timeout=0.01)
@@ -1,9 +1,19 @@
 from lark import Transformer, v_args
 
+from .sql_aggregation import percentile_function
 from .sql_date import SQLDate
 from .sql_objects import *
 
 class SQLTransformer(Transformer):
+  def __init__(self, visit_tokens: bool = True):
+    super().__init__(visit_tokens)
+    self.parameterIndex = 0
+
+  def transform(self, tree):
+    # positional parameters are numbered in statement order
+    self.parameterIndex = 0
+    return super().transform(tree)
+
   def final(self, args):
     return args
 
@@ -23,7 +33,8 @@ class SQLTransformer(Transformer):
   #  return str(args).strip('"')
 
   def AGGREGATION(self, args):
-    funcName = str(args).strip('(').lower()
+    # 'count(distinct' is the count_distinct function
+    funcName = '_'.join(str(args).lower().replace('(', ' ').split())
     return funcName
 
   def true(self, args):
@@ -33,7 +44,9 @@ class SQLTransformer(Transformer):
     return False
 
   def number(self, args):
-    sqlValue = SQL_ValueNumber(args[0].value)
+    value = args[0].value
+    value = float(value) if any(c in value for c in '.eE') else int(value)
+    sqlValue = SQL_ValueNumber(value)
     return sqlValue
 
   def bool(self, args):
@@ -105,6 +118,11 @@ class SQLTransformer(Transformer):
     column.func = args[0]
     return column
 
+  def sql_percentile(self, args):
+    column=args[1]
+    column.func = percentile_function(args[2].value)
+    return column
+
   def equals(self, args):
     sqlExpr = SQL_BinaryExpression(operator='==', left=args[0], right=args[1])
     return sqlExpr
@@ -183,10 +201,30 @@ class SQLTransformer(Transformer):
   def where_clause(self, args):
     return args[0]
 
+  def group_clause(self, args):
+    return args
+
+  def having_clause(self, args):
+    return args[0]
+
+  def order_clause(self, args):
+    return args
+
+  def order_expression(self, args):
+    direction = str(args[1]).lower() if args[1] else 'asc'
+    sqlOrderBy = SQL_OrderBy(column=args[0], direction=direction)
+    return sqlOrderBy
+
+  def limit_clause(self, args):
+    # (limit, offset)
+    return (int(args[0]), int(args[1]) if args[1] else 0)
+
   def select(self, args):
     # select all or distinct mode
     mode, columns = args[0]
-    sqlSelect = SQL_Select(mode=mode, columns=columns, froms=args[1], where=args[2])
+    limit, offset = args[6] if args[6] else (None, None)
+    sqlSelect = SQL_Select(mode=mode, columns=columns, froms=args[1], where=args[2], groupBy=args[3], having=args[4],
+                           orderBy=args[5], limit=limit, offset=offset)
     return sqlSelect
   
   # update statement
@@ -228,6 +266,20 @@ class SQLTransformer(Transformer):
     sqlDelete = SQL_Delete(table=args[0], where=args[1])
     return sqlDelete
 
+  def explain(self, args):
+    sqlExplain = SQL_Explain(command=args[1], analyze=args[0] is not None)
+    return sqlExplain
+
+  # bind parameters
+  def parameter(self, args):
+    sqlParameter = SQL_Parameter(index=self.parameterIndex)
+    self.parameterIndex += 1
+    return sqlParameter
+
+  def named_parameter(self, args):
+    sqlParameter = SQL_Parameter(index=None, name=str(args[0]))
+    return sqlParameter
+
   # json value
   def json(self, args):
     sqlValue = SQL_ValueJSON(args[0])
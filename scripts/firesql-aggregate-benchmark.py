@@ -0,0 +1,72 @@
+# firesql-aggregate-benchmark.py
+# Benchmark of the aggregations of a result set, value by value against the vectorized column batches
+#
+# USAGE
+# For example, aggregate SUM, AVG, MIN and MAX of 100000 and 1000000 generated rows
+# python firesql-aggregate-benchmark.py
+# For example, 5 million rows with 10% of null values in the aggregated column
+# python firesql-aggregate-benchmark.py -n 5000000 --nulls 0.1
+
+
+# import the necessary packages
+import argparse
+import random
+import time
+
+from firesql.sql.sql_aggregation import FireSQLAggregate, FireSQLGroupBy
+
+if __name__ == "__main__":
+  # construct the argument parser and parse the arguments
+  ap = argparse.ArgumentParser()
+  ap.add_argument("-n", "--rows", type=str, default="100000,1000000",
+    help="comma separated numbers of rows")
+  ap.add_argument("--nulls", type=float, default=0.05,
+    help="fraction of null and string values in the aggregated columns")
+  ap.add_argument("-r", "--repeat", type=int, default=3,
+    help="number of timed runs, the fastest is kept")
+  args = vars(ap.parse_args())
+
+  aggregations = [('count', '*'), ('sum', 'cost'), ('avg', 'cost'), ('min', 'cost'), ('max', 'cost'),
+                  ('sum', 'nights'), ('avg', 'nights'), ('max', 'nights'), ('count_distinct', 'nights')]
+  random.seed(0)
+  for rows in [int(n) for n in args["rows"].split(',')]:
+    docs = []
+    for i in range(rows):
+      noise = random.random()
+      if noise < args["nulls"] / 2:
+        cost = None
+      elif noise < args["nulls"]:
+        cost = 'n/a'
+      else:
+        cost = random.uniform(10, 500)
+      docs.append({'cost': cost, 'nights': random.randint(1, 14)})
+
+    def _value_by_value():
+      # the accumulators updated with each value, as for GROUP BY
+      groups = FireSQLGroupBy([], aggregations)
+      for doc in docs:
+        groups.add(doc.get)
+      for _, values in groups.results():
+        return [dict(zip([FireSQLAggregate.fieldName(func, column) for (func, column) in aggregations], values))]
+
+    def _vectorized():
+      aggregate = FireSQLAggregate(aggregations)
+      for doc in docs:
+        aggregate.add(doc.get)
+      return [aggregate.results()]
+
+    times = {}
+    results = {}
+    for name, run in [('value by value', _value_by_value), ('vectorized', _vectorized)]:
+      elapsed = []
+      for _ in range(args["repeat"]):
+        start = time.perf_counter()
+        results[name] = run()
+        elapsed.append(time.perf_counter() - start)
+      times[name] = min(elapsed)
+    print("{} rows: value by value {:.3f}s, vectorized {:.3f}s ({:.1f}x)".format(
+      rows, times['value by value'], times['vectorized'], times['value by value'] / times['vectorized']))
+    for field, value in results['value by value'][0].items():
+      vectorized = results['vectorized'][0][field]
+      if value != vectorized and not (isinstance(value, float) and abs(value - vectorized) <= 1e-9 * abs(value)):
+        print("  {} differs: {} vectorized {}".format(field, value, vectorized))
@@ -0,0 +1,73 @@
+# firesql-filter-benchmark.py
+# Benchmark of the client-side filters of the documents, query by query against the compiled single-pass predicate
+#
+# USAGE
+# For example, filter 1000000 generated documents by LIKE, OR and mixed residual filters
+# python firesql-filter-benchmark.py
+# For example, 100000 and 5 million documents
+# python firesql-filter-benchmark.py -n 100000,5000000
+
+
+# import the necessary packages
+import argparse
+import random
+import time
+
+from firesql.sql.sql_plan import compile_conjunctions, match_query
+
+if __name__ == "__main__":
+  # construct the argument parser and parse the arguments
+  ap = argparse.ArgumentParser()
+  ap.add_argument("-n", "--rows", type=str, default="1000000",
+    help="comma separated numbers of documents")
+  ap.add_argument("-r", "--repeat", type=int, default=3,
+    help="number of timed runs, the fastest is kept")
+  args = vars(ap.parse_args())
+
+  # the conjunctions left to the client, as the `filter_queries` of a statement
+  filters = [
+    ('like', [[['email', 'like', '%@gmail.com']]]),
+    ('or re-check', [[['state', '==', 'ACTIVE'], ['age', '>', 30]], [['location.city', '==', 'city3']]]),
+    ('mixed', [[['email', 'like', 'user1%'], ['age', '>=', 20], ['state', 'in', ['ACTIVE', 'PENDING']], ['location.city', '!=', 'city0']]]),
+  ]
+  domains = ['gmail.com', 'example.com', 'outlook.com']
+  states = ['ACTIVE', 'INACTIVE', 'PENDING']
+  random.seed(0)
+  for rows in [int(n) for n in args["rows"].split(',')]:
+    items = []
+    for i in range(rows):
+      doc = {
+        'email': 'user{}@{}'.format(i, random.choice(domains)),
+        'state': random.choice(states),
+        'age': random.randint(15, 80),
+        'location': {'city': 'city{}'.format(random.randrange(10))},
+      }
+      if random.random() < 0.05:
+        # a few documents without the age
+        del doc['age']
+      items.append(('doc{}'.format(i), doc))
+
+    for name, conjunctions in filters:
+      def _query_by_query():
+        # each query of each conjunction evaluated by `match_query`, the dotted fields split for each document
+        return [docId for docId, doc in items
+                if any(all(match_query(docId, doc, query) for query in conjunction) for conjunction in conjunctions)]
+
+      def _compiled():
+        matches = compile_conjunctions(conjunctions)
+        return [docId for docId, doc in items if matches(docId, doc)]
+
+      times = {}
+      results = {}
+      for runName, run in [('query by query', _query_by_query), ('compiled', _compiled)]:
+        elapsed = []
+        for _ in range(args["repeat"]):
+          start = time.perf_counter()
+          results[runName] = run()
+          elapsed.append(time.perf_counter() - start)
+        times[runName] = min(elapsed)
+      print("{} documents {} ({} matches): query by query {:.3f}s, compiled {:.3f}s ({:.1f}x, {:.0f} documents/s)".format(
+        rows, name, len(results['compiled']), times['query by query'], times['compiled'],
+        times['query by query'] / times['compiled'], rows / times['compiled']))
+      if results['query by query'] != results['compiled']:
+        print("  the compiled filter matches other documents")
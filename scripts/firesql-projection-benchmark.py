@@ -0,0 +1,104 @@
+# firesql-projection-benchmark.py
+# Benchmark of the projection of the result rows, field by field against the generated row builders
+#
+# USAGE
+# For example, project 5 fields (one dotted) of 100000 and 1000000 generated documents, and their joined rows
+# python firesql-projection-benchmark.py
+# For example, 500000 documents of 40 fields, all selected
+# python firesql-projection-benchmark.py -n 500000 --fields 40
+
+
+# import the necessary packages
+import argparse
+import random
+import time
+
+from firesql.sql.sql_projection import compile_row_builder, compile_join_row_builder
+
+def get_field_value(doc, field):
+  # the value of a (dotted) field read token by token, '' if missing, as projected before the row builders
+  tokens = field.split('.')
+  if len(tokens) == 1:
+    return doc.get(field, '')
+  dd = doc
+  for f in tokens:
+    dd = dd.get(f, '')
+    if not dd:
+      break
+  return dd
+
+if __name__ == "__main__":
+  # construct the argument parser and parse the arguments
+  ap = argparse.ArgumentParser()
+  ap.add_argument("-n", "--rows", type=str, default="100000,1000000",
+    help="comma separated numbers of documents")
+  ap.add_argument("--fields", type=int, default=5,
+    help="number of selected fields, the first one a dotted field")
+  ap.add_argument("-r", "--repeat", type=int, default=3,
+    help="number of timed runs, the fastest is kept")
+  args = vars(ap.parse_args())
+
+  fields = ['docid', 'location.city'] + ['f{}'.format(i) for i in range(args["fields"] - 2)]
+  # the joined part, its fields renamed as in an ambiguous JOIN
+  joinFields = ['docid', 'email', 'cost']
+  nameMap = {field: field for field in fields}
+  joinNameMap = {field: 'b_' + field for field in joinFields}
+  random.seed(0)
+  for rows in [int(n) for n in args["rows"].split(',')]:
+    items = []
+    for i in range(rows):
+      doc = {'f{}'.format(f): random.random() for f in range(args["fields"])}
+      doc['location'] = {'city': 'city{}'.format(i % 100)}
+      items.append(('doc{}'.format(i), doc))
+    matches = [(item, ('booking{}'.format(i), {'email': 'user{}@example.com'.format(i), 'cost': i * 1.5}))
+               for i, item in enumerate(items)]
+
+    def _field_by_field():
+      # the row dict built field by field, the dotted fields split for each row
+      rows = []
+      for docId, doc in items:
+        jdoc = {}
+        for field in fields:
+          if field == 'docid':
+            jdoc['docid'] = docId
+          else:
+            jdoc[ nameMap[field] ] = get_field_value(doc, field)
+        rows.append(jdoc)
+      return rows
+
+    def _generated():
+      buildRow = compile_row_builder(fields, nameMap)
+      return [buildRow(docId, doc) for docId, doc in items]
+
+    def _join_field_by_field():
+      rows = []
+      for match in matches:
+        jdoc = {}
+        for (selectFields, names), (docId, doc) in zip([(fields, nameMap), (joinFields, joinNameMap)], match):
+          for field in selectFields:
+            if field == 'docid':
+              jdoc[names[field]] = docId
+            else:
+              jdoc[ names[ field ] ] = get_field_value(doc, field)
+        rows.append(jdoc)
+      return rows
+
+    def _join_generated():
+      buildRow = compile_join_row_builder([(fields, nameMap), (joinFields, joinNameMap)], [0, 1])
+      return list(map(buildRow, matches))
+
+    for name, (reference, generated) in [('projection', (_field_by_field, _generated)), ('join', (_join_field_by_field, _join_generated))]:
+      times = {}
+      results = {}
+      for runName, run in [('field by field', reference), ('generated', generated)]:
+        elapsed = []
+        for _ in range(args["repeat"]):
+          start = time.perf_counter()
+          results[runName] = run()
+          elapsed.append(time.perf_counter() - start)
+        times[runName] = min(elapsed)
+      print("{} rows {}: field by field {:.3f}s, generated {:.3f}s ({:.1f}x, {:.0f} rows/s)".format(
+        rows, name, times['field by field'], times['generated'], times['field by field'] / times['generated'],
+        rows / times['generated']))
+      if results['field by field'] != results['generated']:
+        print("  the generated rows differ")
@@ -13,14 +13,22 @@
 # CHECKED_IN or CHECKED_OUT. This is essentially trying to find users who really used the system.
 # The SQL query is specified in sqltest1.sql.
 # python firesql-query.py -m dev -c bennycorp -i sqltest1.sql
+#
+# For example, show the execution plan of a query and its estimated document reads,
+# EXPLAIN ANALYZE also executes it and reports the actual rows, reads and time of each step
+# python firesql-query.py -q "EXPLAIN ANALYZE SELECT id,date,email FROM Bookings WHERE email LIKE '%@hotmail.com'"
+#
+# For example, expand * to the fields of all the Bookings seen by the previous queries, kept in a schema catalog
+# python firesql-query.py -s ~/.firesql/schema.json -f csv -q "SELECT * FROM Bookings WHERE email = 'john_thurner@hotmail.com'"
 
 
 # import the necessary packages
 import argparse
+import itertools
 from firesql.firebase import FirebaseClient
 
 from firesql.sql.sql_fire_client import FireSQLClient
-from firesql.sql import FireSQL, DocPrinter
+from firesql.sql import FireSQL, DocPrinter, SQLFireExplain
 
 if __name__ == "__main__":
   # construct the argument parser and parse the arguments
@@ -35,6 +43,8 @@ if __name__ == "__main__":
     help="FireSQL query input file (required)")
   ap.add_argument("-q", "--query", type=str, default="",
     help="FireSQL query (required)")
+  ap.add_argument("-s", "--schema", type=str, default="",
+    help="schema catalog JSON path, the fields of SELECT * inferred by the previous queries")
   args = vars(ap.parse_args())
 
   credentials = args["credentials"]
@@ -42,6 +52,7 @@ if __name__ == "__main__":
   input = args["input"]
   query = args["query"]
   debug = args["debug"]
+  options = {'schemaCatalog': args["schema"]} if args["schema"] else {}
 
   if not query:
     if input:
@@ -57,11 +68,19 @@ if __name__ == "__main__":
   sqlClient = FireSQLClient(client)
 
   fireSQL = FireSQL()
-  docs = fireSQL.execute(sqlClient, query)
+  if format in ('csv', 'json'):
+    # the rows are printed as they are read
+    docs = fireSQL.execute_iter(sqlClient, query, options=options)
+    first = next(docs, None)
+    docs = itertools.chain([first], docs) if first is not None else []
+  else:
+    docs = fireSQL.execute(sqlClient, query, options=options)
 
   if docs:
     docPrinter = DocPrinter()
-    if format == 'csv':
+    if isinstance(fireSQL.sqlFireCommand, SQLFireExplain) and not format:
+      docPrinter.printTable(docs, fireSQL.select_fields())
+    elif format == 'csv':
       docPrinter.printCSV(docs, fireSQL.select_fields())
     elif format == 'json':
       docPrinter.printJSON(docs, fireSQL.select_fields())
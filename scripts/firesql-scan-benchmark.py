@@ -0,0 +1,70 @@
+# firesql-scan-benchmark.py
+# Benchmark of the partitioned parallel scans against the Firestore emulator
+#
+# USAGE
+# Start the emulator first, e.g. firebase emulators:start --only firestore
+# For example, seed 100000 documents into ScanBench and time a full collection scan, serial and with 8 workers
+# python firesql-scan-benchmark.py -n 100000 -w 8
+# For example, time the scans of an existing collection, reading 64 key ranges with 1, 4 and 16 workers
+# python firesql-scan-benchmark.py -t Users -w 1,4,16 -p 64 -q "SELECT docid, email FROM Users"
+
+
+# import the necessary packages
+import argparse
+import time
+from firesql.firebase import FirebaseClient
+
+from firesql.sql.sql_fire_client import FireSQLClient
+from firesql.sql import FireSQL
+
+if __name__ == "__main__":
+  # construct the argument parser and parse the arguments
+  ap = argparse.ArgumentParser()
+  ap.add_argument("-c", "--credentials", type=str, default="../credentials/credentials.json",
+    help="credentials JSON path")
+  ap.add_argument("--host", type=str, default="localhost",
+    help="emulator host")
+  ap.add_argument("--port", type=int, default=8088,
+    help="emulator firestore port")
+  ap.add_argument("-t", "--collection", type=str, default="ScanBench",
+    help="collection to scan")
+  ap.add_argument("-n", "--seed", type=int, default=0,
+    help="number of documents to seed into the collection first")
+  ap.add_argument("-w", "--workers", type=str, default="4",
+    help="comma separated numbers of scan workers, compared with the serial scan")
+  ap.add_argument("-p", "--partitions", type=int, default=0,
+    help="number of key ranges (default 4 per worker)")
+  ap.add_argument("-q", "--query", type=str, default="",
+    help="FireSQL query (default SELECT * of the collection)")
+  args = vars(ap.parse_args())
+
+  collection = args["collection"]
+  query = args["query"] or "SELECT * FROM {}".format(collection)
+
+  client = FirebaseClient()
+  client.use_emulator(host=args["host"], firestore_port=args["port"])
+  client.connect(credentials_json=args["credentials"])
+  sqlClient = FireSQLClient(client)
+
+  if args["seed"]:
+    collection_ref = client.get_collection_ref(collection)
+    start = time.perf_counter()
+    for offset in range(0, args["seed"], 500):
+      batch = client.db.batch()
+      for i in range(offset, min(offset + 500, args["seed"])):
+        # auto-generated document ids
+        batch.set(collection_ref.document(), {'n': i, 'state': 'ACTIVE' if i % 3 else 'INACTIVE', 'email': 'user{}@example.com'.format(i)})
+      batch.commit()
+    print("seeded {} documents in {:.2f}s".format(args["seed"], time.perf_counter() - start))
+
+  serial = None
+  for workers in [1] + [int(w) for w in args["workers"].split(',') if int(w) > 1]:
+    options = {'scanWorkers': workers}
+    if args["partitions"] and workers > 1:
+      options['scanPartitions'] = args["partitions"]
+    start = time.perf_counter()
+    docs = FireSQL().execute(sqlClient, query, options=options)
+    elapsed = time.perf_counter() - start
+    if serial is None:
+      serial = elapsed
+    print("{:>3} workers: {} docs in {:.2f}s ({:.1f}x)".format(workers, len(docs), elapsed, serial / elapsed))
@@ -1,5 +1,8 @@
 import pytest
-from firesql.firebase import Client
+from typing import Dict, List
+
+from firesql.firebase import FirebaseClient
+from firesql.sql.sql_fire_client import FireSQLAbstractClient, FireSQLAsyncAbstractClient
 
 # fixtures can be run with different scopes:
 # 
@@ -11,7 +14,176 @@ from firesql.firebase import Client
 # return a test client using emulators
 @pytest.fixture(scope='session')
 def test_client():
-	client = Client()
+	client = FirebaseClient()
 	client.use_emulator()
 	client.connect(credentials_path="credentials")
 	yield client
+
+
+# the Firestore operators of the where tuples
+OPERATORS = {
+	'==': lambda a, b: a == b,
+	'!=': lambda a, b: a is not None and a != b,
+	'<': lambda a, b: a is not None and a < b,
+	'<=': lambda a, b: a is not None and a <= b,
+	'>': lambda a, b: a is not None and a > b,
+	'>=': lambda a, b: a is not None and a >= b,
+	'in': lambda a, b: a in b,
+	'not-in': lambda a, b: a is not None and a not in b,
+	'array_contains': lambda a, b: isinstance(a, list) and b in a,
+	'array_contains_any': lambda a, b: isinstance(a, list) and any(v in a for v in b),
+}
+
+def get_document_field(doc: Dict, field: str):
+	value = doc
+	for token in field.split('.'):
+		if not isinstance(value, dict) or token not in value:
+			return None
+		value = value[token]
+	return value
+
+def mask_document(doc: Dict, fields: List[str]) -> Dict:
+	# the document with the field mask only, as Firestore `select()`
+	if fields is None:
+		return dict(doc)
+	masked = {}
+	for field in fields:
+		tokens = field.split('.')
+		value = doc
+		for token in tokens:
+			if not isinstance(value, dict) or token not in value:
+				break
+			value = value[token]
+		else:
+			target = masked
+			for token in tokens[:-1]:
+				target = target.setdefault(token, {})
+			target[tokens[-1]] = value
+	return masked
+
+
+class MemoryClient(FireSQLAbstractClient):
+	"""
+	MemoryClient keeps the collections in memory, as `{collection: {docId: document}}`,
+	and counts the documents read and the queries sent, as a Firestore client would bill them.
+	"""
+
+	def __init__(self, collections: Dict = None):
+		self.collections = {} if collections is None else collections
+		self.reads = 0
+		self.queries = []
+		self.batchedGets = []
+
+	@property
+	def client(self):
+		return self
+
+	def get_collection_ref(self, collectionName: str):
+		return self.collections.setdefault(collectionName, {})
+
+	def query_document_by_where_tuples(self, collectionName: str, queries: List, fields: List = None) -> Dict:
+		self.queries.append((collectionName, list(queries), fields))
+		documents = {}
+		for docId, doc in self.get_collection_ref(collectionName).items():
+			if all(OPERATORS[op](docId if field == 'docid' else get_document_field(doc, field), value) for (field, op, value) in queries):
+				documents[docId] = mask_document(doc, fields)
+		self.reads += len(documents)
+		return documents
+
+	def get_collection_document(self, collectionName: str, docId: str) -> Dict:
+		doc = self.get_collection_ref(collectionName).get(docId)
+		self.reads += 1
+		return dict(doc) if doc is not None else {}
+
+	def get_collection_documents_by_ids(self, collectionName: str, docIds: List[str], fields: List = None) -> Dict:
+		self.batchedGets.append((collectionName, list(docIds), fields))
+		collection = self.get_collection_ref(collectionName)
+		self.reads += len(docIds)
+		return {docId: mask_document(collection[docId], fields) for docId in docIds if docId in collection}
+
+	def get_collection_documents(self, collectionName: str, fields: List = None) -> Dict:
+		self.queries.append((collectionName, [], fields))
+		collection = self.get_collection_ref(collectionName)
+		self.reads += len(collection)
+		return {docId: mask_document(doc, fields) for docId, doc in collection.items()}
+
+	def generate_collection_document_id(self, collectionName: str):
+		return 'doc{}'.format(len(self.get_collection_ref(collectionName)) + 1)
+
+	def set_collection_document(self, collectionName: str, docId: str, document: Dict):
+		self.get_collection_ref(collectionName)[docId] = dict(document)
+
+	def update_collection_document(self, collectionName: str, docId: str, document: Dict):
+		self.get_collection_ref(collectionName).setdefault(docId, {}).update(document)
+
+	def delete_collection_document(self, collectionName: str, docId: str):
+		self.get_collection_ref(collectionName).pop(docId, None)
+
+
+
+class AsyncMemoryClient(FireSQLAsyncAbstractClient):
+	"""
+	AsyncMemoryClient is the async interface of an in-memory client, such as a MemoryClient.
+	"""
+
+	def __init__(self, client: FireSQLAbstractClient):
+		self.memoryClient = client
+
+	@property
+	def client(self):
+		return self
+
+	def get_collection_ref(self, collectionName: str):
+		return self.memoryClient.get_collection_ref(collectionName)
+
+	async def query_document_by_where_tuples(self, collectionName: str, queries: List, fields: List = None) -> Dict:
+		return self.memoryClient.query_document_by_where_tuples(collectionName, queries, fields=fields)
+
+	async def stream_document_by_where_tuples(self, collectionName: str, queries: List, fields: List = None, orderBy: List = None, limit: int = None):
+		for item in self.memoryClient.stream_document_by_where_tuples(collectionName, queries, fields=fields, orderBy=orderBy, limit=limit):
+			yield item
+
+	async def get_collection_documents_by_ids(self, collectionName: str, docIds: List[str], fields: List = None) -> Dict:
+		return self.memoryClient.get_collection_documents_by_ids(collectionName, docIds, fields=fields)
+
+	async def get_collection_document(self, collectionName: str, docId: str) -> Dict:
+		return self.memoryClient.get_collection_document(collectionName, docId)
+
+	async def get_collection_documents(self, collectionName: str, fields: List = None) -> Dict:
+		return self.memoryClient.get_collection_documents(collectionName, fields=fields)
+
+	def generate_collection_document_id(self, collectionName: str):
+		return self.memoryClient.generate_collection_document_id(collectionName)
+
+	async def set_collection_document(self, collectionName: str, docId: str, document: Dict):
+		self.memoryClient.set_collection_document(collectionName, docId, document)
+
+	async def update_collection_document(self, collectionName: str, docId: str, document: Dict):
+		self.memoryClient.update_collection_document(collectionName, docId, document)
+
+	async def delete_collection_document(self, collectionName: str, docId: str):
+		self.memoryClient.delete_collection_document(collectionName, docId)
+
+def sample_collections() -> Dict:
+	users = {}
+	for i in range(10):
+		users['user{}'.format(i)] = {
+			'email': 'user{}@example.com'.format(i),
+			'state': 'ACTIVE' if i % 2 == 0 else 'INACTIVE',
+			'age': 20 + i,
+			'addr': {'city': 'city{}'.format(i % 3)},
+		}
+	bookings = {}
+	for i in range(30):
+		bookings['booking{}'.format(i)] = {
+			'email': 'user{}@example.com'.format(i % 10),
+			'state': ['CHECKED_IN', 'CHECKED_OUT', 'CANCELLED'][i % 3],
+			'cost': i * 1.5,
+			'day': i % 4,
+		}
+	return {'Users': users, 'Bookings': bookings}
+
+# return an in-memory client of 10 Users and 30 Bookings
+@pytest.fixture
+def memory_client():
+	yield MemoryClient(sample_collections())
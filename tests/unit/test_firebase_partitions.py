@@ -0,0 +1,123 @@
+import asyncio
+import random
+
+from firesql.firebase import FirebaseClient
+from firesql.firebase.async_client import AsyncFirebaseClient
+
+
+class PartitionDocument():
+	"""
+	PartitionDocument is a document snapshot of a partition query.
+	"""
+
+	def __init__(self, docId):
+		self.id = docId
+
+	def to_dict(self):
+		return {'name': self.id}
+
+
+class PartitionQuery():
+	"""
+	PartitionQuery streams the document ids of its key range `[start, end)`, in id order.
+	"""
+
+	def __init__(self, docIds, start, end):
+		self.docIds = sorted(docId for docId in docIds if (start is None or docId >= start) and (end is None or docId < end))
+		self.streamed = 0
+
+	def stream(self):
+		for docId in self.docIds:
+			self.streamed += 1
+			yield PartitionDocument(docId)
+
+
+class AsyncPartitionQuery(PartitionQuery):
+	"""
+	AsyncPartitionQuery streams the document ids of its key range as the asyncio Firestore client does.
+	"""
+
+	async def stream(self):
+		for docId in self.docIds:
+			self.streamed += 1
+			await asyncio.sleep(0)
+			yield PartitionDocument(docId)
+
+
+def _auto_ids(count, alphabet=FirebaseClient.AUTO_ID_ALPHABET):
+	random.seed(0)
+	return [''.join(random.choice(alphabet) for _ in range(20)) for _ in range(count)]
+
+
+def _partition_queries(client, docIds, queryClass):
+	# the key range queries of the partition bounds of the client, without Firestore
+	def _queries(collection_ref, partition_count, fields=None):
+		bounds = [None] + client.partition_bounds(partition_count) + [None]
+		client.partitions = [queryClass(docIds, start, end) for (start, end) in zip(bounds[:-1], bounds[1:])]
+		return client.partitions
+	return _queries
+
+
+def test_partition_bounds_cover_the_ids():
+	"""
+	GIVEN auto-generated and custom document ids
+	WHEN the id space is split into 1 to more key ranges than two-character ids
+	THEN check the bounds are increasing and each id is in exactly one key range
+	"""
+	docIds = _auto_ids(500) + ['', '0', 'user1', 'Users', 'zzzz', '~custom', '-1']
+	client = FirebaseClient()
+	for partitionCount in [1, 2, 3, 7, 64, 1000, 5000]:
+		bounds = client.partition_bounds(partitionCount)
+		assert bounds == sorted(set(bounds))
+		assert len(bounds) <= partitionCount - 1
+		ranges = list(zip([None] + bounds, bounds + [None]))
+		for docId in docIds:
+			matches = [(start, end) for (start, end) in ranges if (start is None or docId >= start) and (end is None or docId < end)]
+			assert len(matches) == 1
+
+
+def test_stream_collection_partitions():
+	"""
+	GIVEN a collection of auto-generated document ids
+	WHEN it is streamed as key ranges by several threads, then stopped after a few documents
+	THEN check every document is read once, and the stopped readers end without reading the collection
+	"""
+	docIds = _auto_ids(2000)
+	client = FirebaseClient()
+	client.partition_queries = _partition_queries(client, docIds, PartitionQuery)
+	docs = list(client.stream_collection_partitions(None, 8, 4))
+	assert sorted(docId for (docId, _) in docs) == sorted(docIds)
+	assert all(doc == {'name': docId} for (docId, doc) in docs)
+
+	client.SCAN_QUEUE_SIZE = 4
+	stream = client.stream_collection_partitions(None, 8, 4)
+	assert len([next(stream) for _ in range(10)]) == 10
+	stream.close()
+	assert sum(query.streamed for query in client.partitions) < len(docIds)
+
+
+def test_async_stream_collection_partitions():
+	"""
+	GIVEN a collection of auto-generated document ids
+	WHEN it is streamed as key ranges by several asyncio tasks, then stopped after a few documents
+	THEN check every document is read once, and the stopped readers are finished once the stream is closed
+	"""
+	docIds = _auto_ids(2000)
+	client = AsyncFirebaseClient()
+	client.partition_queries = _partition_queries(client, docIds, AsyncPartitionQuery)
+
+	async def _read_all():
+		return [docId async for (docId, _) in client.stream_collection_partitions(None, 8, 4)]
+	assert sorted(asyncio.run(_read_all())) == sorted(docIds)
+
+	async def _read_some():
+		client.SCAN_QUEUE_SIZE = 4
+		stream = client.stream_collection_partitions(None, 8, 4)
+		docs = [await stream.__anext__() for _ in range(10)]
+		await stream.aclose()
+		return docs, asyncio.all_tasks()
+	docs, tasks = asyncio.run(_read_some())
+	assert len(docs) == 10
+	# only the task of the test is left
+	assert len(tasks) == 1
+	assert sum(query.streamed for query in client.partitions) < len(docIds)
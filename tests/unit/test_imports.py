@@ -0,0 +1,18 @@
+import os
+import subprocess
+import sys
+
+
+def test_import_without_firebase_admin():
+	"""
+	GIVEN a new Python process
+	WHEN import firesql.sql and firesql.firebase
+	THEN check neither google nor firebase_admin modules are imported until a client connects
+	"""
+	script = (
+		"import sys, firesql.sql, firesql.firebase\n"
+		"print('\\n'.join(name for name in sys.modules if name.startswith('google') or name.startswith('firebase_admin')))\n"
+	)
+	result = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True,
+		cwd=os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+	assert result.stdout.split() == []
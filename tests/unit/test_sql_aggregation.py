@@ -0,0 +1,117 @@
+import random
+
+import pytest
+
+from conftest import MemoryClient, sample_collections
+from firesql.sql import FireSQL, sql_aggregation
+from firesql.sql.sql_aggregation import FireSQLAggregate, FireSQLApproxCountDistinct, FireSQLColumn
+
+
+class AggregationClient(MemoryClient):
+	"""
+	AggregationClient answers the aggregation queries as Firestore does without a matching numeric value.
+	"""
+
+	def aggregate_by_where_tuples(self, collectionName, queries, aggregations):
+		self.queries.append((collectionName, list(queries), aggregations))
+		return [None for _ in aggregations]
+
+
+def test_empty_aggregations(memory_client):
+	"""
+	GIVEN no matching document
+	WHEN COUNT, SUM, AVG and MIN are aggregated on the client or by Firestore aggregation queries
+	THEN check COUNT and SUM are 0, AVG and MIN are None
+	"""
+	docs = FireSQL().execute(memory_client, "SELECT count(*), sum(age), avg(age), min(age) FROM Users WHERE age > 100")
+	assert docs == [{'count(*)': 0, 'sum(age)': 0, 'avg(age)': None, 'min(age)': None}]
+
+	client = AggregationClient(sample_collections())
+	docs = FireSQL().execute(client, "SELECT count(*), sum(age), avg(age) FROM Users WHERE age > 100")
+	assert docs == [{'count(*)': 0, 'sum(age)': 0, 'avg(age)': None}]
+	assert client.reads == 0
+
+
+def test_approx_count_distinct_error_bound():
+	"""
+	GIVEN 30000 to 60000 distinct integers, where the raw HyperLogLog estimate is biased
+	WHEN APPROX_COUNT_DISTINCT estimates their number
+	THEN check each estimate is within 3% (3.7 standard errors) and they are unbiased on average
+	"""
+	accumulator = FireSQLApproxCountDistinct()
+	errors = []
+	for count in range(30000, 60001, 2500):
+		state = accumulator.update_column(accumulator.init(), FireSQLColumn(list(range(count * 7, count * 8))))
+		error = accumulator.finalize(state) / count - 1
+		assert abs(error) < 0.03, count
+		errors.append(error)
+	assert abs(sum(errors) / len(errors)) < 0.005
+
+
+def test_approx_count_distinct_small_counts():
+	"""
+	GIVEN a few distinct values with nulls and duplicates
+	WHEN APPROX_COUNT_DISTINCT estimates their number
+	THEN check the estimate is exact
+	"""
+	accumulator = FireSQLApproxCountDistinct()
+	assert accumulator.finalize(accumulator.init()) == 0
+	state = accumulator.init()
+	for value in ['a', 'b', None, 'a', 1, 1.0, True]:
+		state = accumulator.update(state, value)
+	assert accumulator.finalize(state) == 4
+
+
+def test_count_missing_fields():
+	"""
+	GIVEN Users without age and a nested city, joined to their Bookings
+	WHEN the fields are counted on the documents, on the joined rows and by group
+	THEN check the missing fields are not counted in any of them, while the selected rows still show them as ''
+	"""
+	collections = sample_collections()
+	for i in range(0, 10, 3):
+		del collections['Users']['user{}'.format(i)]['age']
+		del collections['Users']['user{}'.format(i)]['addr']['city']
+	client = MemoryClient(collections)
+	docs = FireSQL().execute(client, "SELECT count(age), count(addr.city) FROM Users")
+	assert docs == [{'count(age)': 6, 'count(addr.city)': 6}]
+	docs = FireSQL().execute(client, "SELECT count(u.age) FROM Users u JOIN Bookings b ON u.email = b.email")
+	assert docs == [{'count(age)': 18}]
+	docs = FireSQL().execute(client, "SELECT u.state, count(u.age) FROM Users u JOIN Bookings b ON u.email = b.email GROUP BY u.state")
+	assert docs == [{'state': 'ACTIVE', 'count(age)': 9}, {'state': 'INACTIVE', 'count(age)': 9}]
+
+	docs = FireSQL().execute(client, "SELECT email, age FROM Users WHERE docid = 'user0'")
+	assert docs == [{'email': 'user0@example.com', 'age': ''}]
+
+
+def _aggregate(rows):
+	aggregate = FireSQLAggregate([('count', '*'), ('count', 'value'), ('sum', 'value'), ('avg', 'value'),
+	                              ('min', 'value'), ('max', 'value'), ('count_distinct', 'value'), ('sum', 'count')])
+	for row in rows:
+		aggregate.add(row.get)
+	return aggregate.results()
+
+
+def test_vectorized_aggregations(monkeypatch):
+	"""
+	GIVEN rows of ints, floats, booleans, strings, maps, missing values and integers beyond 64 bits
+	WHEN they are aggregated in batches large enough to be vectorized
+	THEN check the aggregations are the same as computed value by value
+	"""
+	random.seed(0)
+	values = [lambda: random.randrange(-1000, 1000), lambda: random.random() * 100, lambda: True,
+	          lambda: 'text', lambda: {'a': 1}, lambda: None]
+	rows = [{'value': random.choice(values)(), 'count': i} for i in range(5000)]
+	for i in range(0, 5000, 7):
+		del rows[i]['value']
+	bigRows = rows + [{'value': 2 ** 70, 'count': 2 ** 65}]
+
+	for testRows in (rows, bigRows):
+		vectorized = _aggregate(testRows)
+		monkeypatch.setattr(sql_aggregation, 'VECTORIZE_MIN_ROWS', 10 ** 9)
+		valueByValue = _aggregate(testRows)
+		monkeypatch.undo()
+		assert vectorized.keys() == valueByValue.keys()
+		for name in vectorized:
+			assert vectorized[name] == pytest.approx(valueByValue[name]), name
+		assert type(vectorized['sum(count)']) == type(valueByValue['sum(count)']) == int
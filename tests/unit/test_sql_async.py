@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+
+from conftest import AsyncMemoryClient, MemoryClient, sample_collections
+from firesql.sql import FireSQL, AsyncFireSQL
+
+
+def _sorted_rows(docs):
+	return sorted(docs, key=lambda doc: sorted((key, repr(value)) for key, value in doc.items()))
+
+
+@pytest.mark.parametrize('sql', [
+	"SELECT email, age FROM Users WHERE state = 'ACTIVE' OR age > 26",
+	"SELECT docid, email FROM Users WHERE docid IN ('user1', 'user5', 'missing') OR age = 28",
+	"SELECT u.email, b.cost FROM Users u JOIN Bookings b ON u.email = b.email WHERE b.day = 1 OR b.cost > 40",
+	"SELECT u.state, count(*), sum(b.cost) FROM Users u JOIN Bookings b ON u.email = b.email GROUP BY u.state",
+	"SELECT count(*), avg(cost) FROM Bookings WHERE state = 'CANCELLED'",
+	"UPDATE Bookings SET day = 9 WHERE state = 'CHECKED_IN' OR cost > 40",
+	"DELETE FROM Users WHERE state = 'INACTIVE' OR age = 20",
+])
+def test_async_matches_sync(sql):
+	"""
+	GIVEN the same collections, in memory and behind an async client
+	WHEN a statement is executed by FireSQL and by AsyncFireSQL
+	THEN check both return the same rows and leave the same collections
+	"""
+	syncClient = MemoryClient(sample_collections())
+	asyncClient = MemoryClient(sample_collections())
+	docs = FireSQL().execute(syncClient, sql)
+	asyncDocs = asyncio.run(AsyncFireSQL().execute(AsyncMemoryClient(asyncClient), sql))
+	assert len(docs) > 0
+	assert _sorted_rows(asyncDocs) == _sorted_rows(docs)
+	assert asyncClient.collections == syncClient.collections
+
+
+class AsyncEventClient(AsyncMemoryClient):
+	"""
+	AsyncEventClient logs the collections read and written, its writes of Users take a while.
+	"""
+
+	def __init__(self, client):
+		super().__init__(client)
+		self.log = []
+
+	async def query_document_by_where_tuples(self, collectionName, queries, fields=None):
+		self.log.append(('read', collectionName))
+		if collectionName == 'Broken':
+			raise Exception('broken collection')
+		return await super().query_document_by_where_tuples(collectionName, queries, fields=fields)
+
+	async def get_collection_documents(self, collectionName, fields=None):
+		self.log.append(('read', collectionName))
+		return await super().get_collection_documents(collectionName, fields=fields)
+
+	async def set_collection_document(self, collectionName, docId, document):
+		if collectionName == 'Users':
+			await asyncio.sleep(0.01)
+		await super().set_collection_document(collectionName, docId, document)
+		self.log.append(('write', collectionName))
+
+
+def test_async_concurrent_statements_order():
+	"""
+	GIVEN a script writing Users, reading Bookings and reading Users
+	WHEN it is executed with concurrent statements
+	THEN check the Bookings are read during the Users write, and the Users are read after it
+	"""
+	client = AsyncEventClient(MemoryClient(sample_collections()))
+	fireSQL = AsyncFireSQL()
+	docs = asyncio.run(fireSQL.execute(client, """
+		INSERT INTO Users (email, age) VALUES ('new@example.com', 40);
+		SELECT email FROM Bookings WHERE day = 1;
+		SELECT email FROM Users WHERE age = 40;
+	""", options={'concurrentStatements': 4}))
+	assert docs == [{'email': 'new@example.com'}]
+	assert client.log == [('read', 'Bookings'), ('write', 'Users'), ('read', 'Users')]
+	assert len(fireSQL.execution_results()) == 3
+
+
+def test_async_concurrent_statements_error():
+	"""
+	GIVEN a script reading a collection that fails, then writing it, and an independent statement
+	WHEN it is executed with concurrent statements
+	THEN check the error is raised, and the write waiting for the failed read is not executed
+	"""
+	client = AsyncEventClient(MemoryClient(sample_collections()))
+	with pytest.raises(Exception, match='broken collection'):
+		asyncio.run(AsyncFireSQL().execute(client, """
+			SELECT name FROM Broken WHERE name = 'a';
+			INSERT INTO Broken (name) VALUES ('b');
+			SELECT email FROM Bookings WHERE day = 1;
+		""", options={'concurrentStatements': 4}))
+	assert ('write', 'Broken') not in client.log
+	assert ('read', 'Bookings') in client.log
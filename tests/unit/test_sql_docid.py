@@ -0,0 +1,29 @@
+from firesql.sql import FireSQL
+
+
+def test_missing_doc_ids(memory_client):
+	"""
+	GIVEN document ids looked up with some of them missing, one twice
+	WHEN the statement is executed
+	THEN check the missing ids are reported once each, in order of lookup
+	"""
+	fireSQL = FireSQL()
+	docs = fireSQL.execute(memory_client, "SELECT docid FROM Users WHERE docid IN ('user1', 'nope2', 'nope1', 'user3', 'nope2')")
+	assert sorted(doc['docid'] for doc in docs) == ['user1', 'user3']
+	assert fireSQL.execution_results()[-1]['missingDocIds'] == {'Users': ['nope2', 'nope1']}
+
+
+def test_missing_join_doc_ids(memory_client):
+	"""
+	GIVEN Payments joined to Bookings by document id, many of the bookings missing
+	WHEN the join looks the bookings up by their ids
+	THEN check each missing booking id is reported once
+	"""
+	memory_client.collections['Payments'] = {
+		'payment{}'.format(i): {'bookingId': 'booking{}'.format(i % 500), 'amount': i} for i in range(2000)
+	}
+	fireSQL = FireSQL()
+	docs = fireSQL.execute(memory_client, "SELECT p.amount, b.cost FROM Payments p JOIN Bookings b ON p.bookingId = b.docid")
+	assert len(docs) == 30 * 4
+	missingDocIds = fireSQL.execution_results()[-1]['missingDocIds']['Bookings']
+	assert sorted(missingDocIds) == sorted('booking{}'.format(i) for i in range(30, 500))
@@ -0,0 +1,117 @@
+from conftest import MemoryClient, sample_collections
+from firesql.sql import FireSQL
+
+
+def test_explain_analyze_batched_get(memory_client):
+	"""
+	GIVEN a docid IN lookup
+	WHEN it is executed with and without EXPLAIN ANALYZE
+	THEN check both read the documents with one batched get, measured as such by the analyzed plan
+	"""
+	sql = "SELECT email FROM Users WHERE docid IN ('user1', 'user2', 'user3')"
+	FireSQL().execute(memory_client, sql)
+	assert memory_client.batchedGets == [('Users', ['user1', 'user2', 'user3'], ['email'])]
+
+	memory_client.batchedGets = []
+	plan = FireSQL().execute(memory_client, "EXPLAIN ANALYZE " + sql)
+	assert memory_client.batchedGets == [('Users', ['user1', 'user2', 'user3'], ['email'])]
+	assert plan[0]['operator'] == 'batched get'
+	assert (plan[0]['rows'], plan[0]['reads']) == (3, 3)
+
+
+def test_explain_join_lookup_estimate(memory_client):
+	"""
+	GIVEN Users and Bookings of known sizes, joined on their email
+	WHEN the join is explained with one Users email, then with all of them
+	THEN check the estimated lookup reads follow the number of join keys
+	"""
+	options = {'collectionSizes': {'Users': 10, 'Bookings': 30}}
+	sql = "EXPLAIN SELECT u.email, b.cost FROM Users u JOIN Bookings b ON u.email = b.email"
+	plan = FireSQL().execute(memory_client, sql + " WHERE u.email = 'user1'", options=options)
+	lookup = next(row for row in plan if row['operator'] == 'join lookup')
+	assert lookup['collection'] == 'Bookings'
+	assert lookup['estimatedReads'] == 1
+
+	plan = FireSQL().execute(memory_client, sql, options=options)
+	lookup = next(row for row in plan if row['operator'] == 'join lookup')
+	assert lookup['estimatedReads'] == 10
+
+
+JOIN_SQL = """SELECT u.email, b.cost FROM Users u JOIN Bookings b ON u.email = b.email
+              WHERE u.state = 'ACTIVE' AND b.state LIKE '%OUT'"""
+
+
+def test_explain_join(memory_client):
+	"""
+	GIVEN a join with a Firestore query and a client-side LIKE filter
+	WHEN it is explained
+	THEN check the plan lists its operators and field masks, without reading any document
+	"""
+	plan = FireSQL().execute(memory_client, "EXPLAIN " + JOIN_SQL)
+	assert [row['operator'] for row in plan] == ['query', 'join lookup', 'filter', 'hash join', 'total']
+	assert plan[0]['detail'] == "state = 'ACTIVE'; fields email"
+	assert plan[1]['detail'].endswith('fields cost, email, state')
+	assert plan[2]['detail'] == "state LIKE '%OUT'"
+	assert 'build side Users' in plan[3]['detail']
+	assert plan[-1]['estimatedReads'] == plan[0]['estimatedReads'] + plan[1]['estimatedReads']
+	assert (memory_client.reads, memory_client.queries) == (0, [])
+
+
+def test_explain_analyze_join(memory_client):
+	"""
+	GIVEN a join with a Firestore query and a client-side LIKE filter
+	WHEN it is explained with ANALYZE
+	THEN check the actual rows and reads of the operators are those of the executed statement, read with the field masks of the plan
+	"""
+	docs = FireSQL().execute(memory_client, JOIN_SQL)
+	reads = memory_client.reads
+	queries = memory_client.queries
+	memory_client.reads = 0
+	memory_client.queries = []
+
+	plan = FireSQL().execute(memory_client, "EXPLAIN ANALYZE " + JOIN_SQL)
+	rows = {row['operator']: row for row in plan}
+	assert (rows['query']['rows'], rows['join lookup']['rows'], rows['filter']['rows']) == (5, 15, 10)
+	assert rows['hash join']['rows'] == len(docs) == 5
+	assert rows['total']['reads'] == memory_client.reads == reads
+	assert memory_client.queries == queries
+	assert [fields for (_, _, fields) in memory_client.queries] == [['email'], ['cost', 'email', 'state']]
+
+
+class LegacyClient(MemoryClient):
+	"""
+	LegacyClient is a custom client written before the field masks, without the `fields` parameters.
+	"""
+
+	def query_document_by_where_tuples(self, collectionName, queries):
+		return super().query_document_by_where_tuples(collectionName, queries)
+
+	def get_collection_documents(self, collectionName):
+		return super().get_collection_documents(collectionName)
+
+
+class KeywordClient(MemoryClient):
+	"""
+	KeywordClient forwards any keyword argument, the field masks included.
+	"""
+
+	def query_document_by_where_tuples(self, collectionName, queries, **kwargs):
+		return super().query_document_by_where_tuples(collectionName, queries, **kwargs)
+
+
+def test_explain_analyze_field_masks():
+	"""
+	GIVEN a client without field masks and a client taking them as keyword arguments
+	WHEN a statement is explained with ANALYZE
+	THEN check the first one reads whole documents and the second one the field mask of the plan
+	"""
+	sql = "EXPLAIN ANALYZE SELECT email FROM Users WHERE state = 'ACTIVE'"
+	legacyClient = LegacyClient(sample_collections())
+	plan = FireSQL().execute(legacyClient, sql)
+	assert plan[0]['rows'] == 5
+	assert legacyClient.queries == [('Users', [['state', '==', 'ACTIVE']], None)]
+
+	keywordClient = KeywordClient(sample_collections())
+	plan = FireSQL().execute(keywordClient, sql)
+	assert plan[0]['detail'] == "state = 'ACTIVE'; fields email"
+	assert keywordClient.queries == [('Users', [['state', '==', 'ACTIVE']], ['email'])]
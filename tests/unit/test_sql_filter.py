@@ -0,0 +1,46 @@
+import random
+
+from firesql.sql.sql_plan import compile_conjunctions, match_query
+
+VALUES = [None, True, False, 0, 1, 1.0, 2, -1.5, '', 'a', 'ab', 'b', 'user1', [1, 'a'], [True], {'x': 1}]
+PATTERNS = ['a%', '%b', '_', '%', 'a_', 'user_', '%a%', 1]
+FIELDS = ['a', 'b', 'n.x', 'docid']
+OPERATORS = ['==', '!=', '<', '<=', '>', '>=', 'in', 'not_in', 'array_contains', 'array_contains_any', 'like', 'not_like']
+
+
+def _random_query(rand: random.Random) -> list:
+	operator = rand.choice(OPERATORS)
+	if operator in ('in', 'not_in', 'array_contains_any'):
+		value = rand.sample(VALUES, rand.randint(1, 4))
+	elif operator in ('like', 'not_like'):
+		value = rand.choice(PATTERNS)
+	else:
+		value = rand.choice(VALUES)
+	return [rand.choice(FIELDS), operator, value]
+
+
+def _random_document(rand: random.Random) -> dict:
+	doc = {}
+	for field in ('a', 'b'):
+		if rand.random() < 0.8:
+			doc[field] = rand.choice(VALUES)
+	if rand.random() < 0.5:
+		doc['n'] = {'x': rand.choice(VALUES)} if rand.random() < 0.8 else rand.choice(VALUES)
+	return doc
+
+
+def test_compiled_filter_matches_reference():
+	"""
+	GIVEN random OR of AND queries over values of mixed types, missing and nested fields
+	WHEN they are evaluated by the compiled single-pass predicate
+	THEN check it matches the same documents as `match_query` evaluated query by query
+	"""
+	rand = random.Random(13)
+	for _ in range(2000):
+		conjunctions = [[_random_query(rand) for _ in range(rand.randint(0, 3))] for _ in range(rand.randint(0, 3))]
+		predicate = compile_conjunctions(conjunctions)
+		for _ in range(20):
+			docId = rand.choice(['a', 'ab', 'user1', 'doc'])
+			doc = _random_document(rand)
+			expected = any(all(match_query(docId, doc, query) for query in conjunction) for conjunction in conjunctions)
+			assert predicate(docId, doc) == expected, (conjunctions, docId, doc)
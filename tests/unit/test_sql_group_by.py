@@ -0,0 +1,25 @@
+from firesql.sql import FireSQL
+
+
+def test_group_by_dotted_field(memory_client):
+	"""
+	GIVEN Users with an `addr.city` sub-field
+	WHEN GROUP BY the unquoted dotted field
+	THEN check the users are counted by city, the same as the quoted field
+	"""
+	docs = FireSQL().execute(memory_client, "SELECT addr.city, count(*) FROM Users GROUP BY addr.city")
+	counts = {doc['addr.city']: doc['count(*)'] for doc in docs}
+	assert counts == {'city0': 4, 'city1': 3, 'city2': 3}
+
+	quoted = FireSQL().execute(memory_client, 'SELECT "addr.city", count(*) FROM Users GROUP BY "addr.city"')
+	assert quoted == docs
+
+
+def test_count_distinct_dotted_field(memory_client):
+	"""
+	GIVEN Users with an `addr.city` sub-field
+	WHEN COUNT(DISTINCT) the unquoted dotted field
+	THEN check the number of distinct cities
+	"""
+	docs = FireSQL().execute(memory_client, "SELECT count(distinct addr.city) FROM Users")
+	assert docs == [{'count(distinct addr.city)': 3}]
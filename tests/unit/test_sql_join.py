@@ -0,0 +1,141 @@
+from conftest import MemoryClient, sample_collections
+from firesql.sql import FireSQL, sql_fire_query
+
+
+def test_star_join_selects_all_fields(memory_client):
+	"""
+	GIVEN Users and Bookings joined on their email
+	WHEN SELECT * of the join
+	THEN check the rows have the fields of both collections
+	"""
+	docs = FireSQL().execute(memory_client, "SELECT * FROM Users u JOIN Bookings b ON u.email = b.email")
+	assert len(docs) == 30
+	for doc in docs:
+		assert {'age', 'addr', 'cost', 'day'} <= set(doc)
+
+
+def test_join_aggregations(memory_client):
+	"""
+	GIVEN Users and Bookings joined on their email
+	WHEN aggregations of the joined columns are selected
+	THEN check they are computed on the joined rows and named by their alias or their table
+	"""
+	docs = FireSQL().execute(memory_client, "SELECT sum(b.cost) AS total FROM Users u JOIN Bookings b ON u.email = b.email")
+	assert docs == [{'total': 652.5}]
+
+	docs = FireSQL().execute(memory_client, "SELECT count(u.email), count(b.email) FROM Users u JOIN Bookings b ON u.email = b.email")
+	assert docs == [{'count(u.email)': 30, 'count(b.email)': 30}]
+
+	docs = FireSQL().execute(memory_client, """
+		SELECT u.state, sum(b.cost) AS total FROM Users u JOIN Bookings b ON u.email = b.email
+		GROUP BY u.state ORDER BY total DESC""")
+	assert docs == [{'state': 'INACTIVE', 'total': 337.5}, {'state': 'ACTIVE', 'total': 315.0}]
+
+
+def _sorted_rows(docs):
+	return sorted(docs, key=lambda doc: sorted((key, repr(value)) for key, value in doc.items()))
+
+
+def test_spill_join_matches_in_memory_join(memory_client, monkeypatch):
+	"""
+	GIVEN Users, Bookings and Payments joined with a join memory budget too small for their documents
+	WHEN the join is executed
+	THEN check the documents are spilled to disk and the joined rows are the same as the in-memory join
+	"""
+	memory_client.collections['Payments'] = {
+		'payment{}'.format(i): {'bookingId': 'booking{}'.format(i % 40), 'amount': i} for i in range(60)
+	}
+	buffers = []
+	initBuffer = sql_fire_query.SpillBuffer.__init__
+	def _init_buffer(self, *args, **kwargs):
+		initBuffer(self, *args, **kwargs)
+		buffers.append(self)
+	monkeypatch.setattr(sql_fire_query.SpillBuffer, '__init__', _init_buffer)
+
+	for sql in ["SELECT u.email, b.cost, b.state FROM Users u JOIN Bookings b ON u.email = b.email",
+	            "SELECT u.email, b.docid, p.amount FROM Users u JOIN Bookings b ON u.email = b.email JOIN Payments p ON p.bookingId = b.docid"]:
+		inMemory = FireSQL().execute(memory_client, sql)
+		buffers.clear()
+		spilled = FireSQL().execute(memory_client, sql, options={'joinMemoryBudget': 512})
+		assert any(buffer.spilled for buffer in buffers)
+		assert len(inMemory) > 0
+		assert _sorted_rows(spilled) == _sorted_rows(inMemory)
+
+
+def _payments_client():
+	collections = sample_collections()
+	collections['Payments'] = {
+		'payment{}'.format(i): {'bookingId': 'booking{}'.format(i % 40), 'amount': i} for i in range(60)
+	}
+	return MemoryClient(collections)
+
+
+THREE_WAY_SQL = "SELECT u.email, b.docid, p.amount FROM Users u JOIN Bookings b ON u.email = b.email JOIN Payments p ON p.bookingId = b.docid"
+
+
+def _nested_loop_join(collections, amount=None):
+	# the rows of THREE_WAY_SQL joined one document at a time
+	rows = []
+	for user in collections['Users'].values():
+		for bookingId, booking in collections['Bookings'].items():
+			for payment in collections['Payments'].values():
+				if user['email'] == booking['email'] and payment['bookingId'] == bookingId and amount in (None, payment['amount']):
+					rows.append({'email': user['email'], 'docid': bookingId, 'amount': payment['amount']})
+	return rows
+
+
+def test_multi_way_join_order():
+	"""
+	GIVEN Users, Bookings and Payments joined in a chain
+	WHEN the collection sizes or a filter change the estimated number of documents of each collection
+	THEN check the collection with the fewest documents is read first, and the rows do not depend on the join order
+	"""
+	client = _payments_client()
+	sizes = {'Users': 10, 'Bookings': 30, 'Payments': 60}
+	plan = FireSQL().execute(client, "EXPLAIN " + THREE_WAY_SQL, options={'collectionSizes': sizes})
+	assert [row['collection'] for row in plan[:3]] == ['Users', 'Bookings', 'Payments']
+	# with many Users, they are looked up last by the Bookings emails
+	plan = FireSQL().execute(client, "EXPLAIN " + THREE_WAY_SQL, options={'collectionSizes': dict(sizes, Users=100000)})
+	assert [row['collection'] for row in plan[:3]] == ['Bookings', 'Payments', 'Users']
+	# a filtered collection is read first
+	plan = FireSQL().execute(client, "EXPLAIN " + THREE_WAY_SQL + " WHERE p.amount = 5", options={'collectionSizes': sizes})
+	assert [(row['operator'], row['collection']) for row in plan[:3]] == [('query', 'Payments'), ('join lookup', 'Bookings'), ('join lookup', 'Users')]
+
+	expected = _sorted_rows(_nested_loop_join(client.collections))
+	assert len(expected) == 50
+	for options in [{'collectionSizes': sizes}, {'collectionSizes': dict(sizes, Users=100000)}]:
+		assert _sorted_rows(FireSQL().execute(client, THREE_WAY_SQL, options=options)) == expected
+
+	client.queries = []
+	docs = FireSQL().execute(client, THREE_WAY_SQL + " WHERE p.amount = 5", options={'collectionSizes': sizes})
+	assert docs == _nested_loop_join(client.collections, amount=5) == [{'email': 'user5@example.com', 'docid': 'booking5', 'amount': 5}]
+	# only the joined documents are looked up
+	assert client.batchedGets == [('Bookings', ['booking5'], ['email'])]
+	assert [queries for (_, queries, _) in client.queries] == [[['amount', '==', 5]], [['email', '==', 'user5@example.com']]]
+
+
+class LegacyClient(MemoryClient):
+	"""
+	LegacyClient is a custom client written before the field masks, without the `fields` parameters.
+	"""
+
+	def query_document_by_where_tuples(self, collectionName, queries):
+		return super().query_document_by_where_tuples(collectionName, queries)
+
+	def get_collection_documents(self, collectionName):
+		return super().get_collection_documents(collectionName)
+
+
+def test_client_without_field_masks():
+	"""
+	GIVEN a custom client without the `fields` parameter of the field masks
+	WHEN a filtered statement, a whole collection statement and a join are executed
+	THEN check the whole documents are read and projected, without error
+	"""
+	client = LegacyClient(sample_collections())
+	docs = FireSQL().execute(client, "SELECT email FROM Users WHERE state = 'ACTIVE'")
+	assert sorted(doc['email'] for doc in docs) == ['user{}@example.com'.format(i) for i in range(0, 10, 2)]
+	assert all(fields is None for (_, _, fields) in client.queries)
+	assert len(FireSQL().execute(client, "SELECT docid FROM Bookings ORDER BY cost DESC LIMIT 3")) == 3
+	docs = FireSQL().execute(client, "SELECT u.age, b.cost FROM Users u JOIN Bookings b ON u.email = b.email WHERE b.day = 1")
+	assert len(docs) == 8
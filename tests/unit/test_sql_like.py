@@ -0,0 +1,31 @@
+from firesql.sql import FireSQL
+
+
+def test_like_prefix_pushdown(memory_client):
+	"""
+	GIVEN a LIKE pattern with a literal prefix
+	WHEN the statement is executed
+	THEN check the prefix is queried as a range and only the documents of the prefix are read
+	"""
+	memory_client.set_collection_document('Users', 'user10', {'email': 'user10@example.com', 'age': 30})
+	docs = FireSQL().execute(memory_client, "SELECT email FROM Users WHERE email LIKE 'user1_@%'")
+	assert docs == [{'email': 'user10@example.com'}]
+	assert memory_client.queries == [('Users', [['email', '>=', 'user1'], ['email', '<', 'user2']], ['email'])]
+	assert memory_client.reads == 2
+
+
+def test_like_without_pushdown(memory_client):
+	"""
+	GIVEN LIKE patterns without a literal prefix, NOT LIKE, or the `likePushdown` option off
+	WHEN the statements are executed
+	THEN check the patterns are matched on the client with the same results
+	"""
+	docs = FireSQL().execute(memory_client, "SELECT email FROM Users WHERE email LIKE 'user1%'", options={'likePushdown': False})
+	assert docs == [{'email': 'user1@example.com'}]
+	assert memory_client.queries == [('Users', [], ['email'])]
+
+	docs = FireSQL().execute(memory_client, "SELECT email FROM Users WHERE email LIKE '%1@%'")
+	assert docs == [{'email': 'user1@example.com'}]
+	docs = FireSQL().execute(memory_client, "SELECT email FROM Users WHERE email NOT LIKE 'user1%'")
+	assert len(docs) == 9
+	assert all(queries == [] for (_, queries, _) in memory_client.queries)
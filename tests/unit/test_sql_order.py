@@ -0,0 +1,60 @@
+import asyncio
+
+from conftest import AsyncMemoryClient, MemoryClient, sample_collections
+from firesql.sql import FireSQL, AsyncFireSQL
+
+
+class FailedPrecondition(Exception):
+	# the name of the Firestore error of a query without its composite index
+	pass
+
+
+class IndexClient(MemoryClient):
+	"""
+	IndexClient has the single-field indexes only: an ordered query filtering on other fields fails.
+	"""
+
+	def __init__(self, collections):
+		super().__init__(collections)
+		self.rejected = 0
+
+	def stream_document_by_where_tuples(self, collectionName, queries, fields=None, orderBy=None, limit=None):
+		orderFields = [field for (field, _) in (orderBy or [])]
+		if orderFields and any(field not in orderFields for (field, _, _) in queries):
+			self.rejected += 1
+			raise FailedPrecondition("The query requires an index")
+		yield from super().stream_document_by_where_tuples(collectionName, queries, fields=fields, orderBy=orderBy, limit=limit)
+
+
+def test_order_pushdown_without_index():
+	"""
+	GIVEN an ORDER BY with an equality filter on another field, without the composite index
+	WHEN the statement is executed
+	THEN check the ordered query is rejected, and the documents are ordered and limited on the client
+	"""
+	client = IndexClient(sample_collections())
+	sql = "SELECT email, age FROM Users WHERE state = 'ACTIVE' ORDER BY age DESC"
+	docs = FireSQL().execute(client, sql + " LIMIT 2")
+	assert docs == [{'email': 'user8@example.com', 'age': 28}, {'email': 'user6@example.com', 'age': 26}]
+	assert client.rejected == 1
+	docs = list(FireSQL().execute_iter(client, sql))
+	assert [doc['age'] for doc in docs] == [28, 26, 24, 22, 20]
+	assert client.rejected == 2
+
+	# the pushdown of a single-field order is kept
+	docs = FireSQL().execute(client, "SELECT email FROM Users WHERE age > 25 ORDER BY age LIMIT 1")
+	assert docs == [{'email': 'user6@example.com'}]
+	assert client.rejected == 2
+
+
+def test_async_order_pushdown_without_index():
+	"""
+	GIVEN an async client without the composite index of an ordered query
+	WHEN the statement is executed
+	THEN check the documents are ordered and limited on the client
+	"""
+	client = IndexClient(sample_collections())
+	sql = "SELECT email, age FROM Users WHERE state = 'INACTIVE' ORDER BY age LIMIT 2"
+	docs = asyncio.run(AsyncFireSQL().execute(AsyncMemoryClient(client), sql))
+	assert docs == [{'email': 'user1@example.com', 'age': 21}, {'email': 'user3@example.com', 'age': 23}]
+	assert client.rejected == 1
@@ -0,0 +1,16 @@
+from firesql.sql import FireSQL
+from firesql.sql.fire_sql import get_parser
+
+
+def test_parser_shared_by_instances(memory_client):
+	"""
+	GIVEN two FireSQL instances
+	WHEN they are constructed and both execute a statement
+	THEN check they share the process-wide parser, built once
+	"""
+	first = FireSQL()
+	second = FireSQL()
+	assert first.parser is second.parser
+	assert first.parser is get_parser()
+	assert first.execute(memory_client, "SELECT email FROM Users WHERE docid = 'user1'") == \
+	       second.execute(memory_client, "SELECT email FROM Users WHERE docid = 'user1'")
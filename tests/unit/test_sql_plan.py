@@ -0,0 +1,97 @@
+import pytest
+
+from firesql.sql import FireSQL
+from firesql.sql.sql_plan import FireSQLPlanner, FIRESTORE_IN_LIMIT, MAX_DISJUNCTIONS
+
+
+def test_constant_folding(memory_client):
+	"""
+	GIVEN comparisons between literals in the WHERE clause
+	WHEN the statement is planned
+	THEN check the true comparisons are dropped and the false ones drop their OR branch
+	"""
+	for sql in ["SELECT * FROM Users WHERE 1 = 1 AND age > 25", "SELECT * FROM Users WHERE 1 = 2 OR age > 25"]:
+		memory_client.queries = []
+		docs = FireSQL().execute(memory_client, sql)
+		assert len(docs) == 4
+		assert memory_client.queries == [('Users', [['age', '>', 25]], None)]
+
+
+def test_contradiction_reads_nothing(memory_client):
+	"""
+	GIVEN a WHERE clause that cannot match
+	WHEN the statement is executed
+	THEN check no query is sent and no document is read
+	"""
+	for sql in ["SELECT * FROM Users WHERE age = 21 AND age = 22",
+	            "SELECT * FROM Users WHERE age > 25 AND age < 21",
+	            "SELECT * FROM Users WHERE 1 = 2"]:
+		docs = FireSQL().execute(memory_client, sql)
+		assert docs == []
+	assert memory_client.queries == []
+	assert memory_client.reads == 0
+
+
+def test_range_normalization(memory_client):
+	"""
+	GIVEN several bounds on the same field
+	WHEN the statement is planned
+	THEN check only the tightest bounds are queried
+	"""
+	docs = FireSQL().execute(memory_client, "SELECT * FROM Users WHERE age > 21 AND age > 25 AND age < 28")
+	assert sorted(doc['age'] for doc in docs) == [26, 27]
+	assert memory_client.queries == [('Users', [['age', '>', 25], ['age', '<', 28]], None)]
+
+
+def test_or_equals_merged_into_in(memory_client):
+	"""
+	GIVEN equalities of a field joined by OR
+	WHEN the statement is planned
+	THEN check a single IN query is sent
+	"""
+	docs = FireSQL().execute(memory_client, "SELECT * FROM Users WHERE age = 21 OR age = 22 OR age = 23")
+	assert sorted(doc['age'] for doc in docs) == [21, 22, 23]
+	assert memory_client.queries == [('Users', [['age', 'in', [21, 22, 23]]], None)]
+	assert memory_client.reads == 3
+
+
+def test_in_limit(memory_client):
+	"""
+	GIVEN more equalities of a field joined by OR than values allowed in a Firestore IN
+	WHEN the statement is planned
+	THEN check the IN queries have at most FIRESTORE_IN_LIMIT values
+	"""
+	sql = "SELECT * FROM Users WHERE " + " OR ".join("age = {}".format(age) for age in range(FIRESTORE_IN_LIMIT + 1))
+	docs = FireSQL().execute(memory_client, sql)
+	assert len(docs) == 10
+	assert len(memory_client.queries) == 2
+	for (_, conjunction, _) in memory_client.queries:
+		for (_, operator, value) in conjunction:
+			if operator == 'in':
+				assert len(value) <= FIRESTORE_IN_LIMIT
+
+
+def test_disjunction_cap():
+	"""
+	GIVEN a WHERE clause expanding into more OR queries than MAX_DISJUNCTIONS
+	WHEN the statement is prepared
+	THEN check it is rejected before any query
+	"""
+	sql = "SELECT * FROM Users WHERE " + " AND ".join("(age = {0} OR state = 's{0}')".format(i) for i in range(7))
+	assert 2 ** 7 > MAX_DISJUNCTIONS
+	with pytest.raises(Exception, match="more than {} OR queries".format(MAX_DISJUNCTIONS)):
+		FireSQL().prepare(sql)
+
+
+def test_optimize_queries():
+	"""
+	GIVEN the queries of two parts, one of them a contradiction
+	WHEN the queries are optimized
+	THEN check no part is read
+	"""
+	queries = {
+		'Users': [[['age', '==', 21]], [['age', '==', 22]]],
+		'Bookings': [[['day', '>', 3], ['day', '<', 1]]],
+	}
+	assert FireSQLPlanner.optimize_queries(queries) == {'Users': [], 'Bookings': []}
+	assert FireSQLPlanner.optimize_queries({'Users': queries['Users']}) == {'Users': [[['age', 'in', [21, 22]]]]}
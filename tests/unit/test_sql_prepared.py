@@ -0,0 +1,57 @@
+import pytest
+
+from firesql.sql import FireSQL
+from firesql.sql.sql_prepared import FireSQLPlanCache
+
+
+def test_plan_cache_hits(memory_client):
+	"""
+	GIVEN a FireSQL with its own plan cache
+	WHEN the same statement is executed again, written on several lines or with comments
+	THEN check it is parsed and compiled once, and the cached plan is hit
+	"""
+	fireSQL = FireSQL(planCache=FireSQLPlanCache())
+	first = fireSQL.execute(memory_client, "SELECT email FROM Users WHERE state = 'ACTIVE'")
+	second = fireSQL.execute(memory_client, "SELECT email\n  FROM Users\n  WHERE state = 'ACTIVE';")
+	assert first == second
+	assert len(first) == 5
+	info = fireSQL.plan_cache_info()
+	assert (info['hits'], info['misses'], info['size']) == (1, 1, 1)
+	third = fireSQL.execute(memory_client, "SELECT email -- the active users\nFROM Users WHERE state = 'ACTIVE' -- only")
+	assert third == first
+	assert fireSQL.plan_cache_info()['hits'] == 2
+
+	fireSQL.execute(memory_client, "SELECT email FROM Users WHERE state = 'INACTIVE'")
+	assert fireSQL.plan_cache_info()['misses'] == 2
+
+
+def test_bind_parameters(memory_client):
+	"""
+	GIVEN a statement with positional and named bind parameters
+	WHEN it is executed with different values
+	THEN check the values are bound into the Firestore queries and the plan is reused
+	"""
+	fireSQL = FireSQL(planCache=FireSQLPlanCache())
+	docs = fireSQL.execute(memory_client, "SELECT email FROM Users WHERE state = ? AND age > ?", parameters=['ACTIVE', 24])
+	assert sorted(doc['email'] for doc in docs) == ['user6@example.com', 'user8@example.com']
+	docs = fireSQL.execute(memory_client, "SELECT email FROM Users WHERE state = ? AND age > ?", parameters=['INACTIVE', 26])
+	assert sorted(doc['email'] for doc in docs) == ['user7@example.com', 'user9@example.com']
+	assert fireSQL.plan_cache_info()['hits'] == 1
+
+	statement = fireSQL.prepare("SELECT email FROM Users WHERE age = :age")
+	assert fireSQL.execute_prepared(memory_client, statement, parameters={'age': 23}) == [{'email': 'user3@example.com'}]
+	assert memory_client.queries[-1] == ('Users', [['age', '==', 23]], ['email'])
+	with pytest.raises(Exception, match="missing value for bind parameter ':age'"):
+		fireSQL.execute_prepared(memory_client, statement, parameters={})
+
+
+def test_bound_contradiction_reads_nothing(memory_client):
+	"""
+	GIVEN a statement whose bind parameters make its WHERE clause a contradiction
+	WHEN it is executed
+	THEN check no document is read
+	"""
+	fireSQL = FireSQL(planCache=FireSQLPlanCache())
+	docs = fireSQL.execute(memory_client, "SELECT * FROM Users WHERE age = ? AND age = ?", parameters=[21, 22])
+	assert docs == []
+	assert memory_client.reads == 0
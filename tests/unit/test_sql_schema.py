@@ -0,0 +1,77 @@
+import json
+import time
+
+from conftest import MemoryClient
+from firesql.sql import FireSQL
+from firesql.sql.sql_schema import FireSQLSchema, FireSQLSchemaCatalog
+
+
+def test_schema_inference():
+	"""
+	GIVEN documents of different shapes
+	WHEN a schema is inferred from them
+	THEN check the fields are in order of appearance, with their types, and nullable if null or missing in some document
+	"""
+	schema = FireSQLSchema()
+	assert schema.observe({'name': 'a', 'age': 1})
+	assert not schema.observe({'name': 'b', 'age': 2})
+	assert schema.observe({'name': 'c', 'age': 2.5, 'tags': ['x']})
+	assert schema.observe({'name': None, 'tags': []})
+	assert schema.field_names() == ['name', 'age', 'tags']
+	assert schema.fields == {
+		'name': {'types': ['string', 'null'], 'nullable': True},
+		'age': {'types': ['integer', 'float'], 'nullable': True},
+		'tags': {'types': ['array'], 'nullable': True},
+	}
+	assert schema.documents == 4
+
+
+def test_schema_catalog_persistence(tmp_path):
+	"""
+	GIVEN a schema catalog file
+	WHEN the documents of a collection are observed, and the catalog is loaded again
+	THEN check the schema is read back from the file, unless the file is unreadable or the schema expired
+	"""
+	path = str(tmp_path / 'schemas.json')
+	catalog = FireSQLSchemaCatalog(path)
+	items = [('a', {'x': 1}), ('b', {'x': None, 'y': 'z'})]
+	assert list(catalog.observe('Items', iter(items))) == items
+	assert catalog.fields('Items') == ['x', 'y']
+
+	loaded = FireSQLSchemaCatalog(path)
+	assert loaded.fields('Items') == ['x', 'y']
+	assert loaded.schema('Items').to_dict() == catalog.schema('Items').to_dict()
+	assert loaded.fields('Other') is None
+
+	# an expired schema is inferred again from the next documents
+	expired = FireSQLSchemaCatalog(path, ttl=60)
+	expired.schemas['Items'].inferred = time.time() - 120
+	assert expired.fields('Items') is None
+	list(expired.observe('Items', iter([('c', {'w': True})])))
+	assert expired.fields('Items') == ['w']
+	assert FireSQLSchemaCatalog(path).fields('Items') == ['w']
+
+	with open(path, 'w') as catalogFile:
+		json.dump({'version': 0, 'collections': {}}, catalogFile)
+	assert FireSQLSchemaCatalog(path).schemas == {}
+	with open(path, 'w') as catalogFile:
+		catalogFile.write('{not json')
+	assert FireSQLSchemaCatalog(path).schemas == {}
+
+
+def test_select_star_with_schema_catalog(tmp_path):
+	"""
+	GIVEN a collection whose first document does not have all the fields
+	WHEN SELECT * is streamed with a schema catalog, after a first execution inferred the schema
+	THEN check the rows have all the fields of the collection, not only those of the first document
+	"""
+	client = MemoryClient({'Items': {'a': {'x': 1}, 'b': {'x': None, 'y': 'z'}}})
+	options = {'schemaCatalog': str(tmp_path / 'schemas.json')}
+	assert list(FireSQL().execute_iter(client, "SELECT * FROM Items")) == [{'x': 1}, {'x': None}]
+	list(FireSQL().execute_iter(client, "SELECT * FROM Items", options=options))
+	docs = list(FireSQL().execute_iter(client, "SELECT * FROM Items", options=options))
+	assert docs == [{'x': 1, 'y': ''}, {'x': None, 'y': 'z'}]
+	# the fields selected by name are still read with a field mask
+	client.queries = []
+	FireSQL().execute(client, "SELECT x FROM Items", options=options)
+	assert client.queries == [('Items', [], ['x'])]
@@ -0,0 +1,151 @@
+import threading
+
+from conftest import MemoryClient, sample_collections
+from firesql.sql import FireSQL
+from firesql.sql.sql_objects import SQL_Parameter
+from firesql.sql.sql_script import split_statements, statement_dependencies
+
+
+class EventClient(MemoryClient):
+	"""
+	EventClient logs the collections read and written, the Bookings are read once a User is written.
+	"""
+
+	def __init__(self, collections):
+		super().__init__(collections)
+		self.userWritten = threading.Event()
+		self.log = []
+
+	def query_document_by_where_tuples(self, collectionName, queries, fields=None):
+		self._read(collectionName)
+		return super().query_document_by_where_tuples(collectionName, queries, fields=fields)
+
+	def get_collection_documents(self, collectionName, fields=None):
+		self._read(collectionName)
+		return super().get_collection_documents(collectionName, fields=fields)
+
+	def _read(self, collectionName):
+		if collectionName == 'Bookings':
+			self.log.append(('waited', self.userWritten.wait(timeout=5)))
+		self.log.append(('read', collectionName))
+
+	def set_collection_document(self, collectionName, docId, document):
+		super().set_collection_document(collectionName, docId, document)
+		self.log.append(('write', collectionName))
+		if collectionName == 'Users':
+			self.userWritten.set()
+
+	def update_collection_document(self, collectionName, docId, document):
+		super().update_collection_document(collectionName, docId, document)
+		self.log.append(('write', collectionName))
+
+
+def test_concurrent_statements_order():
+	"""
+	GIVEN a script reading Bookings, writing Users, writing Bookings and reading Users
+	WHEN it is executed with concurrent statements
+	THEN check the independent statements overlap, and the dependent ones run in script order
+	"""
+	client = EventClient(sample_collections())
+	fireSQL = FireSQL()
+	docs = fireSQL.execute(client, """
+		SELECT count(*) FROM Bookings;
+		INSERT INTO Users (email, age) VALUES ('new@example.com', 40);
+		UPDATE Bookings SET day = 9 WHERE cost > 40;
+		SELECT email FROM Users WHERE age = 40;
+	""", options={'concurrentStatements': 4})
+
+	# the Bookings count waited for the User insert of the next statement
+	assert ('waited', True) in client.log
+	assert len(fireSQL.execution_results()) == 4
+	# the Users read after their write, the Bookings write after their read
+	assert client.log.index(('write', 'Users')) < client.log.index(('read', 'Users'))
+	assert client.log.index(('read', 'Bookings')) < client.log.index(('write', 'Bookings'))
+	assert sorted(doc['day'] for doc in client.collections['Bookings'].values() if doc['cost'] > 40) == [9, 9, 9]
+	assert docs == [{'email': 'new@example.com'}]
+
+
+def test_split_statements():
+	"""
+	GIVEN a script with `;` in string literals, quoted names and comments, read in chunks of any size
+	WHEN it is split into statements
+	THEN check it is only split on the `;` between the statements, and the comments are left out
+	"""
+	script = """SELECT email FROM Users WHERE state = 'A;B'; -- skipped; not a statement
+		SELECT "semi;colon" FROM Users -- the end of the statement;
+		;
+		-- a comment only;
+		SELECT age - 1 FROM Users; SELECT email FROM Users WHERE state = '--;'"""
+	expected = ["SELECT email FROM Users WHERE state = 'A;B'",
+	            'SELECT "semi;colon" FROM Users',
+	            'SELECT age - 1 FROM Users',
+	            "SELECT email FROM Users WHERE state = '--;'"]
+	assert list(split_statements(script)) == expected
+	for size in range(1, 8):
+		chunks = [script[pos:pos + size] for pos in range(0, len(script), size)]
+		assert list(split_statements(chunks)) == expected
+
+
+def _parameters(node):
+	# the bind parameters of a parsed statement, in their order in the statement
+	if isinstance(node, SQL_Parameter):
+		return [node]
+	if isinstance(node, (list, tuple)):
+		return [parameter for child in node for parameter in _parameters(child)]
+	if hasattr(node, '__dataclass_fields__'):
+		return [parameter for field in node.__dataclass_fields__ for parameter in _parameters(getattr(node, field))]
+	return []
+
+
+def test_parse_script_parameters():
+	"""
+	GIVEN a script of statements with positional parameters
+	WHEN it is parsed
+	THEN check the parameters are numbered from 0 in each statement
+	"""
+	statements = list(FireSQL().parse_script("""
+		SELECT email FROM Users WHERE age > ?;
+		SELECT email FROM Users WHERE age > ? AND state = ?;
+		UPDATE Users SET state = ? WHERE docid = ?
+	"""))
+	assert [[parameter.index for parameter in _parameters(statement)] for statement in statements] == [[0], [0, 1], [0, 1]]
+
+
+def test_execute_script_streams_statements(memory_client):
+	"""
+	GIVEN a script read in chunks, its second statement only available once the first one has executed
+	WHEN it is executed
+	THEN check the first statement executes while the rest of the script is still being parsed
+	"""
+	firstRead = threading.Event()
+	query = memory_client.query_document_by_where_tuples
+	def _query(collectionName, queries, fields=None):
+		firstRead.set()
+		return query(collectionName, queries, fields=fields)
+	memory_client.query_document_by_where_tuples = _query
+
+	def _script():
+		yield "SELECT email FROM Users WHERE age = 21;"
+		assert firstRead.wait(timeout=5)
+		yield "SELECT email FROM Users WHERE age = 22"
+
+	results = FireSQL().execute_script(memory_client, _script())
+	assert next(results) == [{'email': 'user1@example.com'}]
+	assert list(results) == [[{'email': 'user2@example.com'}]]
+
+
+def test_statement_dependencies():
+	"""
+	GIVEN the collections read and written by the statements of a script
+	WHEN their dependencies are computed
+	THEN check each statement waits for the last writer of its collections, and a write for the reads before it
+	"""
+	accesses = [
+		({'Bookings'}, set()),
+		(set(), {'Users'}),
+		({'Users'}, {'Bookings'}),
+		({'Users'}, set()),
+		(set(), {'Users'}),
+		({'Payments'}, set()),
+	]
+	assert statement_dependencies(accesses) == [[], [], [0, 1], [1], [1, 2, 3], []]
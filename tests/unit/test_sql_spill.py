@@ -0,0 +1,97 @@
+import random
+
+from firesql.sql import sql_join
+from firesql.sql.sql_join import FireSQLJoin, JoinPart, JoinStep, SpillBuffer
+
+
+def _records(count, keys=10):
+	return [('doc{}'.format(i), {'key': i % keys, 'payload': 'x' * 20}) for i in range(count)]
+
+
+def test_spill_buffer_in_memory():
+	"""
+	GIVEN a spill buffer with a large memory budget
+	WHEN records are appended
+	THEN check they are kept in memory and iterated in order
+	"""
+	records = _records(100)
+	buffer = SpillBuffer(10 ** 9)
+	buffer.extend(records)
+	assert not buffer.spilled
+	assert len(buffer) == 100
+	assert list(buffer.items()) == records
+
+
+def test_spill_buffer_spilled():
+	"""
+	GIVEN a spill buffer with a small memory budget
+	WHEN records are appended past the budget, also while they are iterated
+	THEN check they are written to a temp file, and iterated in order from it as many times as needed
+	"""
+	records = _records(1000)
+	buffer = SpillBuffer(2048, chunk=16)
+	buffer.extend(records[:500])
+	assert buffer.spilled
+	assert buffer.records == []
+	assert buffer.bytes > 2048
+	# an iteration keeps its own offset while the records are iterated again
+	iterator = iter(buffer)
+	first = next(iterator)
+	assert list(buffer) == records[:500]
+	assert [first] + list(iterator) == records[:500]
+	buffer.extend(records[500:])
+	assert len(buffer) == 1000
+	assert list(buffer) == records
+	assert list(buffer) == records
+	buffer.close()
+	assert buffer.file is None
+
+
+def _expected_matches(probeItems, buildItems):
+	return sorted((probe, build) for probe in probeItems for build in buildItems if probe[1]['key'] == build[1]['key'])
+
+
+def _step(buildItems, budget):
+	docs = SpillBuffer(budget)
+	docs.extend(buildItems)
+	return JoinStep(part=JoinPart(docs=docs, joinField='key', selectFields=[], nameMap={}), probeIndex=0, probeField='key')
+
+
+def test_partitioned_join():
+	"""
+	GIVEN build documents over the memory budget, and probe documents with their keys
+	WHEN they are joined by a partitioned hash join
+	THEN check the matches are those of a nested loop join
+	"""
+	random.seed(0)
+	buildItems = [('b{}'.format(i), {'key': random.randrange(50), 'payload': 'x' * 20}) for i in range(2000)]
+	probeItems = [('p{}'.format(i), {'key': random.randrange(60)}) for i in range(300)]
+	step = _step(buildItems, 4096)
+	assert step.part.docs.spilled
+	matches = FireSQLJoin().partitioned_join(((item,) for item in probeItems), step, 4096)
+	assert sorted(matches) == _expected_matches(probeItems, buildItems)
+	# through the pipeline
+	matches = FireSQLJoin().pipeline(probeItems, [step])
+	assert sorted(matches) == _expected_matches(probeItems, buildItems)
+
+
+def test_partitioned_join_skewed_key(monkeypatch):
+	"""
+	GIVEN build documents that all have the same join key, over the memory budget
+	WHEN they are joined by a partitioned hash join
+	THEN check the partition over the budget is partitioned again up to the maximum depth, then hash joined in memory
+	"""
+	buildItems = _records(1000, keys=1)
+	probeItems = [('p0', {'key': 0}), ('p1', {'key': 1})]
+	join = FireSQLJoin()
+	depths = []
+	partitionedJoin = join.partitioned_join
+	def _partitioned_join(matches, step, budget, depth=0):
+		depths.append(depth)
+		return partitionedJoin(matches, step, budget, depth)
+	monkeypatch.setattr(join, 'partitioned_join', _partitioned_join)
+
+	matches = list(join.partitioned_join(((item,) for item in probeItems), _step(buildItems, 1024), 1024))
+	assert depths == list(range(sql_join.JOIN_SPILL_MAX_DEPTH + 1))
+	assert sorted(matches) == _expected_matches(probeItems, buildItems)
+	assert len(matches) == 1000
@@ -0,0 +1,63 @@
+import pytest
+
+from conftest import MemoryClient, OPERATORS, get_document_field, mask_document, sample_collections
+from firesql.sql import FireSQL
+
+
+class StreamClient(MemoryClient):
+	"""
+	StreamClient streams the matching documents one by one, and counts the documents streamed.
+	"""
+
+	def __init__(self, collections):
+		super().__init__(collections)
+		self.streamed = 0
+
+	def stream_document_by_where_tuples(self, collectionName, queries, fields=None, orderBy=None, limit=None):
+		if orderBy:
+			yield from super().stream_document_by_where_tuples(collectionName, queries, fields=fields, orderBy=orderBy, limit=limit)
+			return
+		count = 0
+		for docId, doc in self.get_collection_ref(collectionName).items():
+			if limit is not None and count >= limit:
+				return
+			if all(OPERATORS[op](docId if field == 'docid' else get_document_field(doc, field), value) for (field, op, value) in queries):
+				self.streamed += 1
+				count += 1
+				yield docId, mask_document(doc, fields)
+
+
+@pytest.mark.parametrize('sql', [
+	"SELECT email, age FROM Users WHERE state = 'ACTIVE'",
+	"SELECT email FROM Users WHERE state = 'ACTIVE' OR age > 26",
+	"SELECT email, age FROM Users WHERE age > 21 ORDER BY age DESC LIMIT 3",
+	"SELECT DISTINCT state, day FROM Bookings",
+	"SELECT u.email, b.cost FROM Users u JOIN Bookings b ON u.email = b.email WHERE b.state = 'CANCELLED' ORDER BY b.cost",
+	"SELECT state, count(*) FROM Bookings GROUP BY state",
+	"SELECT email FROM Users WHERE email LIKE 'user%' LIMIT 2 OFFSET 1",
+])
+def test_execute_iter_matches_execute(sql):
+	"""
+	GIVEN streaming and blocking statements
+	WHEN they are executed by execute_iter
+	THEN check the rows are the same as returned by execute
+	"""
+	client = StreamClient(sample_collections())
+	docs = FireSQL().execute(client, sql)
+	assert len(docs) > 0
+	assert list(FireSQL().execute_iter(client, sql)) == docs
+
+
+def test_execute_iter_first_row():
+	"""
+	GIVEN a collection of 1000 documents
+	WHEN a filtered SELECT is executed by execute_iter
+	THEN check the first row comes before the collection is read, and the rows stop being read with the consumer
+	"""
+	client = StreamClient({'Users': {'user{}'.format(i): {'email': 'user{}'.format(i), 'state': 'ACTIVE'} for i in range(1000)}})
+	rows = FireSQL().execute_iter(client, "SELECT email FROM Users WHERE state = 'ACTIVE'")
+	assert next(rows) == {'email': 'user0'}
+	assert client.streamed == 1
+	assert [row['email'] for _, row in zip(range(9), rows)] == ['user{}'.format(i) for i in range(1, 10)]
+	assert client.streamed == 10
+	assert len(list(rows)) == 990